@@ -0,0 +1,129 @@
+"""Micro-benchmark of per-endpoint response serialization.
+
+Compares the old path (plain dict -> jsonable_encoder -> stdlib json) with the
+current one (response_model -> pydantic-core -> orjson) on synthetic payloads
+shaped like the real responses. The catalog routes (/classes, /topics, /books,
+...) are left out: they answer with bytes serialized once per cache fill, so
+there is no per-request serialization to compare. No database or server is
+needed:
+
+    python bench_serialization.py --rows 100 --repeat 200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from response_models import QuizDetail, ProgressPage, BookmarkPage, ProgressSummary
+
+
+def _uid() -> str:
+    return str(uuid.uuid4())
+
+
+def _at(i: int) -> str:
+    return (datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i)).isoformat()
+
+
+def quiz_payload(rows: int) -> Dict[str, Any]:
+    return {'quiz': {
+        'id': _uid(), 'topic_id': _uid(), 'title': 'Quiz', 'title_hi': 'प्रश्नोत्तरी', 'duration_minutes': 10,
+        'questions': [
+            {'id': _uid(), 'question': f'Question {i}?', 'question_hi': f'प्रश्न {i}?',
+             'options': ['Option A', 'Option B', 'Option C', 'Option D'], 'correct_answer': 'Option A'}
+            for i in range(rows)
+        ]
+    }}
+
+
+def progress_payload(rows: int) -> Dict[str, Any]:
+    return {'progress': [
+        {'id': _uid(), 'user_id': 'u', 'quiz_id': _uid(), 'topic_id': _uid(), 'score': 66.66666666666667,
+         'correct': 2, 'total': 3, 'marks': 2.0, 'submitted_at': _at(i)}
+        for i in range(rows)
+    ], 'next_cursor': 'WyIyMDI1LTAxLTAxIiwiYWJjIl0'}
+
+
+def bookmarks_payload(rows: int) -> Dict[str, Any]:
+    return {'bookmarks': [
+        {'id': _uid(), 'user_id': 'u', 'topic_id': _uid(), 'title': f'Topic {i}', 'created_at': _at(i)}
+        for i in range(rows)
+    ], 'next_cursor': None}
+
+
+def summary_payload(rows: int) -> Dict[str, Any]:
+    return {
+        'summary': {'attempts': rows * 5, 'average_score': 71.5, 'best_score': 100.0, 'topics_attempted': rows},
+        'subjects': [
+            {'subject_id': _uid(), 'attempts': 5, 'best_score': 100.0, 'topics_attempted': 3,
+             'last_attempt': _at(i), 'average_score': 71.5}
+            for i in range(max(1, rows // 10))
+        ]
+    }
+
+
+# (path, response_model, response_model_exclude_unset, payload factory) for the uncached routes in server.py
+ENDPOINTS: List[Tuple[str, Any, bool, Callable[[int], Dict[str, Any]]]] = [
+    ('/quiz/{topic_id}', QuizDetail, True, quiz_payload),
+    ('/student/progress', ProgressPage, True, progress_payload),
+    ('/student/bookmarks', BookmarkPage, True, bookmarks_payload),
+    ('/student/progress/summary', ProgressSummary, False, summary_payload),
+]
+
+
+async def encode_before(payload: Dict[str, Any]) -> bytes:
+    content = await serialize_response(response_content=payload)
+    return JSONResponse(content).body
+
+
+def encoder_after(model, exclude_unset: bool) -> Callable[[Dict[str, Any]], Any]:
+    # the same response field FastAPI builds for response_model=model
+    field = create_response_field(name=f'Response_{model.__name__}', type_=model, mode='serialization')
+
+    async def encode(payload: Dict[str, Any]) -> bytes:
+        content = await serialize_response(field=field, response_content=payload, exclude_unset=exclude_unset)
+        return ORJSONResponse(content).body
+    return encode
+
+
+async def time_per_call(encode, payload: Dict[str, Any], repeat: int) -> float:
+    await encode(payload)  # warm up
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        await encode(payload)
+        samples.append(time.perf_counter() - started_at)
+    return statistics.median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Compare response serialization before/after typed ORJSON responses')
+    parser.add_argument('--rows', type=int, default=100, help='list items per response')
+    parser.add_argument('--repeat', type=int, default=200, help='timed calls per endpoint and path')
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<30}{'bytes':>9}{'before us':>12}{'after us':>12}{'speedup':>9}")
+    for path, model, exclude_unset, make_payload in ENDPOINTS:
+        payload = make_payload(args.rows)
+        after = encoder_after(model, exclude_unset)
+        before_body, after_body = await encode_before(payload), await after(payload)
+        if json.loads(before_body) != json.loads(after_body):
+            print(f"{path:<30} response bodies differ, skipping")
+            continue
+
+        before_s = await time_per_call(encode_before, payload, args.repeat)
+        after_s = await time_per_call(after, payload, args.repeat)
+        print(f"{path:<30}{len(after_body):>9}{before_s * 1e6:>12.1f}{after_s * 1e6:>12.1f}"
+              f"{before_s / after_s:>8.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
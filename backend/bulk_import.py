@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Type, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from starlette.responses import StreamingResponse
+
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+
+# Rows are upserted on these fields, so re-running an import updates in place
+NATURAL_KEYS = {
+    'topics': ('subject_id', 'title'),
+    'books': ('class_id', 'title'),
+}
+
+Row = Tuple[int, Any]
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> str:
+    if requested:
+        if requested not in FORMATS:
+            raise ImportFormatError(f"Unsupported format: {requested}")
+        return requested
+    fmt = CONTENT_TYPES.get((content_type or '').split(';')[0].strip().lower())
+    if not fmt:
+        raise ImportFormatError("Send application/x-ndjson or text/csv, or pass ?format=")
+    return fmt
+
+
+# ===== READING =====
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into decoded lines without buffering the whole body."""
+    pending = b''
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8-sig').rstrip('\r')
+    if pending:
+        yield pending.decode('utf-8-sig').rstrip('\r')
+
+
+async def iter_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[Row]:
+    number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, ImportFormatError(f"Invalid JSON: {e}")
+
+
+async def iter_csv(lines: AsyncIterator[str]) -> AsyncIterator[Row]:
+    header: Optional[List[str]] = None
+    record: List[str] = []
+    number = 0
+    async for line in lines:
+        record.append(line)
+        # a quoted field may span lines (markdown content); wait for the closing quote
+        if sum(part.count('"') for part in record) % 2:
+            continue
+        text, record = '\n'.join(record), []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        number += 1
+        if len(values) != len(header):
+            yield number, ImportFormatError(f"Expected {len(header)} columns, got {len(values)}")
+        else:
+            yield number, dict(zip(header, values))
+    if record:
+        yield number + 1, ImportFormatError("Unterminated quoted field")
+
+
+def list_fields(model: Type[BaseModel]) -> Tuple[str, ...]:
+    fields = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        if get_origin(annotation) is not list:
+            annotation = next((arg for arg in get_args(annotation) if get_origin(arg) is list), None)
+        if annotation is not None:
+            fields.append(name)
+    return tuple(fields)
+
+
+def from_csv(row: Dict[str, str], lists: Iterable[str]) -> Dict[str, Any]:
+    # CSV has no arrays: list cells are a JSON array or '|'-separated values
+    row = dict(row)
+    for name in lists:
+        value = (row.get(name) or '').strip()
+        if value.startswith('['):
+            try:
+                row[name] = json.loads(value)
+                continue
+            except ValueError:
+                pass
+        row[name] = [part.strip() for part in value.split('|') if part.strip()]
+    return row
+
+
+# ===== WRITING =====
+
+def row_errors(error: Exception) -> List[Dict[str, Any]]:
+    if isinstance(error, ValidationError):
+        return [
+            {'field': '.'.join(str(part) for part in err['loc']), 'message': err['msg']}
+            for err in error.errors()
+        ]
+    return [{'field': None, 'message': str(error)}]
+
+
+class BulkImporter:
+    """Validates rows one at a time and upserts them in unordered chunks.
+
+    ``run`` yields NDJSON-friendly events as it goes: one ``error`` per
+    rejected row, a ``progress`` event after each chunk and a final
+    ``done`` summary. Every row written by one import shares the same
+    ``updated_at`` stamp, which callers use to find what changed.
+    """
+
+    def __init__(self, collection, model: Type[BaseModel], natural_key: Tuple[str, ...],
+                 chunk_size: int = 500, max_error_events: int = 1000):
+        self._collection = collection
+        self.model = model
+        self.natural_key = natural_key
+        self.chunk_size = chunk_size
+        self.max_error_events = max_error_events
+        self._lists = list_fields(model)
+        self.stamp = datetime.now(timezone.utc).isoformat()
+        self.stats = {'rows': 0, 'valid': 0, 'inserted': 0, 'updated': 0, 'failed': 0}
+
+    def _error(self, row: int, errors: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        self.stats['failed'] += 1
+        if self.stats['failed'] > self.max_error_events:
+            return None
+        return {'event': 'error', 'row': row, 'errors': errors}
+
+    def _operation(self, doc: Dict[str, Any]) -> UpdateOne:
+        return UpdateOne(
+            {field: doc[field] for field in self.natural_key},
+            {
+                '$set': {**doc, 'updated_at': self.stamp},
+                '$setOnInsert': {'id': str(uuid.uuid4()), 'created_at': self.stamp},
+            },
+            upsert=True
+        )
+
+    async def _write(self, chunk: List[Tuple[int, UpdateOne]]) -> List[Dict[str, Any]]:
+        try:
+            result = await self._collection.bulk_write([op for _, op in chunk], ordered=False)
+            details = result.bulk_api_result
+            errors = []
+        except BulkWriteError as e:
+            details = e.details
+            errors = details.get('writeErrors', [])
+
+        self.stats['inserted'] += details.get('nUpserted', 0)
+        self.stats['updated'] += details.get('nModified', 0)
+
+        events = []
+        for err in errors:
+            event = self._error(chunk[err['index']][0], [{'field': None, 'message': err.get('errmsg')}])
+            if event:
+                events.append(event)
+        return events
+
+    async def run(self, rows: AsyncIterator[Row], csv_rows: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        chunk: List[Tuple[int, UpdateOne]] = []
+        async for number, row in rows:
+            self.stats['rows'] += 1
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                if not isinstance(row, dict):
+                    raise ImportFormatError("Each row must be an object")
+                doc = self.model.model_validate(from_csv(row, self._lists) if csv_rows else row).model_dump()
+            except (ValidationError, ImportFormatError) as e:
+                event = self._error(number, row_errors(e))
+                if event:
+                    yield event
+                continue
+
+            self.stats['valid'] += 1
+            chunk.append((number, self._operation(doc)))
+            if len(chunk) >= self.chunk_size:
+                for event in await self._write(chunk):
+                    yield event
+                chunk = []
+                yield {'event': 'progress', **self.stats}
+
+        if chunk:
+            for event in await self._write(chunk):
+                yield event
+        yield {'event': 'done', 'stamp': self.stamp, **self.stats}
+
+
+def read_rows(fmt: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+    lines = iter_lines(chunks)
+    return iter_csv(lines) if fmt == 'csv' else iter_ndjson(lines)
+
+
+async def imported(collection, stamp: str, batch_size: int = 500) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Batches of the documents written by the import with ``stamp``."""
+    batch = []
+    async for doc in collection.find({'updated_at': stamp}, {'_id': 0}):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ImportProgressResponse(StreamingResponse):
+    """Streams progress events while the request body is still being read.
+
+    StreamingResponse normally listens for a client disconnect on
+    ``receive`` alongside the body, which would swallow the upload chunks
+    the import generator is reading from the same channel.
+    """
+
+    def __init__(self, content, **kwargs):
+        super().__init__(content, media_type='application/x-ndjson', **kwargs)
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+# ===== CLI =====
+
+async def file_chunks(path: Path, size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, size)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description='Bulk import topics or books from NDJSON or CSV')
+    parser.add_argument('kind', choices=sorted(NATURAL_KEYS))
+    parser.add_argument('path', type=Path)
+    parser.add_argument('--format', choices=FORMATS, help='defaults to the file extension')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    # the request models live with the routes
+    from server import TopicCreate, BookCreate
+    from topic_renders import store_renders
+
+    fmt = args.format or ('csv' if args.path.suffix.lower() == '.csv' else 'ndjson')
+    model = {'topics': TopicCreate, 'books': BookCreate}[args.kind]
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    importer = BulkImporter(db[args.kind], model, NATURAL_KEYS[args.kind], chunk_size=args.chunk_size)
+    async for event in importer.run(read_rows(fmt, file_chunks(args.path)), csv_rows=fmt == 'csv'):
+        if event['event'] == 'error':
+            print(f"row {event['row']}: " + '; '.join(
+                f"{err['field']}: {err['message']}" if err['field'] else err['message'] for err in event['errors']
+            ), file=sys.stderr)
+        else:
+            print(f"{event['event']}: {event['rows']} rows, {event['inserted']} inserted, "
+                  f"{event['updated']} updated, {event['failed']} failed")
+
+    if args.kind == 'topics':
+        async for batch in imported(db.topics, importer.stamp):
+            await store_renders(db.topic_renders, batch)
+    # running servers pick the changes up as their catalog caches expire and
+    # reconcile the search index on restart; use the API endpoint to refresh at once
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
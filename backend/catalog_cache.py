@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional, Type
+
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from caching import TTLCache
+
+
+class CachedBody:
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, body: Optional[bytes]):
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"' if body is not None else None
+
+    @classmethod
+    def from_payload(cls, payload: Optional[Any], model: Optional[Type[BaseModel]] = None) -> 'CachedBody':
+        if payload is None:
+            return cls(None)
+        if model is not None:
+            # routes answer with the cached bytes, so the response model is applied here, once per fill
+            payload = model.model_validate(payload).model_dump(mode='json', exclude_unset=True)
+        return cls(orjson.dumps(payload))
+
+    @property
+    def found(self) -> bool:
+        return self.body is not None
+
+
+def _consume(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+
+class CatalogCache:
+    """Read-through cache of serialized catalog responses.
+
+    Concurrent misses for the same key share one loader call, and entries are
+    dropped by key prefix whenever the admin routes write. A load that races
+    with an invalidation is served to its callers but not stored.
+    """
+
+    def __init__(self, maxsize: int = 2048, ttl: Optional[float] = None):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._generation = 0
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Optional[Any]]],
+                          model: Optional[Type[BaseModel]] = None) -> CachedBody:
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume)
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            entry = CachedBody.from_payload(await loader(), model)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        if generation == self._generation:
+            self._entries.set(key, entry)
+        future.set_result(entry)
+        return entry
+
+    def invalidate(self, *prefixes: str):
+        self._generation += 1
+        for key in self._entries.keys():
+            if key.startswith(prefixes):
+                self._entries.pop(key)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'hits': self._entries.hits, 'misses': self._entries.misses}
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return '*' in tags or etag.removeprefix('W/') in tags
+
+
+def etag_response(request: Request, entry: CachedBody) -> Response:
+    headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+    if not_modified(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type='application/json', headers=headers)
@@ -0,0 +1,292 @@
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from pymongo import ReplaceOne
+
+from caching import TTLCache
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('books', 'classes', 'plans')
+
+
+class Grants:
+    """What one user owns, as sets so every access check is a hash lookup."""
+
+    __slots__ = ('books', 'classes', 'plans')
+
+    def __init__(self, books: Iterable[str] = (), classes: Iterable[str] = (), plans: Iterable[str] = ()):
+        self.books = frozenset(books)
+        self.classes = frozenset(classes)
+        self.plans = frozenset(plans)
+
+    @classmethod
+    def from_doc(cls, doc: Optional[Dict[str, Any]]) -> 'Grants':
+        doc = doc or {}
+        return cls(doc.get('books') or (), doc.get('classes') or (), doc.get('plans') or ())
+
+    def allows(self, class_id: Optional[str]) -> bool:
+        # any plan unlocks all premium content; a class or one of its books unlocks that class
+        return bool(self.plans) or class_id in self.classes
+
+    def view(self) -> Dict[str, List[str]]:
+        return {kind: sorted(getattr(self, kind)) for kind in KINDS}
+
+
+NO_GRANTS = Grants()
+
+
+class Gate(NamedTuple):
+    premium: bool
+    class_id: Optional[str]
+
+
+def parse_items(items: Iterable[Any]) -> Dict[str, Set[str]]:
+    """Owned ids by kind from an order's free-form ``items`` list.
+
+    The cart sends books as ``{'id': ...}`` and older orders use
+    ``book_id``; classes and plans are named by ``class_id`` and ``plan_id``.
+    """
+    owned: Dict[str, Set[str]] = {kind: set() for kind in KINDS}
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        if item.get('plan_id'):
+            owned['plans'].add(str(item['plan_id']))
+        elif item.get('class_id') and not (item.get('book_id') or item.get('id')):
+            owned['classes'].add(str(item['class_id']))
+        elif item.get('book_id') or item.get('id'):
+            owned['books'].add(str(item.get('book_id') or item['id']))
+    return owned
+
+
+MAX_ORDER_QUANTITY = 100
+
+
+def order_quantities(items: Iterable[Any]) -> Dict[str, int]:
+    """Book id -> quantity for a cart; ValueError for anything that isn't a book."""
+    quantities: Dict[str, int] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("Only books can be ordered")
+        book_id = item.get('book_id') or item.get('id')
+        quantity = item.get('quantity', 1)
+        if item.get('plan_id') or not isinstance(book_id, str):
+            raise ValueError("Only books can be ordered")
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or not 1 <= quantity <= MAX_ORDER_QUANTITY:
+            raise ValueError(f"Quantity must be between 1 and {MAX_ORDER_QUANTITY}")
+        quantities[book_id] = quantities.get(book_id, 0) + quantity
+    return quantities
+
+
+def order_lines(quantities: Dict[str, int], books: Dict[str, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Order items and total priced from the catalog ``books``, never from what the client sent."""
+    unknown = [book_id for book_id in quantities if book_id not in books]
+    if unknown:
+        raise ValueError(f"Unknown books: {', '.join(unknown)}")
+    lines = [
+        {'id': book_id, 'title': books[book_id].get('title') or books[book_id].get('title_hi'),
+         'price': books[book_id]['price'], 'quantity': quantity}
+        for book_id, quantity in quantities.items()
+    ]
+    return lines, sum(line['price'] * line['quantity'] for line in lines)
+
+
+class Entitlements:
+    """Per-user entitlement index materialized from completed orders.
+
+    Each user has one document in ``collection`` listing the book, class
+    and plan ids they own; buying a book also grants the book's class.
+    Only ids in the catalog are granted: books in ``books``, classes in
+    ``classes`` and plans in ``plans``. Without a collection for a kind,
+    nothing of that kind is granted.
+    ``grant`` adds an order's items when its payment is verified, and
+    ``rebuild`` reconstructs every document from the order history. Grants
+    are cached per user and topic gates per topic; callers drop them with
+    ``invalidate`` and ``forget_topic`` when another worker writes.
+    """
+
+    def __init__(self, collection, orders, books, topics, classes=None, plans=None, cache_size: int = 50000,
+                 ttl: float = 600):
+        self._collection = collection
+        self._orders = orders
+        self._books = books
+        self._topics = topics
+        self._classes = classes
+        self._plans = plans
+        self._grants = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._gates = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._stats = {'grants': 0, 'loads': 0, 'denied': 0, 'rebuilds': 0, 'rebuild_seconds': 0.0}
+
+    @staticmethod
+    async def _existing(collection, ids: Iterable[str]) -> Set[str]:
+        ids = sorted(ids)
+        if collection is None or not ids:
+            return set()
+        return {doc['id'] async for doc in collection.find({'id': {'$in': ids}}, {'_id': 0, 'id': 1})}
+
+    async def _catalog(self, owned: Dict[str, Set[str]]) -> Tuple[Dict[str, Optional[str]], Set[str], Set[str]]:
+        """Which of ``owned`` exist: (book id -> class id, class ids, plan ids)."""
+        book_classes = {}
+        if owned['books']:
+            book_classes = {
+                book['id']: book.get('class_id')
+                async for book in self._books.find({'id': {'$in': sorted(owned['books'])}},
+                                                   {'_id': 0, 'id': 1, 'class_id': 1})
+            }
+        classes = await self._existing(self._classes, owned['classes'])
+        plans = await self._existing(self._plans, owned['plans'])
+        return book_classes, classes, plans
+
+    @staticmethod
+    def _granted(owned: Dict[str, Set[str]], catalog: Tuple[Dict[str, Optional[str]], Set[str], Set[str]]
+                 ) -> Dict[str, Set[str]]:
+        # forged or retired ids in an order's items grant nothing
+        book_classes, classes, plans = catalog
+        books = owned['books'] & book_classes.keys()
+        return {
+            'books': books,
+            'classes': (owned['classes'] & classes) | {book_classes[book] for book in books if book_classes[book]},
+            'plans': owned['plans'] & plans,
+        }
+
+    # ===== CHECKS =====
+
+    async def get(self, user_id: str) -> Grants:
+        grants = self._grants.get(user_id)
+        if grants is None:
+            doc = await self._collection.find_one({'user_id': user_id}, {'_id': 0, 'books': 1, 'classes': 1,
+                                                                          'plans': 1})
+            grants = Grants.from_doc(doc) if doc else NO_GRANTS
+            self._grants.set(user_id, grants)
+            self._stats['loads'] += 1
+        return grants
+
+    async def has_access(self, user_id: str, class_id: Optional[str]) -> bool:
+        allowed = (await self.get(user_id)).allows(class_id)
+        if not allowed:
+            self._stats['denied'] += 1
+        return allowed
+
+    async def gate(self, topic_id: str) -> Optional[Gate]:
+        """Whether a topic is premium and which class unlocks it; None for an unknown topic."""
+        gate = self._gates.get(topic_id)
+        if gate is None:
+            topic = await self._topics.find_one({'id': topic_id}, {'_id': 0, 'premium': 1, 'class_id': 1})
+            if not topic:
+                return None
+            gate = Gate(bool(topic.get('premium')), topic.get('class_id'))
+            self._gates.set(topic_id, gate)
+        return gate
+
+    async def locked_topics(self, user_id: str, query: Dict[str, Any]) -> Set[str]:
+        """Premium topics matching ``query`` that the user's grants don't unlock."""
+        grants = await self.get(user_id)
+        if grants.plans:
+            return set()
+        return {
+            topic['id']
+            async for topic in self._topics.find({**query, 'premium': True}, {'_id': 0, 'id': 1, 'class_id': 1})
+            if not grants.allows(topic.get('class_id'))
+        }
+
+    # ===== WRITES =====
+
+    async def grant(self, user_id: str, order_id: str, items: Iterable[Any]):
+        """Add a completed order's items to the user's entitlements; safe to repeat."""
+        owned = parse_items(items)
+        owned = self._granted(owned, await self._catalog(owned))
+        await self._collection.update_one(
+            {'user_id': user_id},
+            {
+                '$addToSet': {**{kind: {'$each': sorted(ids)} for kind, ids in owned.items()}, 'orders': order_id},
+                '$set': {'updated_at': datetime.now(timezone.utc).isoformat()},
+            },
+            upsert=True
+        )
+        self._grants.pop(user_id)
+        self._stats['grants'] += 1
+
+    async def rebuild(self, batch_size: int = 1000) -> Dict[str, int]:
+        """Reconstruct every user's entitlements from their completed orders."""
+        started = datetime.now(timezone.utc)
+        stamp = started.isoformat()
+        # one row per user with every item they paid for; users stream in bounded batches
+        pipeline = self._orders.aggregate([
+            {'$match': {'status': 'completed'}},
+            {'$group': {'_id': '$user_id', 'items': {'$push': '$items'}, 'orders': {'$push': '$id'}}},
+        ], allowDiskUse=True, batchSize=batch_size)
+
+        users = 0
+        batch: List[Dict[str, Any]] = []
+        async for row in pipeline:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                await self._write_rebuilt(batch, stamp)
+                users += len(batch)
+                batch = []
+        await self._write_rebuilt(batch, stamp)
+        users += len(batch)
+        # a payment verified mid-rebuild may have been replaced by an older snapshot
+        async for order in self._orders.find({'status': 'completed', 'completed_at': {'$gte': stamp}},
+                                             {'_id': 0, 'id': 1, 'user_id': 1, 'items': 1}):
+            await self.grant(order['user_id'], order['id'], order.get('items'))
+
+        # users whose orders no longer count, unless a grant landed while this ran
+        removed = await self._collection.delete_many({'rebuilt_at': {'$ne': stamp}, 'updated_at': {'$lt': stamp}})
+        self._grants.clear()
+        self._stats['rebuilds'] += 1
+        self._stats['rebuild_seconds'] = (datetime.now(timezone.utc) - started).total_seconds()
+        logger.info("Entitlements rebuilt for %d users in %.1fs", users, self._stats['rebuild_seconds'])
+        return {'users': users, 'removed': removed.deleted_count}
+
+    async def _write_rebuilt(self, rows: List[Dict[str, Any]], stamp: str):
+        if not rows:
+            return
+        owned_by_user = {}
+        for row in rows:
+            owned = {kind: set() for kind in KINDS}
+            for items in row['items']:
+                for kind, ids in parse_items(items).items():
+                    owned[kind].update(ids)
+            owned_by_user[row['_id']] = owned
+        # one catalog lookup for the whole batch
+        catalog = await self._catalog({
+            kind: {item for owned in owned_by_user.values() for item in owned[kind]} for kind in KINDS
+        })
+
+        operations = []
+        for row in rows:
+            owned = self._granted(owned_by_user[row['_id']], catalog)
+            operations.append(ReplaceOne({'user_id': row['_id']}, {
+                'user_id': row['_id'],
+                **{kind: sorted(ids) for kind, ids in owned.items()},
+                'orders': sorted(order for order in row['orders'] if order),
+                'rebuilt_at': stamp,
+                'updated_at': stamp,
+            }, upsert=True))
+        await self._collection.bulk_write(operations, ordered=False)
+
+    # ===== CACHE =====
+
+    def invalidate(self, user_id: Optional[str] = None):
+        if user_id is None:
+            self._grants.clear()
+        else:
+            self._grants.pop(user_id)
+
+    def forget_topic(self, topic_id: Optional[str] = None):
+        if topic_id is None:
+            self._gates.clear()
+        else:
+            self._gates.pop(topic_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            'cached_users': len(self._grants),
+            'cached_topics': len(self._gates),
+            'hits': self._grants.hits,
+            'misses': self._grants.misses,
+        }
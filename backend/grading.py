@@ -0,0 +1,196 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from caching import TTLCache
+
+Answer = Union[str, List[str], None]
+
+# Bit used for answers that match none of the options
+_UNKNOWN_OPTION = np.int64(1) << np.int64(62)
+
+KEY_PROJECTION = {
+    '_id': 0,
+    'id': 1,
+    'topic_id': 1,
+    'negative_marking': 1,
+    'partial_marking': 1,
+    'questions.id': 1,
+    'questions.options': 1,
+    'questions.correct_answer': 1,
+    'questions.marks': 1,
+}
+
+
+class AnswerKey:
+    """Compact, precompiled answer key for one quiz.
+
+    Each answer is stored as a bitmask over the question's options, so
+    single and multi-select questions are graded with the same array ops.
+    """
+
+    __slots__ = ('quiz_id', 'topic_id', 'subject_id', 'class_id', 'question_ids', 'positions', 'option_bits',
+                 'correct', 'multi', 'marks', 'negative', 'partial')
+
+    def __init__(self, quiz: Dict[str, Any], topic: Optional[Dict[str, Any]] = None):
+        questions = quiz.get('questions') or []
+        self.quiz_id = quiz['id']
+        self.topic_id = quiz.get('topic_id')
+        self.subject_id = (topic or {}).get('subject_id')
+        self.class_id = (topic or {}).get('class_id')
+        self.question_ids = tuple(q['id'] for q in questions)
+        self.positions = {qid: i for i, qid in enumerate(self.question_ids)}
+        self.option_bits = [
+            {option: 1 << i for i, option in enumerate(q.get('options') or [])}
+            for q in questions
+        ]
+
+        correct = []
+        multi = []
+        for q, bits in zip(questions, self.option_bits):
+            answer = q.get('correct_answer')
+            is_multi = isinstance(answer, list)
+            multi.append(is_multi)
+            correct.append(self._mask(bits, answer))
+        self.correct = np.array(correct, dtype=np.int64)
+        self.multi = np.array(multi, dtype=bool)
+        self.marks = np.array([q.get('marks', 1) for q in questions], dtype=np.float64)
+        # negative_marking is the fraction of a question's marks lost on a wrong answer
+        self.negative = float(quiz.get('negative_marking') or 0)
+        self.partial = bool(quiz.get('partial_marking', False))
+
+    @staticmethod
+    def _mask(bits: Dict[str, int], answer: Answer) -> int:
+        if answer is None or answer == '' or answer == []:
+            return 0
+        mask = 0
+        for option in (answer if isinstance(answer, list) else [answer]):
+            mask |= bits.get(option, int(_UNKNOWN_OPTION))
+        return mask
+
+    def __len__(self) -> int:
+        return len(self.question_ids)
+
+    def encode(self, answers: Dict[str, Answer]) -> np.ndarray:
+        row = np.zeros(len(self.question_ids), dtype=np.int64)
+        for qid, answer in answers.items():
+            position = self.positions.get(qid)
+            if position is not None:
+                row[position] = self._mask(self.option_bits[position], answer)
+        return row
+
+    def encode_answer(self, question_id: str, answer: Answer) -> Tuple[int, int]:
+        """(position, mask) of one answer; ValueError for an unknown question or option."""
+        position = self.positions.get(question_id)
+        if position is None:
+            raise ValueError(f"Unknown question: {question_id}")
+        mask = self._mask(self.option_bits[position], answer)
+        if mask & int(_UNKNOWN_OPTION):
+            raise ValueError(f"Unknown option for question {question_id}")
+        return position, mask
+
+    def decode(self, row: np.ndarray) -> Dict[str, Answer]:
+        answers: Dict[str, Answer] = {}
+        for position, mask in enumerate(row.tolist()):
+            if not mask:
+                continue
+            picked = [option for option, bit in self.option_bits[position].items() if mask & bit]
+            answers[self.question_ids[position]] = picked if self.multi[position] else next(iter(picked), None)
+        return answers
+
+
+def grade(key: AnswerKey, responses: np.ndarray) -> Dict[str, np.ndarray]:
+    """Grade a (submissions x questions) matrix of encoded responses."""
+    answered = responses != 0
+    exact = responses == key.correct
+
+    credit = np.where(exact, 1.0, np.where(answered, -key.negative, 0.0))
+    if key.partial and key.multi.any():
+        picked_right = np.bitwise_count(responses & key.correct)
+        picked_wrong = np.bitwise_count(responses & ~key.correct)
+        total_right = np.maximum(np.bitwise_count(key.correct), 1)
+        partial = key.multi & answered & ~exact & (picked_wrong == 0)
+        credit = np.where(partial, picked_right / total_right, credit)
+
+    marks = (credit * key.marks).sum(axis=1)
+    max_marks = key.marks.sum()
+    return {
+        'correct': exact.sum(axis=1),
+        'marks': marks,
+        'score': marks / max_marks * 100 if max_marks else np.zeros(len(responses)),
+        'per_question': exact,
+    }
+
+
+def grade_one(key: AnswerKey, answers: Dict[str, Answer]) -> Dict[str, Any]:
+    graded = grade(key, key.encode(answers)[np.newaxis, :])
+    return {
+        'score': float(graded['score'][0]),
+        'correct': int(graded['correct'][0]),
+        'total': len(key),
+        'marks': float(graded['marks'][0]),
+        'max_marks': float(key.marks.sum()),
+        'per_question': graded['per_question'][0],
+    }
+
+
+def grade_many(key: AnswerKey, submissions: Sequence[Dict[str, Answer]]) -> List[Dict[str, Any]]:
+    graded = grade(key, np.stack([key.encode(answers) for answers in submissions]))
+    max_marks = float(key.marks.sum())
+    return [
+        {
+            'score': float(graded['score'][i]),
+            'correct': int(graded['correct'][i]),
+            'total': len(key),
+            'marks': float(graded['marks'][i]),
+            'max_marks': max_marks,
+            'per_question': graded['per_question'][i],
+        }
+        for i in range(len(submissions))
+    ]
+
+
+class AnswerKeyCache:
+    """Quiz id -> AnswerKey, loaded once from MongoDB and dropped on quiz edits."""
+
+    def __init__(self, quizzes, topics=None, maxsize: int = 10000):
+        self._quizzes = quizzes
+        self._topics = topics
+        self._keys = TTLCache(maxsize=maxsize)
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._generation = 0
+
+    async def _load(self, quiz_id: str) -> Optional[AnswerKey]:
+        quiz = await self._quizzes.find_one({'id': quiz_id}, KEY_PROJECTION)
+        if not quiz:
+            return None
+        topic = None
+        if self._topics is not None and quiz.get('topic_id'):
+            topic = await self._topics.find_one(
+                {'id': quiz['topic_id']}, {'_id': 0, 'subject_id': 1, 'class_id': 1}
+            )
+        return AnswerKey(quiz, topic)
+
+    async def get(self, quiz_id: str) -> Optional[AnswerKey]:
+        key = self._keys.get(quiz_id)
+        if key is not None:
+            return key
+        generation = self._generation
+        task = self._loading.get(quiz_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load(quiz_id))
+            self._loading[quiz_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(quiz_id, None))
+        key = await asyncio.shield(task)
+        # don't cache a key that was read before an invalidation
+        if key is not None and generation == self._generation:
+            self._keys.set(quiz_id, key)
+        return key
+
+    def invalidate(self, quiz_id: Optional[str] = None):
+        self._generation += 1
+        if quiz_id is None:
+            self._keys.clear()
+        else:
+            self._keys.pop(quiz_id)
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Any
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Every lookup the API does by field, per collection. Index names follow the
+# pymongo default (<field>_<direction>) so drift checks can compare by name.
+# Specs marked 'dedupe' may be made unique over existing data with --dedupe.
+INDEX_SPECS: Dict[str, List[Dict[str, Any]]] = {
+    'users': [
+        {'keys': [('email', ASCENDING)], 'unique': True},
+        {'keys': [('id', ASCENDING)], 'unique': True},
+    ],
+    'classes': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+    ],
+    'subjects': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('class_id', ASCENDING)]},
+    ],
+    'topics': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        # the bulk import natural key; unique so concurrent upserts can't both insert
+        {'keys': [('subject_id', ASCENDING), ('title', ASCENDING)], 'unique': True, 'dedupe': True},
+    ],
+    'quizzes': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('topic_id', ASCENDING)]},
+    ],
+    'quiz_results': [
+        {'keys': [('user_id', ASCENDING), ('submitted_at', DESCENDING), ('id', DESCENDING)]},
+    ],
+    'bookmarks': [
+        {'keys': [('user_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]},
+    ],
+    'books': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('class_id', ASCENDING), ('title', ASCENDING)], 'unique': True, 'dedupe': True},
+    ],
+    'mock_tests': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+    ],
+    'mock_test_sessions': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('user_id', ASCENDING), ('test_id', ASCENDING), ('status', ASCENDING)]},
+        {'keys': [('status', ASCENDING)]},
+    ],
+    'cache_invalidations': [
+        {'keys': [('collection', ASCENDING), ('version', ASCENDING)], 'unique': True},
+        # events only need to outlive the slowest poller
+        {'keys': [('at', ASCENDING)], 'expireAfterSeconds': 86400},
+    ],
+    'orders': [
+        {'keys': [('razorpay_order_id', ASCENDING)], 'unique': True},
+        {'keys': [('user_id', ASCENDING), ('status', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]},
+    ],
+    'entitlements': [
+        {'keys': [('user_id', ASCENDING)], 'unique': True},
+    ],
+    'questions': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+    ],
+    'question_exposures': [
+        {'keys': [('user_id', ASCENDING)], 'unique': True},
+    ],
+    'review_items': [
+        {'keys': [('user_id', ASCENDING), ('question_id', ASCENDING)], 'unique': True},
+        # each user's due queue
+        {'keys': [('user_id', ASCENDING), ('due', ASCENDING)]},
+    ],
+}
+
+# Representative filters for the queries issued by server.py routes, used by
+# the explain check to spot anything still answered by a collection scan.
+ROUTE_QUERIES: List[Dict[str, Any]] = [
+    {'route': 'POST /auth/login', 'collection': 'users', 'filter': {'email': 'x@example.com'}},
+    {'route': 'GET /auth/me', 'collection': 'users', 'filter': {'id': 'x'}},
+    {'route': 'GET /subjects/{class_id}', 'collection': 'subjects', 'filter': {'class_id': 'x'}},
+    {'route': 'GET /topics/{subject_id}', 'collection': 'topics', 'filter': {'subject_id': 'x'}},
+    {'route': 'GET /topic/{topic_id}', 'collection': 'topics', 'filter': {'id': 'x'}},
+    {'route': 'GET /quiz/{topic_id}', 'collection': 'quizzes', 'filter': {'topic_id': 'x'}},
+    {'route': 'POST /quiz/submit', 'collection': 'quizzes', 'filter': {'id': 'x'}},
+    {'route': 'GET /book/{book_id}', 'collection': 'books', 'filter': {'id': 'x'}},
+    {'route': 'POST /orders/verify', 'collection': 'orders', 'filter': {'razorpay_order_id': 'x'}},
+    {'route': 'GET /student/progress', 'collection': 'quiz_results', 'filter': {'user_id': 'x'}},
+    {'route': 'GET /student/bookmarks', 'collection': 'bookmarks', 'filter': {'user_id': 'x'}},
+    {'route': 'POST /admin/import/topics', 'collection': 'topics', 'filter': {'subject_id': 'x', 'title': 'x'}},
+    {'route': 'POST /admin/import/books', 'collection': 'books', 'filter': {'class_id': 'x', 'title': 'x'}},
+    {'route': 'POST /mock-tests/{test_id}/start', 'collection': 'mock_test_sessions',
+     'filter': {'user_id': 'x', 'test_id': 'x', 'status': 'active'}},
+    {'route': 'GET /mock-tests/sessions/{session_id}', 'collection': 'mock_test_sessions', 'filter': {'id': 'x'}},
+    {'route': 'GET /student/purchases', 'collection': 'orders', 'filter': {'user_id': 'x', 'status': 'completed'}},
+    {'route': 'GET /student/entitlements', 'collection': 'entitlements', 'filter': {'user_id': 'x'}},
+    {'route': 'GET /practice/paper', 'collection': 'question_exposures', 'filter': {'user_id': 'x'}},
+    {'route': 'GET /student/review', 'collection': 'review_items', 'filter': {'user_id': 'x', 'due': {'$lte': 'x'}}},
+]
+
+
+def index_name(keys) -> str:
+    return '_'.join(f'{field}_{direction}' for field, direction in keys)
+
+
+async def ensure_indexes(db, dry_run: bool = False) -> Dict[str, list]:
+    """Create missing indexes and report drift against INDEX_SPECS.
+
+    Existing indexes are never dropped; conflicting or unexpected ones are
+    only reported so an operator can decide what to do with them.
+    """
+    report = {'created': [], 'missing': [], 'conflicts': [], 'unexpected': [], 'errors': []}
+
+    for collection, specs in INDEX_SPECS.items():
+        existing = {}
+        async for index in db[collection].list_indexes():
+            existing[index['name']] = index
+
+        to_create = []
+        wanted = set()
+        for spec in specs:
+            name = index_name(spec['keys'])
+            wanted.add(name)
+            unique = spec.get('unique', False)
+            current = existing.get(name)
+            if current is None:
+                if dry_run:
+                    report['missing'].append(f'{collection}.{name}')
+                options = {'expireAfterSeconds': spec['expireAfterSeconds']} if 'expireAfterSeconds' in spec else {}
+                to_create.append(IndexModel(spec['keys'], name=name, unique=unique, **options))
+            elif bool(current.get('unique', False)) != unique:
+                report['conflicts'].append(f'{collection}.{name} (unique={current.get("unique", False)}, expected {unique})')
+
+        for name in existing:
+            if name != '_id_' and name not in wanted:
+                report['unexpected'].append(f'{collection}.{name}')
+
+        if dry_run or not to_create:
+            continue
+        try:
+            created = await db[collection].create_indexes(to_create)
+            report['created'].extend(f'{collection}.{name}' for name in created)
+        except OperationFailure as e:
+            # e.g. duplicate emails blocking a unique index
+            report['errors'].append(f'{collection}: {e}')
+
+    return report
+
+
+async def dedupe_natural_keys(db, dry_run: bool = False) -> Dict[str, List[str]]:
+    """Delete all but the oldest document per key of every 'dedupe' spec.
+
+    Clears the way for the unique index: an older non-unique index of the
+    same name is dropped so ensure_indexes can rebuild it. Returns the app
+    ids removed (or that would be, on a dry run) per collection, so anything
+    that referenced them can be checked.
+    """
+    removed: Dict[str, List[str]] = {}
+    for collection, specs in INDEX_SPECS.items():
+        for spec in specs:
+            if not spec.get('dedupe'):
+                continue
+            group = {field: f'${field}' for field, _ in spec['keys']}
+            duplicates = db[collection].aggregate([
+                {'$sort': {'created_at': ASCENDING, '_id': ASCENDING}},
+                {'$group': {'_id': group, 'oids': {'$push': '$_id'}, 'ids': {'$push': '$id'}}},
+                {'$match': {'oids.1': {'$exists': True}}},
+            ], allowDiskUse=True)
+            extra_oids, extra_ids = [], []
+            async for row in duplicates:
+                extra_oids.extend(row['oids'][1:])
+                extra_ids.extend(row['ids'][1:])
+            removed[collection] = extra_ids
+            if dry_run:
+                continue
+            if extra_oids:
+                await db[collection].delete_many({'_id': {'$in': extra_oids}})
+            name = index_name(spec['keys'])
+            async for index in db[collection].list_indexes():
+                if index['name'] == name and not index.get('unique', False):
+                    await db[collection].drop_index(name)
+    return removed
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get('stage')]
+    for child_key in ('inputStage', 'queryPlan'):
+        if child_key in plan:
+            stages.extend(_plan_stages(plan[child_key]))
+    for child in plan.get('inputStages', []):
+        stages.extend(_plan_stages(child))
+    return [stage for stage in stages if stage]
+
+
+async def explain_route_queries(db) -> List[Dict[str, Any]]:
+    results = []
+    for query in ROUTE_QUERIES:
+        explain = await db.command(
+            'explain',
+            {'find': query['collection'], 'filter': query['filter']},
+            verbosity='queryPlanner'
+        )
+        stages = _plan_stages(explain['queryPlanner']['winningPlan'])
+        results.append({
+            'route': query['route'],
+            'collection': query['collection'],
+            'stages': stages,
+            'collscan': 'COLLSCAN' in stages,
+        })
+    return results
+
+
+def log_index_report(report: Dict[str, list]):
+    for key in ('created', 'missing', 'conflicts', 'unexpected', 'errors'):
+        if report[key]:
+            level = logging.INFO if key == 'created' else logging.WARNING
+            logger.log(level, "Indexes %s: %s", key, ', '.join(report[key]))
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description='Build and check MongoDB indexes')
+    parser.add_argument('--dry-run', action='store_true', help='report drift without creating indexes')
+    parser.add_argument('--explain', action='store_true', help='flag route queries that still COLLSCAN')
+    parser.add_argument('--dedupe', action='store_true',
+                        help='keep only the oldest topic/book per natural key so the unique indexes can build')
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if args.dedupe:
+        for collection, ids in (await dedupe_natural_keys(db, dry_run=args.dry_run)).items():
+            verb = 'would remove' if args.dry_run else 'removed'
+            print(f"{collection}: {verb} {len(ids)} duplicates{': ' + ', '.join(ids) if ids else ''}")
+
+    report = await ensure_indexes(db, dry_run=args.dry_run)
+    for key, entries in report.items():
+        print(f"{key}: {', '.join(entries) if entries else '-'}")
+
+    if args.explain:
+        collscans = 0
+        for result in await explain_route_queries(db):
+            flag = 'COLLSCAN' if result['collscan'] else 'ok'
+            collscans += result['collscan']
+            print(f"{flag:8} {result['route']:32} {' <- '.join(result['stages'])}")
+        if collscans:
+            raise SystemExit(1)
+
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
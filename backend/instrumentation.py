@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+UNMATCHED = 'unmatched'
+BACKGROUND = 'background'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry = CollectorRegistry(auto_describe=True)
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests', ['method', 'route', 'status'], registry=registry)
+LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency', ['method', 'route'],
+                    buckets=LATENCY_BUCKETS, registry=registry)
+IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being served', ['method'], registry=registry)
+REQUEST_DB_TIME = Histogram('http_request_db_seconds', 'MongoDB time spent per HTTP request', ['method', 'route'],
+                            buckets=LATENCY_BUCKETS, registry=registry)
+REQUEST_DB_COMMANDS = Histogram('http_request_db_commands', 'MongoDB commands issued per HTTP request',
+                                ['method', 'route'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100), registry=registry)
+DB_COMMANDS = Counter('mongodb_commands_total', 'MongoDB commands', ['route', 'command', 'collection', 'outcome'],
+                      registry=registry)
+DB_LATENCY = Histogram('mongodb_command_duration_seconds', 'MongoDB command latency', ['command', 'collection'],
+                       buckets=LATENCY_BUCKETS, registry=registry)
+LOOP_LAG = Histogram('event_loop_lag_seconds', 'How late the event loop ran a periodic timer',
+                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5), registry=registry)
+
+
+class RequestStats:
+    """MongoDB commands issued while serving one request."""
+
+    __slots__ = ('method', 'scope', 'commands', 'db_seconds')
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.scope = scope
+        # (command, collection, seconds, ok); appended from Motor's executor threads
+        self.commands: List[Tuple[str, str, float, bool]] = []
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        # FastAPI puts the matched route into the scope once routing is done
+        return getattr(self.scope.get('route'), 'path', UNMATCHED)
+
+    def record(self, command: str, collection: str, seconds: float, ok: bool):
+        self.commands.append((command, collection, seconds, ok))
+        self.db_seconds += seconds
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        grouped: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        for command, collection, seconds, _ in self.commands:
+            grouped[(command, collection)].append(seconds)
+        return sorted(
+            (
+                {'command': command, 'collection': collection, 'count': len(times),
+                 'total_ms': sum(times) * 1000, 'max_ms': max(times) * 1000}
+                for (command, collection), times in grouped.items()
+            ),
+            key=lambda row: -row['total_ms']
+        )
+
+
+# Motor copies the context into its executor threads, so listeners see the request's stats
+current_request: ContextVar[Optional[RequestStats]] = ContextVar('current_request', default=None)
+
+
+class CommandAccounting(monitoring.CommandListener):
+    """Attributes every MongoDB command to the request (route) that issued it."""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[Any, int], str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _collection(event: monitoring.CommandStartedEvent) -> str:
+        target = event.command.get(event.command_name)
+        return target if isinstance(target, str) else ''
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = self._collection(event)
+
+    def _finished(self, event, ok: bool):
+        with self._lock:
+            collection = self._pending.pop((event.connection_id, event.request_id), '')
+        seconds = event.duration_micros / 1e6
+        stats = current_request.get()
+        if stats is not None:
+            stats.record(event.command_name, collection, seconds, ok)
+        route = stats.route if stats is not None else BACKGROUND
+        DB_COMMANDS.labels(route, event.command_name, collection, 'ok' if ok else 'error').inc()
+        DB_LATENCY.labels(event.command_name, collection).observe(seconds)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finished(event, True)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finished(event, False)
+
+
+class InstrumentationMiddleware:
+    """Per-route latency, status and in-flight metrics plus a slow-request log.
+
+    Routes are labelled by their path template (``/api/topic/{topic_id}``) so
+    label cardinality stays bounded. Requests slower than ``slow_ms`` are
+    logged with a per-command breakdown of their MongoDB time.
+    """
+
+    def __init__(self, app, slow_ms: float = 500.0, max_logged_commands: int = 50):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.max_logged_commands = max_logged_commands
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status = 500
+        in_flight = IN_FLIGHT.labels(method)
+        in_flight.inc()
+        started_at = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            in_flight.dec()
+            current_request.reset(token)
+            route = stats.route
+            REQUESTS.labels(method, route, str(status)).inc()
+            LATENCY.labels(method, route).observe(elapsed)
+            REQUEST_DB_TIME.labels(method, route).observe(stats.db_seconds)
+            REQUEST_DB_COMMANDS.labels(method, route).observe(len(stats.commands))
+            if elapsed * 1000 >= self.slow_ms:
+                self._log_slow(stats, status, elapsed)
+
+    def _log_slow(self, stats: RequestStats, status: int, elapsed: float):
+        lines = [
+            f"  {row['command']} {row['collection']}: {row['count']}x, {row['total_ms']:.1f} ms"
+            f" (max {row['max_ms']:.1f} ms)"
+            for row in stats.breakdown()[:self.max_logged_commands]
+        ]
+        logger.warning(
+            "Slow request %s %s -> %d in %.1f ms; %d MongoDB commands took %.1f ms%s",
+            stats.method, stats.route, status, elapsed * 1000, len(stats.commands), stats.db_seconds * 1000,
+            ''.join('\n' + line for line in lines)
+        )
+
+
+class LoopLagMonitor:
+    """Feeds event_loop_lag_seconds from how late a periodic sleep wakes up."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,347 @@
+"""Cross-worker cache invalidation.
+
+Every worker keeps its own in-process caches, so a write handled by one
+worker has to reach the others. On a replica set each worker tails the
+watched collections with change streams; on a standalone mongod the write
+paths publish version-stamped invalidation events that every worker polls.
+
+To try the change stream path locally, start a single-node replica set:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval 'rs.initiate()'
+
+and run the round-trip check against it (or against a standalone server to
+check the polling fallback):
+
+    MONGO_URL='mongodb://localhost:27017/?replicaSet=rs0' python invalidation_bus.py --check
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure, PyMongoError
+
+from instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAMS = 'change_streams'
+POLLING = 'polling'
+MODES = ('auto', CHANGE_STREAMS, POLLING, 'off')
+
+# Resume token no longer in the oplog, or the stream was invalidated (drop/rename)
+_HISTORY_LOST = {136, 260, 280, 286}
+
+INVALIDATION_LAG = Histogram('cache_invalidation_lag_seconds', 'Time from a write to its invalidation in this worker',
+                             ['collection', 'mode'],
+                             buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+                             registry=registry)
+INVALIDATIONS = Counter('cache_invalidations_total', 'Invalidation events applied', ['collection', 'scope'],
+                        registry=registry)
+BUS_ERRORS = Counter('cache_invalidation_errors_total', 'Failures reading the invalidation feed', ['collection'],
+                     registry=registry)
+BUS_CONNECTED = Gauge('cache_invalidation_connected', 'Whether the invalidation feed is being read',
+                      ['collection'], registry=registry)
+
+
+class Change:
+    """One write to a watched collection, as far as caches are concerned.
+
+    ``id`` is the document's ``id`` field when the write touched a single
+    known document; ``None`` means the whole collection may have changed.
+    ``document`` carries whatever fields the change source had: the full
+    post-image from a change stream, or the fields a writer published.
+    """
+
+    __slots__ = ('collection', 'operation', 'id', 'document', 'updated_fields', 'at')
+
+    def __init__(self, collection: str, operation: str, id: Optional[str] = None,
+                 document: Optional[Dict[str, Any]] = None, updated_fields: Optional[List[str]] = None,
+                 at: Optional[datetime] = None):
+        self.collection = collection
+        self.operation = operation
+        self.id = id
+        self.document = document or {}
+        self.updated_fields = updated_fields
+        self.at = at
+
+    @property
+    def broad(self) -> bool:
+        return self.id is None
+
+    def changed(self, field: str) -> bool:
+        """Whether ``field`` may have changed; unknown for anything but a plain update."""
+        return self.updated_fields is None or any(
+            name == field or name.startswith(f'{field}.') for name in self.updated_fields
+        )
+
+    @classmethod
+    def from_event(cls, collection: str, event: Dict[str, Any]) -> 'Change':
+        operation = event['operationType']
+        document = event.get('fullDocument') or {}
+        updated_fields = None
+        if operation == 'update':
+            description = event.get('updateDescription') or {}
+            updated_fields = list(description.get('updatedFields') or {}) + list(description.get('removedFields') or [])
+        at = event.get('wallTime')
+        if at is None and event.get('clusterTime') is not None:
+            at = event['clusterTime'].as_datetime()
+        # deletes only carry the ObjectId _id, so they invalidate the whole collection
+        return cls(collection, operation, document.get('id'), document, updated_fields, at)
+
+
+Handler = Callable[[Change], Awaitable[None]]
+
+
+class InvalidationBus:
+    """Fans out writes to watched collections to this worker's cache handlers.
+
+    With change streams, each collection is watched with ``updateLookup``
+    and the stream resumes from its last token after errors. When the token
+    has fallen off the oplog, the collection's caches are cleared broadly
+    before a fresh stream starts. On a standalone server, writers call
+    ``publish``. It bumps a per-collection version in ``versions`` and
+    records the event in ``events``, and every worker polls the versions
+    and replays the events it has not seen. An event missing for longer
+    than ``gap_timeout`` (expired, or a writer died between the two writes)
+    is treated as a broad change.
+    """
+
+    def __init__(self, db, collections: Iterable[str], mode: str = 'auto', poll_interval: float = 1.0,
+                 gap_timeout: float = 10.0, versions: str = 'cache_versions', events: str = 'cache_invalidations'):
+        if mode not in MODES:
+            raise ValueError(f"Unknown invalidation bus mode: {mode}")
+        self._db = db
+        self.collections = tuple(collections)
+        self.requested_mode = mode
+        self.mode: Optional[str] = None
+        self.poll_interval = poll_interval
+        self.gap_timeout = gap_timeout
+        self._versions = db[versions]
+        self._events = db[events]
+        self._handlers: Dict[str, List[Handler]] = {name: [] for name in self.collections}
+        self._tasks: List[asyncio.Task] = []
+        self._seen: Dict[str, int] = {}
+        self._gap_since: Dict[str, float] = {}
+        self.origin = str(uuid.uuid4())
+        self._stats = {name: {'changes': 0, 'broad': 0, 'errors': 0, 'resets': 0, 'lag_max': 0.0}
+                       for name in self.collections}
+
+    def subscribe(self, collection: str, handler: Handler):
+        self._handlers[collection].append(handler)
+
+    async def _detect_mode(self) -> str:
+        if self.requested_mode != 'auto':
+            return self.requested_mode
+        try:
+            hello = await self._db.client.admin.command('hello')
+        except (PyMongoError, NotImplementedError):
+            return POLLING
+        return CHANGE_STREAMS if hello.get('setName') or hello.get('msg') == 'isdbgrid' else POLLING
+
+    async def start(self):
+        self.mode = await self._detect_mode()
+        logger.info("Cache invalidation bus using %s", self.mode)
+        if self.mode == CHANGE_STREAMS:
+            self._tasks = [asyncio.create_task(self._watch(name)) for name in self.collections]
+        elif self.mode == POLLING:
+            # this worker's caches start empty, so only what happens from now on matters
+            self._seen = await self._remote_versions()
+            self._tasks = [asyncio.create_task(self._poll_loop())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _dispatch(self, change: Change, local: bool = False):
+        stats = self._stats[change.collection]
+        stats['changes'] += 1
+        stats['broad'] += change.broad
+        INVALIDATIONS.labels(change.collection, 'broad' if change.broad else 'key').inc()
+        if change.at is not None and not local:
+            at = change.at if change.at.tzinfo else change.at.replace(tzinfo=timezone.utc)
+            lag = max(0.0, (datetime.now(timezone.utc) - at).total_seconds())
+            INVALIDATION_LAG.labels(change.collection, self.mode).observe(lag)
+            stats['lag_max'] = max(stats['lag_max'], lag)
+        for handler in self._handlers[change.collection]:
+            try:
+                await handler(change)
+            except Exception:
+                logger.exception("Cache invalidation handler failed for %s", change.collection)
+
+    # ===== CHANGE STREAMS =====
+
+    async def _watch(self, name: str):
+        token = None
+        delay = 0.5
+        while True:
+            try:
+                async with self._db[name].watch(full_document='updateLookup', resume_after=token) as stream:
+                    BUS_CONNECTED.labels(name).set(1)
+                    delay = 0.5
+                    async for event in stream:
+                        token = stream.resume_token
+                        change = Change.from_event(name, event)
+                        await self._dispatch(change)
+                        if event['operationType'] in ('invalidate', 'drop', 'rename', 'dropDatabase'):
+                            token = None
+                            break
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code in _HISTORY_LOST:
+                    logger.warning("Change stream on %s lost its history, clearing its caches: %s", name, e)
+                    token = None
+                    self._stats[name]['resets'] += 1
+                    await self._dispatch(Change(name, 'reset'), local=True)
+                    continue
+                BUS_CONNECTED.labels(name).set(0)
+                BUS_ERRORS.labels(name).inc()
+                self._stats[name]['errors'] += 1
+                logger.warning("Change stream on %s failed, resuming in %.1fs: %s", name, delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    # ===== VERSION POLLING =====
+
+    async def publish(self, collection: str, id: Optional[str] = None, document: Optional[Dict[str, Any]] = None,
+                      operation: str = 'update'):
+        """Announce a write on standalone servers; a no-op when change streams carry it."""
+        if self.mode != POLLING:
+            return
+        try:
+            stamp = await self._versions.find_one_and_update(
+                {'_id': collection}, {'$inc': {'version': 1}}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            await self._events.insert_one({
+                'collection': collection,
+                'version': stamp['version'],
+                'operation': operation,
+                'id': id,
+                'document': document or {},
+                'origin': self.origin,
+                'at': datetime.now(timezone.utc),
+            })
+        except PyMongoError:
+            # other workers fall back on their cache TTLs
+            logger.exception("Could not publish %s invalidation", collection)
+
+    async def _remote_versions(self) -> Dict[str, int]:
+        versions = {name: 0 for name in self.collections}
+        async for doc in self._versions.find({'_id': {'$in': list(self.collections)}}):
+            versions[doc['_id']] = doc.get('version', 0)
+        return versions
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+                for name in self.collections:
+                    BUS_CONNECTED.labels(name).set(1)
+            except PyMongoError as e:
+                for name in self.collections:
+                    BUS_CONNECTED.labels(name).set(0)
+                    BUS_ERRORS.labels(name).inc()
+                    self._stats[name]['errors'] += 1
+                logger.warning("Invalidation poll failed: %s", e)
+
+    async def poll(self):
+        remote = await self._remote_versions()
+        for name, version in remote.items():
+            seen = self._seen.get(name, 0)
+            if version <= seen:
+                continue
+            async for event in self._events.find(
+                {'collection': name, 'version': {'$gt': seen, '$lte': version}}
+            ).sort('version', 1):
+                if event['version'] != seen + 1:
+                    break
+                seen = event['version']
+                at = event.get('at')
+                if event.get('origin') != self.origin:
+                    await self._dispatch(Change(name, event.get('operation', 'update'), event.get('id'),
+                                                event.get('document'), at=at))
+            self._seen[name] = seen
+
+            if seen < version:
+                # the next event is not there (yet); give a slow writer gap_timeout to insert it
+                since = self._gap_since.setdefault(name, time.monotonic())
+                if time.monotonic() - since >= self.gap_timeout:
+                    logger.warning("Invalidation events %d-%d for %s are missing, clearing its caches",
+                                   seen + 1, version, name)
+                    self._seen[name] = version
+                    self._gap_since.pop(name, None)
+                    self._stats[name]['resets'] += 1
+                    await self._dispatch(Change(name, 'reset'), local=True)
+            else:
+                self._gap_since.pop(name, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {'mode': self.mode, 'collections': self._stats,
+                'versions': dict(self._seen) if self.mode == POLLING else None}
+
+
+# ===== CLI =====
+
+async def check(probe: str = 'cache_bus_probe', timeout: float = 10.0):
+    """Write to a scratch collection and time how long the bus takes to report it."""
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    bus = InvalidationBus(db, [probe], mode=os.environ.get('CACHE_BUS_MODE', 'auto'), poll_interval=0.2)
+    received: asyncio.Queue = asyncio.Queue()
+
+    async def on_change(change: Change):
+        await received.put((change, time.perf_counter()))
+    bus.subscribe(probe, on_change)
+    await bus.start()
+    # a worker skips its own published events, so write as a second one would
+    writer = InvalidationBus(db, [probe], mode=bus.mode)
+    writer.mode = bus.mode
+    print(f"mode: {bus.mode}")
+    await asyncio.sleep(1.0)  # let the streams open
+
+    probe_id = str(uuid.uuid4())
+    try:
+        for operation in ('insert', 'update'):
+            written_at = time.perf_counter()
+            if operation == 'insert':
+                await db[probe].insert_one({'id': probe_id, 'n': 0})
+            else:
+                await db[probe].update_one({'id': probe_id}, {'$inc': {'n': 1}})
+            await writer.publish(probe, probe_id, {'id': probe_id}, operation)
+            change, seen_at = await asyncio.wait_for(received.get(), timeout)
+            print(f"{operation}: id={change.id} fields={change.updated_fields} "
+                  f"after {(seen_at - written_at) * 1000:.1f} ms")
+    except asyncio.TimeoutError:
+        print(f"no change seen within {timeout:.0f}s")
+    finally:
+        await bus.stop()
+        await db[probe].drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cache invalidation bus tools')
+    parser.add_argument('--check', action='store_true', help='measure write-to-invalidation round trip')
+    args = parser.parse_args()
+    if args.check:
+        asyncio.run(check())
+    else:
+        parser.print_help()
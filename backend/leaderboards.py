@@ -0,0 +1,253 @@
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from sortedcontainers import SortedList
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ('quiz', 'topic', 'class')
+
+Best = Tuple[float, str]  # (score, achieved_at)
+
+
+def board_id(scope: str, scope_id: str) -> str:
+    return f'{scope}:{scope_id}'
+
+
+def better(candidate: Best, current: Optional[Best]) -> bool:
+    # higher score wins, and the earlier attempt wins a tie
+    return current is None or candidate[0] > current[0] or (candidate[0] == current[0] and candidate[1] < current[1])
+
+
+class Board:
+    """One ranking: best entry per user in an order-statistic sorted list.
+
+    Entries sort as ``(-score, achieved_at, user_id)``, so rank lookups,
+    inserts and removals are O(log n) and the top N is a slice.
+    """
+
+    __slots__ = ('_ranked', '_entries')
+
+    def __init__(self):
+        self._ranked = SortedList()
+        self._entries: Dict[str, Best] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: str) -> Optional[Best]:
+        return self._entries.get(user_id)
+
+    def set(self, user_id: str, best: Best):
+        current = self._entries.get(user_id)
+        if current is not None:
+            self._ranked.remove((-current[0], current[1], user_id))
+        self._entries[user_id] = best
+        self._ranked.add((-best[0], best[1], user_id))
+
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        return [
+            {'rank': rank, 'user_id': user_id, 'score': -negative, 'achieved_at': achieved_at}
+            for rank, (negative, achieved_at, user_id) in enumerate(self._ranked[:n], start=1)
+        ]
+
+    def rank(self, user_id: str) -> Optional[Dict[str, Any]]:
+        best = self._entries.get(user_id)
+        if best is None:
+            return None
+        return {
+            'rank': self._ranked.index((-best[0], best[1], user_id)) + 1,
+            'user_id': user_id,
+            'score': best[0],
+            'achieved_at': best[1],
+        }
+
+
+class Standings:
+    """Every quiz, topic and class board, updated one result at a time.
+
+    Quiz and topic boards rank each user's best score. A class board ranks
+    the sum of the user's best topic scores in that class, so it rewards
+    covering the syllabus rather than one lucky quiz. Applying a result is
+    idempotent and order-independent, which lets every worker fold in the
+    same stream of results without coordinating.
+    """
+
+    def __init__(self):
+        self.boards: Dict[str, Board] = {}
+        # (class_id, user_id) -> best per topic, which a class entry is derived from
+        self._topic_bests: Dict[Tuple[str, str], Dict[str, Best]] = {}
+
+    def board(self, board: str) -> Optional[Board]:
+        return self.boards.get(board)
+
+    def _board(self, board: str) -> Board:
+        found = self.boards.get(board)
+        if found is None:
+            found = self.boards[board] = Board()
+        return found
+
+    def apply(self, user_id: str, quiz_id: str, topic_id: Optional[str], class_id: Optional[str],
+              score: float, achieved_at: str):
+        candidate = (float(score), achieved_at)
+        quiz = self._board(board_id('quiz', quiz_id))
+        if better(candidate, quiz.get(user_id)):
+            quiz.set(user_id, candidate)
+        if not topic_id:
+            return
+
+        topic = self._board(board_id('topic', topic_id))
+        previous = topic.get(user_id)
+        if not better(candidate, previous):
+            return
+        topic.set(user_id, candidate)
+        if class_id:
+            bests = self._topic_bests.setdefault((class_id, user_id), {})
+            bests[topic_id] = candidate
+            # the total dates from its latest contribution, whatever order results arrive in
+            self._board(board_id('class', class_id)).set(
+                user_id, (sum(best[0] for best in bests.values()), max(best[1] for best in bests.values()))
+            )
+
+
+class Leaderboards:
+    """In-memory leaderboards kept current from ``quiz_results``.
+
+    ``rebuild`` computes every board from one aggregation over the results.
+    After that, the local submit paths apply their own results at once, and
+    a poller folds in results written by other workers. It reads the
+    results by ``_id`` from a watermark. ObjectIds are stamped by whichever
+    process wrote them, so the poll window overlaps by ``overlap`` seconds
+    to absorb clock skew and late write-behind batches. Re-applying a result
+    is a no-op.
+    """
+
+    def __init__(self, results, topics, poll_interval: float = 2.0, overlap: float = 10.0):
+        self._results = results
+        self._topics = topics
+        self.poll_interval = poll_interval
+        self.overlap = overlap
+        self.standings = Standings()
+        self.ready = False
+        self._topic_classes: Dict[str, Optional[str]] = {}
+        self._watermark: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {'rebuilds': 0, 'rebuild_seconds': 0.0, 'polls': 0, 'polled_results': 0}
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while not self.ready:
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("Leaderboard rebuild failed, retrying")
+                await asyncio.sleep(self.poll_interval)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Leaderboard poll failed")
+
+    async def _classes_for(self, topic_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        missing = {topic_id for topic_id in topic_ids if topic_id and topic_id not in self._topic_classes}
+        if missing:
+            async for topic in self._topics.find({'id': {'$in': list(missing)}}, {'_id': 0, 'id': 1, 'class_id': 1}):
+                self._topic_classes[topic['id']] = topic.get('class_id')
+        return self._topic_classes
+
+    def record(self, user_id: str, quiz_id: str, topic_id: Optional[str], class_id: Optional[str],
+               score: float, achieved_at: str):
+        """Apply a result written by this worker; the poller will see it again harmlessly."""
+        if topic_id and class_id:
+            self._topic_classes.setdefault(topic_id, class_id)
+        self.standings.apply(user_id, quiz_id, topic_id, class_id, score, achieved_at)
+
+    async def rebuild(self, batch_size: int = 5000):
+        started = datetime.now(timezone.utc)
+        # best attempt per user and quiz; topic and class boards are derived from these
+        pipeline = self._results.aggregate([
+            {'$sort': {'score': -1, 'submitted_at': 1}},
+            {'$group': {
+                '_id': {'user_id': '$user_id', 'quiz_id': '$quiz_id'},
+                'topic_id': {'$first': '$topic_id'},
+                'score': {'$first': '$score'},
+                'achieved_at': {'$first': '$submitted_at'},
+            }},
+        ], allowDiskUse=True, batchSize=batch_size)
+
+        self._topic_classes = {}
+        standings = Standings()
+        best_attempts = 0
+        batch: List[Dict[str, Any]] = []
+        async for row in pipeline:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                await self._apply_best(standings, batch)
+                best_attempts += len(batch)
+                batch = []
+        await self._apply_best(standings, batch)
+        best_attempts += len(batch)
+
+        # results written while the aggregation ran are picked up by the next poll
+        self.standings = standings
+        self._watermark = started
+        self.ready = True
+        self._stats['rebuilds'] += 1
+        self._stats['rebuild_seconds'] = (datetime.now(timezone.utc) - started).total_seconds()
+        logger.info("Leaderboards rebuilt: %d boards from %d best attempts in %.1fs",
+                    len(standings.boards), best_attempts, self._stats['rebuild_seconds'])
+
+    async def _apply_best(self, standings: Standings, rows: List[Dict[str, Any]]):
+        classes = await self._classes_for(row.get('topic_id') for row in rows)
+        for row in rows:
+            topic_id = row.get('topic_id')
+            standings.apply(row['_id']['user_id'], row['_id']['quiz_id'], topic_id, classes.get(topic_id),
+                            row['score'], row['achieved_at'])
+
+    async def poll(self):
+        started = datetime.now(timezone.utc)
+        since = ObjectId.from_datetime(self._watermark - timedelta(seconds=self.overlap))
+        results = await self._results.find(
+            {'_id': {'$gt': since}},
+            {'_id': 0, 'user_id': 1, 'quiz_id': 1, 'topic_id': 1, 'score': 1, 'submitted_at': 1}
+        ).to_list(None)
+        classes = await self._classes_for(result.get('topic_id') for result in results)
+        for result in results:
+            topic_id = result.get('topic_id')
+            self.standings.apply(result['user_id'], result['quiz_id'], topic_id, classes.get(topic_id),
+                                 result['score'], result['submitted_at'])
+        self._watermark = started
+        self._stats['polls'] += 1
+        self._stats['polled_results'] += len(results)
+
+    def top(self, scope: str, scope_id: str, n: int) -> Tuple[int, List[Dict[str, Any]]]:
+        board = self.standings.board(board_id(scope, scope_id))
+        return (len(board), board.top(n)) if board else (0, [])
+
+    def rank(self, scope: str, scope_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        board = self.standings.board(board_id(scope, scope_id))
+        return board.rank(user_id) if board else None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            'ready': self.ready,
+            'boards': len(self.standings.boards),
+            'entries': sum(len(board) for board in self.standings.boards.values()),
+            'watermark': self._watermark.isoformat() if self._watermark else None,
+        }
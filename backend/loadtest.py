@@ -0,0 +1,444 @@
+"""In-process load test and latency benchmark for the API.
+
+Drives ``server.app`` through httpx's ASGI transport with a weighted traffic
+mix (logins, catalog browsing, topic reads, quiz submits, checkout, admin
+analytics), either closed-loop at a fixed concurrency or open-loop at a fixed
+arrival rate. Reports p50/p95/p99 latency, throughput and event-loop lag per
+route, writes them as JSON and fails when they regress against a baseline:
+
+    python loadtest.py --mongo memory --concurrency 32 --duration 30 --out results.json
+    python loadtest.py --mongo memory --rate 200 --duration 30 --baseline baseline.json
+    python loadtest.py --mongo local --seed-data --users 5000 --save-baseline baseline.json
+
+``--mongo memory`` uses mongomock-motor from requirements.txt; ``--mongo local``
+uses MONGO_URL/DB_NAME from the environment or backend/.env. The in-memory
+stand-in runs queries synchronously on the event loop, so its latencies and
+loop lag only make sense compared with other in-memory runs.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).parent
+LAG_INTERVAL = 0.01
+
+# name -> relative weight of each user journey
+DEFAULT_MIX = {
+    'login': 10,
+    'browse': 35,
+    'topic': 25,
+    'quiz': 15,
+    'checkout': 5,
+    'analytics': 2,
+    'progress': 8,
+}
+
+
+def use_memory_mongo():
+    """Swap the motor client for an in-memory stand-in before server.py is imported."""
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("--mongo memory needs the mongomock-motor package (pip install mongomock-motor)")
+    import motor.motor_asyncio
+
+    class MemoryClient(AsyncMongoMockClient):
+        def __init__(self, *args, **kwargs):
+            kwargs.pop('event_listeners', None)
+            super().__init__(*args, **kwargs)
+
+    motor.motor_asyncio.AsyncIOMotorClient = MemoryClient
+    os.environ.setdefault('MONGO_URL', 'mongodb://memory')
+    os.environ.setdefault('DB_NAME', 'loadtest')
+
+
+# ===== MEASUREMENT =====
+
+class LoopLagMonitor:
+    """Samples how late a periodic timer fires, i.e. how long the loop was blocked."""
+
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.times: List[float] = []
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            self.times.append(now)
+            self.lags.append(max(0.0, now - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def max_between(self, start: float, end: float) -> float:
+        # the sample that closes the window still covers time spent inside it
+        lo = bisect.bisect_left(self.times, start)
+        hi = bisect.bisect_right(self.times, end) + 1
+        return max(self.lags[lo:hi], default=0.0)
+
+
+class Recorder:
+    def __init__(self, loop_lag: LoopLagMonitor):
+        self.loop_lag = loop_lag
+        self.samples: Dict[str, List[Tuple[float, float, int]]] = defaultdict(list)
+
+    async def timed(self, route: str, request: Awaitable, started_at: Optional[float] = None):
+        """Await ``request`` and record it; ``started_at`` lets open-loop runs charge queueing delay too."""
+        loop = asyncio.get_running_loop()
+        start = loop.time() if started_at is None else started_at
+        try:
+            response = await request
+            status = response.status_code
+        except Exception:
+            response, status = None, 599
+        self.samples[route].append((start, loop.time(), status))
+        return response
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            latencies = np.array([end - start for start, end, _ in samples]) * 1000
+            lags = np.array([self.loop_lag.max_between(start, end) for start, end, _ in samples]) * 1000
+            routes[route] = {
+                'count': len(samples),
+                'errors': sum(1 for _, _, status in samples if status >= 500),
+                'rejected': sum(1 for _, _, status in samples if 400 <= status < 500),
+                'throughput_rps': len(samples) / duration,
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'p99_ms': float(np.percentile(latencies, 99)),
+                'max_ms': float(latencies.max()),
+                'loop_lag_p99_ms': float(np.percentile(lags, 99)),
+            }
+        lags = np.array(self.loop_lag.lags or [0.0]) * 1000
+        total = sum(route['count'] for route in routes.values())
+        return {
+            'duration_s': duration,
+            'requests': total,
+            'throughput_rps': total / duration,
+            'loop_lag': {
+                'p50_ms': float(np.percentile(lags, 50)),
+                'p99_ms': float(np.percentile(lags, 99)),
+                'max_ms': float(lags.max()),
+            },
+            'routes': routes,
+        }
+
+
+# ===== TRAFFIC =====
+
+class Traffic:
+    """The user journeys in the mix; each one issues a few requests like the frontend would."""
+
+    def __init__(self, client, recorder: Recorder, fixtures: Dict[str, Any], rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.fx = fixtures
+        self.rng = rng
+
+    def _auth(self) -> Dict[str, str]:
+        return {'Authorization': f"Bearer {self.rng.choice(self.fx['tokens'])}"}
+
+    async def login(self, started_at=None):
+        email = self.rng.choice(self.fx['emails'])
+        await self.recorder.timed('POST /api/auth/login', self.client.post(
+            '/api/auth/login', json={'email': email, 'password': self.fx['password']}), started_at)
+
+    async def browse(self, started_at=None):
+        lang = self.rng.choice(('en', 'hi'))
+        await self.recorder.timed('GET /api/classes', self.client.get('/api/classes', params={'lang': lang}), started_at)
+        class_id = self.rng.choice(self.fx['class_ids'])
+        await self.recorder.timed('GET /api/subjects/{class_id}', self.client.get(
+            f'/api/subjects/{class_id}', params={'lang': lang}))
+        subject_id = self.rng.choice(self.fx['subject_ids'])
+        await self.recorder.timed('GET /api/topics/{subject_id}', self.client.get(
+            f'/api/topics/{subject_id}', params={'lang': lang}))
+
+    async def topic(self, started_at=None):
+        topic_id = self.fx['topic_ids'][min(int(self.rng.paretovariate(1.2)) - 1, len(self.fx['topic_ids']) - 1)]
+        lang = self.rng.choice(('en', 'hi'))
+        await self.recorder.timed('GET /api/topic/{topic_id}', self.client.get(
+            f'/api/topic/{topic_id}', params={'lang': lang}), started_at)
+        await self.recorder.timed('GET /api/topic/{topic_id}/rendered', self.client.get(
+            f'/api/topic/{topic_id}/rendered', params={'lang': lang}, headers={'Accept-Encoding': 'gzip'}))
+
+    async def quiz(self, started_at=None):
+        quiz = self.rng.choice(self.fx['quizzes'])
+        await self.recorder.timed('GET /api/quiz/{topic_id}', self.client.get(f"/api/quiz/{quiz['topic_id']}"), started_at)
+        answers = {q['id']: self.rng.choice(q['options']) for q in quiz['questions']}
+        await self.recorder.timed('POST /api/quiz/submit', self.client.post('/api/quiz/submit', headers=self._auth(), json={
+            'quiz_id': quiz['id'], 'topic_id': quiz['topic_id'], 'answers': answers}))
+
+    async def checkout(self, started_at=None):
+        headers = self._auth()
+        book = self.rng.choice(self.fx['books'])
+        response = await self.recorder.timed('POST /api/orders/create', self.client.post(
+            '/api/orders/create', headers=headers,
+            json={'amount': book['price'], 'items': [{'book_id': book['id'], 'quantity': 1}]}), started_at)
+        if response is None or response.status_code != 200:
+            return
+        order_id = response.json()['order_id']
+        payment_id = f'pay_{self.rng.getrandbits(48):012x}'
+        await self.recorder.timed('POST /api/orders/verify', self.client.post('/api/orders/verify', headers=headers, json={
+            'order_id': order_id, 'payment_id': payment_id,
+            'signature': self.fx['sign'](order_id, payment_id)}))
+
+    async def analytics(self, started_at=None):
+        await self.recorder.timed('GET /api/admin/analytics', self.client.get(
+            '/api/admin/analytics', headers={'Authorization': f"Bearer {self.fx['admin_token']}"}), started_at)
+
+    async def progress(self, started_at=None):
+        headers = self._auth()
+        await self.recorder.timed('GET /api/student/progress/summary', self.client.get(
+            '/api/student/progress/summary', headers=headers), started_at)
+        await self.recorder.timed('GET /api/student/progress', self.client.get(
+            '/api/student/progress', headers=headers, params={'limit': 20}))
+
+
+def journey_picker(traffic: Traffic, mix: Dict[str, float], rng: random.Random) -> Callable[[], Callable]:
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    return lambda: getattr(traffic, rng.choices(names, weights)[0])
+
+
+async def closed_loop(pick, concurrency: int, duration: float):
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await pick()()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(pick, rate: float, duration: float, rng: random.Random, max_in_flight: int):
+    """Poisson arrivals at ``rate``/s; latency is measured from the scheduled arrival time."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    arrival = started
+    in_flight = set()
+    dropped = 0
+    while arrival - started < duration:
+        arrival += rng.expovariate(rate)
+        delay = arrival - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            dropped += 1
+            continue
+        task = asyncio.create_task(pick()(started_at=arrival))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    await asyncio.gather(*in_flight)
+    return dropped
+
+
+# ===== SETUP =====
+
+async def load_fixtures(server, users: int) -> Dict[str, Any]:
+    db = server.db
+    user_docs = await db.users.find(
+        {'role': 'student'}, {'_id': 0, 'id': 1, 'name': 1, 'email': 1, 'role': 1, 'language': 1, 'token_version': 1}
+    ).limit(users).to_list(users)
+    admin = await db.users.find_one({'role': 'admin'}, {'_id': 0, 'password': 0})
+    quizzes = await db.quizzes.find(
+        {}, {'_id': 0, 'id': 1, 'topic_id': 1, 'questions.id': 1, 'questions.options': 1}
+    ).limit(500).to_list(500)
+    if not user_docs or not admin or not quizzes:
+        sys.exit("No dataset found; run with --seed-data or seed_data.py --generate first")
+    return {
+        'emails': [user['email'] for user in user_docs],
+        'password': 'student123',
+        'tokens': [server.create_token(user) for user in user_docs],
+        'admin_token': server.create_token(admin),
+        'class_ids': [doc['id'] async for doc in db.classes.find({}, {'_id': 0, 'id': 1})],
+        'subject_ids': [doc['id'] async for doc in db.subjects.find({}, {'_id': 0, 'id': 1}).limit(1000)],
+        'topic_ids': [doc['id'] async for doc in db.topics.find({}, {'_id': 0, 'id': 1}).limit(5000)],
+        'quizzes': quizzes,
+        'books': await db.books.find({}, {'_id': 0, 'id': 1, 'price': 1}).limit(500).to_list(500),
+        'sign': server.payment_gateway.sign,
+    }
+
+
+async def seed(server, args):
+    from synthetic_data import generate, password_hash, det_uuid, GENERATED_COLLECTIONS
+
+    # derived collections too, or rollups and renders from the last run would be served
+    for name in GENERATED_COLLECTIONS:
+        await server.db[name].drop()
+    rounds = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+    as_of = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    await generate(
+        server.db, seed=args.seed, users=args.users, results_per_user=args.results_per_user, topics=args.topics,
+        quiz_ratio=0.5, books=50, bookmarks_per_user=2, orders_per_user=0.3,
+        password_hash=password_hash('student123', args.seed, rounds), as_of=as_of, workers=0
+    )
+    await server.db.users.insert_one({
+        'id': det_uuid(args.seed, 'admin', 0), 'name': 'Admin User', 'email': 'admin@loadtest.local',
+        'password': password_hash('admin123', args.seed, rounds), 'role': 'admin', 'language': 'en',
+        'token_version': 0, 'created_at': as_of.isoformat()
+    })
+
+
+# ===== BASELINE =====
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """Regressions against ``baseline``: tail latency or throughput worse than ``tolerance``."""
+    regressions = []
+    for route, base in baseline.get('routes', {}).items():
+        current = results['routes'].get(route)
+        if current is None:
+            continue
+        for metric in ('p95_ms', 'p99_ms'):
+            if current[metric] > base[metric] * (1 + tolerance) and current[metric] - base[metric] > min_delta_ms:
+                regressions.append(f"{route} {metric}: {base[metric]:.1f} -> {current[metric]:.1f}")
+        if current['errors'] > base.get('errors', 0) and current['errors'] > current['count'] * 0.001:
+            regressions.append(f"{route} errors: {base.get('errors', 0)} -> {current['errors']}")
+    base_rps = baseline.get('throughput_rps', 0)
+    if results['mode'] == baseline.get('mode') == 'closed' and results['throughput_rps'] < base_rps * (1 - tolerance):
+        regressions.append(f"throughput: {base_rps:.0f} -> {results['throughput_rps']:.0f} req/s")
+    return regressions
+
+
+def print_report(results: Dict[str, Any]):
+    print(f"{'route':<40}{'count':>7}{'err':>5}{'rps':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'lag99':>8}")
+    for route, stats in results['routes'].items():
+        print(f"{route:<40}{stats['count']:>7}{stats['errors']:>5}{stats['throughput_rps']:>8.1f}"
+              f"{stats['p50_ms']:>8.1f}{stats['p95_ms']:>8.1f}{stats['p99_ms']:>8.1f}{stats['loop_lag_p99_ms']:>8.1f}")
+    lag = results['loop_lag']
+    print(f"total {results['requests']} requests, {results['throughput_rps']:.1f} req/s, "
+          f"loop lag p99 {lag['p99_ms']:.1f} ms (max {lag['max_ms']:.1f} ms)")
+
+
+def parse_mix(value: Optional[str]) -> Dict[str, float]:
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown journey {name!r} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='In-process load test for the API')
+    parser.add_argument('--mongo', choices=('memory', 'local'), default='memory')
+    parser.add_argument('--seed-data', action='store_true', help='generate a dataset first (always on for memory)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--results-per-user', type=int, default=20)
+    parser.add_argument('--topics', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16, help='closed-loop virtual users')
+    parser.add_argument('--rate', type=float, help='open-loop arrivals per second (overrides --concurrency)')
+    parser.add_argument('--max-in-flight', type=int, default=1000, help='open-loop cap; arrivals beyond it are dropped')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--mix', type=parse_mix, default=None, help='e.g. login=5,browse=40,quiz=20')
+    parser.add_argument('--bcrypt-rounds', type=int, help='override BCRYPT_ROUNDS for the run')
+    parser.add_argument('--out', type=Path, help='write results JSON here')
+    parser.add_argument('--baseline', type=Path, help='fail if results regress against this JSON')
+    parser.add_argument('--save-baseline', type=Path, help='write results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='ignore latency changes smaller than this')
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv(ROOT_DIR / '.env')
+    if args.mongo == 'memory':
+        use_memory_mongo()
+    # checkout must not reach a real gateway
+    os.environ['PAYMENT_GATEWAY'] = 'stub'
+    if args.bcrypt_rounds:
+        os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+
+    import httpx
+    import server
+
+    if args.mongo == 'memory' or args.seed_data:
+        await seed(server, args)
+    await server.app.router.startup()
+
+    rng = random.Random(args.seed)
+    monitor = LoopLagMonitor()
+    recorder = Recorder(monitor)
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=60) as client:
+            traffic = Traffic(client, recorder, await load_fixtures(server, args.users), rng)
+            pick = journey_picker(traffic, args.mix or DEFAULT_MIX, rng)
+
+            if args.warmup:
+                await closed_loop(pick, min(args.concurrency, 8), args.warmup)
+                recorder.samples.clear()
+
+            monitor.start()
+            started_at = time.perf_counter()
+            dropped = 0
+            if args.rate:
+                dropped = await open_loop(pick, args.rate, args.duration, rng, args.max_in_flight)
+            else:
+                await closed_loop(pick, args.concurrency, args.duration)
+            duration = time.perf_counter() - started_at
+            await monitor.stop()
+    finally:
+        await server.app.router.shutdown()
+
+    results = {
+        'mode': 'open' if args.rate else 'closed',
+        'config': {
+            'mongo': args.mongo, 'concurrency': None if args.rate else args.concurrency, 'rate': args.rate,
+            'duration': args.duration, 'mix': args.mix or DEFAULT_MIX, 'seed': args.seed,
+            'bcrypt_rounds': int(os.environ.get('BCRYPT_ROUNDS', '12')),
+        },
+        'dropped': dropped,
+        **recorder.report(duration),
+    }
+    print_report(results)
+    if dropped:
+        print(f"open loop dropped {dropped} arrivals at the in-flight cap")
+
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2))
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get('mode') != results['mode'] or baseline.get('config', {}).get('mongo') != args.mongo:
+            print("Warning: baseline was recorded with a different mode or backend")
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
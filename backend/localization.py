@@ -0,0 +1,42 @@
+from typing import Any, Dict, Iterable, Optional
+
+LANGUAGES = ('en', 'hi')
+BOTH = 'both'
+
+# Content fields stored as <field> (English) and <field>_hi (Hindi)
+BILINGUAL_FIELDS = ('name', 'title', 'description', 'content', 'question')
+# Hindi copies laid over a field answers are graded against, so Hindi clients keep both
+HINDI_OVERLAYS = ('options',)
+
+
+def resolve_language(requested: Optional[str], user: Optional[Dict[str, Any]]) -> str:
+    """Pick the response language: explicit ?lang=, else the user's stored language.
+
+    Anonymous requests without ``lang`` keep getting both languages.
+    """
+    if requested:
+        if requested not in LANGUAGES and requested != BOTH:
+            raise ValueError(f"Unsupported language: {requested}")
+        return requested
+    if user and user.get('language') in LANGUAGES:
+        return user['language']
+    return BOTH
+
+
+def language_projection(lang: str, base: Optional[Dict[str, int]] = None, prefix: str = '',
+                        fields: Iterable[str] = BILINGUAL_FIELDS, overlays: Iterable[str] = ()) -> Dict[str, int]:
+    """Exclusion projection that drops the other language's copy of each field.
+
+    Field names are left as stored, so Hindi clients keep reading ``title_hi``.
+    ``overlays`` only lose their Hindi copy, for English clients.
+    """
+    projection = dict(base if base is not None else {'_id': 0})
+    if lang == BOTH:
+        return projection
+    for field in fields:
+        dropped = f'{field}_hi' if lang == 'en' else field
+        projection[f'{prefix}{dropped}'] = 0
+    if lang == 'en':
+        for field in overlays:
+            projection[f'{prefix}{field}_hi'] = 0
+    return projection
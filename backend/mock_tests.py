@@ -0,0 +1,418 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+
+from grading import Answer, AnswerKey, AnswerKeyCache, grade
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = 'active'
+SUBMITTED = 'submitted'
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class SessionClosed(Exception):
+    pass
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _ts(iso: str) -> float:
+    return datetime.fromisoformat(iso).timestamp()
+
+
+class Session:
+    """In-memory state of one sitting: encoded answers plus a bitset of flags."""
+
+    __slots__ = ('id', 'user_id', 'test_id', 'key', 'responses', 'flags', 'seq', 'started_at', 'deadline', 'dirty')
+
+    def __init__(self, session_id: str, user_id: str, key: AnswerKey, started_at: float, deadline: float):
+        self.id = session_id
+        self.user_id = user_id
+        self.test_id = key.quiz_id
+        self.key = key
+        # one option bitmask per question, so grading needs no decoding
+        self.responses = np.zeros(len(key), dtype=np.int64)
+        self.flags = 0
+        self.seq = 0
+        self.started_at = started_at
+        self.deadline = deadline
+        self.dirty = False
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any], key: AnswerKey) -> 'Session':
+        session = cls(doc['id'], doc['user_id'], key, _ts(doc['started_at']), _ts(doc['deadline']))
+        session.responses = key.encode(doc.get('answers') or {})
+        for question_id in doc.get('flags') or []:
+            position = key.positions.get(question_id)
+            if position is not None:
+                session.flags |= 1 << position
+        session.seq = doc.get('seq', 0)
+        return session
+
+    def flagged(self) -> List[str]:
+        return [qid for position, qid in enumerate(self.key.question_ids) if self.flags >> position & 1]
+
+    def state(self) -> Dict[str, Any]:
+        """The persisted part of the session."""
+        return {'answers': self.key.decode(self.responses), 'flags': self.flagged(), 'seq': self.seq}
+
+    def view(self, now: float) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'test_id': self.test_id,
+            'status': ACTIVE,
+            'started_at': _iso(self.started_at),
+            'deadline': _iso(self.deadline),
+            'remaining_seconds': max(0.0, round(self.deadline - now, 1)),
+            **self.state(),
+        }
+
+
+class MockTestEngine:
+    """Server-timed mock test sittings with batched autosave.
+
+    Sessions live in memory while active. Answer deltas only touch that
+    state; dirty sessions are written back together every
+    ``flush_interval`` seconds, so a whole school answering at once costs
+    one bulk write per interval instead of one write per click. Deltas carry
+    an increasing ``seq`` so retries are idempotent and clients can resend
+    whatever came after the last flushed ``seq`` after a crash.
+
+    The deadline is fixed when the session starts. Deltas are accepted for
+    ``grace`` seconds past it to absorb network latency, after which the
+    session is submitted and graded by the timer; sessions expiring together
+    are graded as one matrix per test.
+
+    Each session document names the engine that holds it in ``owner``, and
+    every write is conditional on it. A request for a session this worker
+    doesn't hold claims it, atomically reading its last flushed state; the
+    previous holder's next write then matches nothing and it lets the
+    session go, dropping deltas it hadn't flushed, which the client resends
+    from the ``seq`` it is told. Routing a session's requests to one worker
+    avoids that churn. Sessions whose holder died are claimed on their next
+    request, or by the sweep once they are ``orphan_after`` seconds overdue.
+    """
+
+    def __init__(self, collection, keys: AnswerKeyCache, flush_interval: float = 5.0, grace: float = 5.0,
+                 tick: float = 1.0, orphan_after: float = 60.0):
+        self._collection = collection
+        self._keys = keys
+        self.flush_interval = flush_interval
+        self.grace = grace
+        self.tick = tick
+        self.orphan_after = orphan_after
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+        self._sessions: Dict[str, Session] = {}
+        self._by_user: Dict[Tuple[str, str], str] = {}
+        self._deadlines: List[Tuple[float, str]] = []
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._starting: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._last_flush = time.time()
+        self._stats = {'started': 0, 'deltas': 0, 'stale_deltas': 0, 'flushes': 0, 'flushed_sessions': 0,
+                       'submitted': 0, 'auto_submitted': 0, 'restored': 0, 'lost': 0, 'swept': 0}
+
+    # ===== LIFECYCLE =====
+
+    async def start(self):
+        # sessions held before a restart are claimed when next used, or swept once overdue
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.expire()
+                if time.time() - self._last_flush >= self.flush_interval:
+                    await self.flush()
+                    await self.sweep()
+            except Exception:
+                logger.exception("Mock test timer failed")
+
+    def _hold(self, session: Session):
+        self._sessions[session.id] = session
+        self._by_user[(session.user_id, session.test_id)] = session.id
+        heapq.heappush(self._deadlines, (session.deadline + self.grace, session.id))
+
+    def _release(self, session: Session):
+        self._sessions.pop(session.id, None)
+        self._by_user.pop((session.user_id, session.test_id), None)
+        self._locks.pop(session.id, None)
+
+    def _lock(self, session_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(session_id, asyncio.Lock())
+
+    async def _claim(self, query: Dict[str, Any]) -> Optional[Session]:
+        """Take over an active session from whichever worker held it, with its last flushed state."""
+        doc = await self._collection.find_one_and_update(
+            {**query, 'status': ACTIVE}, {'$set': {'owner': self.owner}}, {'_id': 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            return None
+        held = self._sessions.get(doc['id'])
+        if held is not None:
+            return held
+        key = await self._keys.get(doc['test_id'])
+        if key is None:
+            logger.warning("Mock test %s of session %s no longer exists", doc['test_id'], doc['id'])
+            return None
+        session = Session.from_doc(doc, key)
+        self._hold(session)
+        self._stats['restored'] += 1
+        return session
+
+    async def _lost(self, sessions: List[Session]) -> List[Session]:
+        """Sessions another worker claimed since this one last wrote them; they are released."""
+        taken = {
+            doc['id'] async for doc in self._collection.find(
+                {'id': {'$in': [session.id for session in sessions]}, 'owner': {'$ne': self.owner}},
+                {'_id': 0, 'id': 1}
+            )
+        }
+        lost = [session for session in sessions if session.id in taken]
+        for session in lost:
+            self._release(session)
+        if lost:
+            self._stats['lost'] += len(lost)
+            logger.warning("%d mock test sessions were claimed by another worker", len(lost))
+        return lost
+
+    # ===== SESSIONS =====
+
+    async def begin(self, user_id: str, key: AnswerKey, duration_minutes: float) -> Dict[str, Any]:
+        """Start a sitting, or resume the user's active one for this test.
+
+        Concurrent starts for one user and test share a single attempt, so a
+        double click can't open two active sessions.
+        """
+        slot = (user_id, key.quiz_id)
+        task = self._starting.get(slot)
+        if task is None:
+            task = asyncio.ensure_future(self._begin(user_id, key, duration_minutes))
+            self._starting[slot] = task
+            task.add_done_callback(lambda _: self._starting.pop(slot, None))
+        return await asyncio.shield(task)
+
+    async def _begin(self, user_id: str, key: AnswerKey, duration_minutes: float) -> Dict[str, Any]:
+        now = time.time()
+        session_id = self._by_user.get((user_id, key.quiz_id))
+        session = self._sessions.get(session_id) if session_id is not None \
+            else await self._claim({'user_id': user_id, 'test_id': key.quiz_id})
+        if session is not None:
+            if now <= session.deadline + self.grace:
+                return session.view(now)
+            await self._submit([session], by='timer')
+
+        session = Session(str(uuid.uuid4()), user_id, key, now, now + duration_minutes * 60)
+        # written at once so the sitting and its deadline survive a restart
+        await self._collection.insert_one({
+            'id': session.id,
+            'user_id': user_id,
+            'test_id': key.quiz_id,
+            'status': ACTIVE,
+            'owner': self.owner,
+            'started_at': _iso(session.started_at),
+            'deadline': _iso(session.deadline),
+            **session.state(),
+            'updated_at': _iso(now),
+        })
+        self._hold(session)
+        self._stats['started'] += 1
+        return session.view(now)
+
+    async def _owned(self, session_id: str, user_id: str) -> Session:
+        session = self._sessions.get(session_id)
+        if session is not None and session.user_id == user_id:
+            return session
+        session = await self._claim({'id': session_id, 'user_id': user_id})
+        if session is None:
+            doc = await self._collection.find_one({'id': session_id, 'user_id': user_id}, {'_id': 0, 'status': 1})
+            if doc is None:
+                raise SessionNotFound(session_id)
+            raise SessionClosed(session_id)
+        return session
+
+    async def get(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        session = self._sessions.get(session_id)
+        if session is not None and session.user_id == user_id:
+            return session.view(time.time())
+        doc = await self._collection.find_one({'id': session_id, 'user_id': user_id},
+                                              {'_id': 0, 'updated_at': 0, 'owner': 0})
+        if not doc:
+            raise SessionNotFound(session_id)
+        if doc.get('status') == ACTIVE:
+            # held by another worker, or by none since a restart
+            doc['remaining_seconds'] = max(0.0, round(_ts(doc['deadline']) - time.time(), 1))
+        return doc
+
+    async def apply(self, session_id: str, user_id: str, seq: int, answers: Dict[str, Answer],
+                    flags: Dict[str, bool]) -> Dict[str, Any]:
+        """Apply one answer delta; ValueError for unknown questions or options."""
+        session = await self._owned(session_id, user_id)
+        async with self._lock(session_id):
+            now = time.time()
+            # submitted while this delta waited for the lock
+            if session.id not in self._sessions or now > session.deadline + self.grace:
+                raise SessionClosed(session_id)
+            applied = seq > session.seq
+            if applied:
+                # validate the whole delta before touching the session
+                updates = [session.key.encode_answer(qid, answer) for qid, answer in answers.items()]
+                flag_updates = [(session.key.encode_answer(qid, None)[0], on) for qid, on in flags.items()]
+                for position, mask in updates:
+                    session.responses[position] = mask
+                for position, on in flag_updates:
+                    session.flags = session.flags | 1 << position if on else session.flags & ~(1 << position)
+                session.seq = seq
+                session.dirty = True
+                self._stats['deltas'] += 1
+            else:
+                self._stats['stale_deltas'] += 1
+            return {
+                'seq': session.seq,
+                'applied': applied,
+                'remaining_seconds': max(0.0, round(session.deadline - now, 1)),
+            }
+
+    async def submit(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        session = await self._owned(session_id, user_id)
+        async with self._lock(session_id):
+            if session.id not in self._sessions:
+                raise SessionClosed(session_id)
+            lost = await self._submit([session], by='student')
+        if lost:
+            # another worker had taken it over; submit its latest state instead
+            session = await self._claim({'id': session_id, 'user_id': user_id})
+            if session is not None:
+                async with self._lock(session_id):
+                    await self._submit([session], by='student')
+        return await self.get(session_id, user_id)
+
+    # ===== PERSISTENCE =====
+
+    async def flush(self):
+        """Write every session changed since the last flush in one unordered bulk write."""
+        self._last_flush = time.time()
+        dirty = [session for session in self._sessions.values() if session.dirty]
+        if not dirty:
+            return
+        now = _iso(time.time())
+        for session in dirty:
+            session.dirty = False
+        try:
+            result = await self._collection.bulk_write([
+                UpdateOne({'id': session.id, 'status': ACTIVE, 'owner': self.owner},
+                          {'$set': {**session.state(), 'updated_at': now}})
+                for session in dirty
+            ], ordered=False)
+            lost = await self._lost(dirty) if result.matched_count < len(dirty) else []
+        except PyMongoError:
+            logger.exception("Mock test autosave failed for %d sessions, retrying next tick", len(dirty))
+            for session in dirty:
+                session.dirty = True
+            return
+        self._stats['flushes'] += 1
+        self._stats['flushed_sessions'] += len(dirty) - len(lost)
+
+    async def sweep(self, limit: int = 500):
+        """Submit sessions left overdue by a worker that went away."""
+        cutoff = _iso(time.time() - self.grace - self.orphan_after)
+        overdue = await self._collection.find(
+            {'status': ACTIVE, 'deadline': {'$lt': cutoff}}, {'_id': 0, 'id': 1}
+        ).to_list(limit)
+        claimed = []
+        for doc in overdue:
+            if doc['id'] not in self._sessions:
+                session = await self._claim({'id': doc['id']})
+                if session is not None:
+                    claimed.append(session)
+        if claimed:
+            await self._submit(claimed, by='timer')
+            self._stats['swept'] += len(claimed)
+
+    async def expire(self):
+        now = time.time()
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, session_id = heapq.heappop(self._deadlines)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                expired.append(session)
+        if not expired:
+            return
+        try:
+            await self._submit(expired, by='timer')
+        except PyMongoError:
+            logger.exception("Auto-submit failed for %d sessions, retrying next tick", len(expired))
+            for session in expired:
+                heapq.heappush(self._deadlines, (now + self.tick, session.id))
+
+    async def _submit(self, sessions: List[Session], by: str) -> List[Session]:
+        """Grade and store the sessions; returns those another worker had claimed, which were not written."""
+        by_test: Dict[str, List[Session]] = {}
+        for session in sessions:
+            by_test.setdefault(session.test_id, []).append(session)
+
+        now = _iso(time.time())
+        operations = []
+        for test_sessions in by_test.values():
+            key = test_sessions[0].key
+            graded = grade(key, np.stack([session.responses for session in test_sessions]))
+            max_marks = float(key.marks.sum())
+            for i, session in enumerate(test_sessions):
+                operations.append(UpdateOne({'id': session.id, 'status': ACTIVE, 'owner': self.owner}, {'$set': {
+                    **session.state(),
+                    'status': SUBMITTED,
+                    'submitted_at': now,
+                    'submitted_by': by,
+                    'result': {
+                        'score': float(graded['score'][i]),
+                        'correct': int(graded['correct'][i]),
+                        'answered': int(np.count_nonzero(session.responses)),
+                        'total': len(key),
+                        'marks': float(graded['marks'][i]),
+                        'max_marks': max_marks,
+                    },
+                    'updated_at': now,
+                }}))
+
+        # released only once the result is stored, so a failed write can be retried
+        result = await self._collection.bulk_write(operations, ordered=False)
+        lost = await self._lost(sessions) if result.matched_count < len(operations) else []
+        for session in sessions:
+            self._release(session)
+        submitted = len(sessions) - len(lost)
+        self._stats['submitted'] += submitted
+        if by == 'timer':
+            self._stats['auto_submitted'] += submitted
+        return lost
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self._stats, 'active': len(self._sessions),
+                'dirty': sum(1 for session in self._sessions.values() if session.dirty)}
@@ -0,0 +1,70 @@
+import base64
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import orjson
+from pymongo import DESCENDING
+
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_value: Any, doc_id: str) -> str:
+    raw = json.dumps([sort_value, doc_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, doc_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    # sort fields are ISO timestamps; anything else (e.g. {'$gt': ''}) would be a query operator
+    if not isinstance(doc_id, str) or not (sort_value is None or isinstance(sort_value, str)):
+        raise InvalidCursor("Invalid cursor")
+    return sort_value, doc_id
+
+
+def keyset_query(query: Dict[str, Any], sort_field: str, cursor: Optional[str]) -> Dict[str, Any]:
+    """Restrict ``query`` to documents after ``cursor`` in (sort_field, id) descending order."""
+    if not cursor:
+        return query
+    sort_value, doc_id = decode_cursor(cursor)
+    return {
+        **query,
+        '$or': [
+            {sort_field: {'$lt': sort_value}},
+            {sort_field: sort_value, 'id': {'$lt': doc_id}},
+        ]
+    }
+
+
+def keyset_find(collection, query: Dict[str, Any], sort_field: str, cursor: Optional[str],
+                projection: Dict[str, Any], limit: Optional[int] = None):
+    find = collection.find(
+        keyset_query(query, sort_field, cursor),
+        projection
+    ).sort([(sort_field, DESCENDING), ('id', DESCENDING)])
+    if limit:
+        find = find.limit(limit)
+    return find
+
+
+async def keyset_page(collection, query: Dict[str, Any], sort_field: str, cursor: Optional[str],
+                      projection: Dict[str, Any], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    docs = await keyset_find(collection, query, sort_field, cursor, projection, limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1].get(sort_field), docs[-1]['id'])
+    return docs, next_cursor
+
+
+async def ndjson_lines(find) -> AsyncIterator[bytes]:
+    async for doc in find:
+        yield orjson.dumps(doc, option=orjson.OPT_APPEND_NEWLINE)
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any
+
+import bcrypt
+
+
+class HasherOverloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+# Module level so they can be shipped to a process pool
+def _hashpw(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_cost(hashed: str) -> int:
+    # $2b$12$<salt+hash>
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded worker pool so it never blocks the event loop.
+
+    At most ``max_workers`` hashes run at once and at most ``max_queue``
+    callers wait for a slot; anything beyond that is rejected straight away
+    with ``HasherOverloaded`` so the API can answer 503 instead of piling up.
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: int = 4, max_queue: int = 64,
+                 retry_after: int = 2, use_processes: bool = False):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        if use_processes:
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            # bcrypt releases the GIL while hashing, so threads scale fine
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        self._slots = asyncio.Semaphore(max_workers)
+        self._queued = 0
+        self._running = 0
+        self._stats = {
+            'hash_calls': 0,
+            'verify_calls': 0,
+            'rejected': 0,
+            'rehashed': 0,
+            'queue_wait_seconds_total': 0.0,
+            'queue_wait_seconds_max': 0.0,
+            'hash_seconds_total': 0.0,
+            'hash_seconds_max': 0.0,
+        }
+
+    async def _run(self, fn, *args):
+        if self._queued >= self.max_queue:
+            self._stats['rejected'] += 1
+            raise HasherOverloaded(self.retry_after)
+
+        self._queued += 1
+        enqueued_at = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+
+        started_at = time.perf_counter()
+        wait = started_at - enqueued_at
+        self._stats['queue_wait_seconds_total'] += wait
+        self._stats['queue_wait_seconds_max'] = max(self._stats['queue_wait_seconds_max'], wait)
+
+        self._running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._running -= 1
+            self._slots.release()
+            elapsed = time.perf_counter() - started_at
+            self._stats['hash_seconds_total'] += elapsed
+            self._stats['hash_seconds_max'] = max(self._stats['hash_seconds_max'], elapsed)
+
+    async def hash(self, password: str) -> str:
+        self._stats['hash_calls'] += 1
+        return await self._run(_hashpw, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        self._stats['verify_calls'] += 1
+        return await self._run(_checkpw, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return hash_cost(hashed) != self.rounds
+
+    def record_rehash(self):
+        self._stats['rehashed'] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'rounds': self.rounds,
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'queued': self._queued,
+            'running': self._running,
+            **self._stats,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,202 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class CircuitOpen(PaymentGatewayError):
+    def __init__(self, retry_after: int):
+        super().__init__("Payment gateway temporarily unavailable")
+        self.retry_after = retry_after
+
+
+class _Retryable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets a single
+    trial call through once ``reset_timeout`` seconds have passed."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half-open' and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 0
+        return max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+class PaymentGateway(ABC):
+    def __init__(self, key_id: str, key_secret: str):
+        self.key_id = key_id
+        self._key_secret = key_secret
+
+    @abstractmethod
+    async def create_order(self, amount: int, currency: str, receipt: str) -> Dict[str, Any]:
+        """Create an order for ``amount`` in the smallest currency unit.
+
+        ``receipt`` is our own order id and doubles as the idempotency key.
+        """
+
+    def sign(self, order_id: str, payment_id: str) -> str:
+        message = f'{order_id}|{payment_id}'.encode('utf-8')
+        return hmac.new(self._key_secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+    def verify_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        return hmac.compare_digest(self.sign(order_id, payment_id), signature or '')
+
+    async def close(self):
+        pass
+
+
+class RazorpayGateway(PaymentGateway):
+    BASE_URL = 'https://api.razorpay.com/v1'
+
+    def __init__(self, key_id: str, key_secret: str, timeout: float = 5.0, max_retries: int = 2,
+                 max_connections: int = 20, breaker: Optional[CircuitBreaker] = None):
+        super().__init__(key_id, key_secret)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._client = httpx.AsyncClient(
+            base_url=self.BASE_URL,
+            auth=(key_id, key_secret),
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    @staticmethod
+    def _body(response: httpx.Response) -> Optional[Dict[str, Any]]:
+        # proxies and load balancers answer with HTML or nothing at all
+        try:
+            body = response.json() if response.content else None
+        except ValueError:
+            return None
+        return body if isinstance(body, dict) else None
+
+    async def _call(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        try:
+            response = await self._client.request(method, path, **kwargs)
+        except httpx.TransportError as e:
+            raise _Retryable(str(e)) from e
+        if response.status_code == 429 or response.status_code >= 500:
+            raise _Retryable(f'HTTP {response.status_code}')
+        body = self._body(response)
+        if response.status_code >= 400:
+            error = (body or {}).get('error') or {}
+            description = error.get('description') if isinstance(error, dict) else None
+            raise PaymentGatewayError(description or f'HTTP {response.status_code}')
+        if body is None:
+            raise _Retryable(f'Unreadable response (HTTP {response.status_code})')
+        return body
+
+    async def _find_by_receipt(self, receipt: str) -> Optional[Dict[str, Any]]:
+        found = await self._call('GET', '/orders', params={'receipt': receipt})
+        items = found.get('items') or []
+        return items[0] if items else None
+
+    async def create_order(self, amount: int, currency: str, receipt: str) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            raise CircuitOpen(self.breaker.retry_after())
+
+        payload = {'amount': amount, 'currency': currency, 'receipt': receipt, 'payment_capture': 1}
+        last_error = None
+        healthy = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    # A previous attempt may have reached Razorpay before failing,
+                    # so look the receipt up before creating a second order
+                    existing = await self._find_by_receipt(receipt) if attempt else None
+                    order = existing or await self._call('POST', '/orders', json=payload)
+                    healthy = True
+                    return order
+                except _Retryable as e:
+                    last_error = e
+                    if attempt < self.max_retries:
+                        await asyncio.sleep(0.2 * 2 ** attempt)
+                except PaymentGatewayError:
+                    # The gateway answered, so it is healthy even if it said no
+                    healthy = True
+                    raise
+            raise PaymentGatewayError(f'Gateway unreachable: {last_error}')
+        finally:
+            # Every way out settles the call, so a half-open trial is never left in flight
+            if healthy:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class StubGateway(PaymentGateway):
+    """Local stand-in for Razorpay used for offline development and load tests."""
+
+    def __init__(self, key_id: str = 'rzp_test_stub', key_secret: str = 'stub_secret', latency: float = 0.0):
+        super().__init__(key_id, key_secret)
+        self.latency = latency
+        self._orders: Dict[str, Dict[str, Any]] = {}
+
+    async def create_order(self, amount: int, currency: str, receipt: str) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if receipt not in self._orders:
+            self._orders[receipt] = {
+                'id': f'order_{secrets.token_hex(7)}',
+                'entity': 'order',
+                'amount': amount,
+                'currency': currency,
+                'receipt': receipt,
+                'status': 'created',
+            }
+        return self._orders[receipt]
+
+
+def create_gateway(name: str, key_id: str, key_secret: str, timeout: float = 5.0,
+                   max_retries: int = 2, stub_latency: float = 0.0) -> PaymentGateway:
+    if name == 'stub':
+        return StubGateway(key_id, key_secret, latency=stub_latency)
+    return RazorpayGateway(key_id, key_secret, timeout=timeout, max_retries=max_retries)
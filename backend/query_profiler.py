@@ -0,0 +1,329 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+from instrumentation import BACKGROUND, current_request
+
+logger = logging.getLogger(__name__)
+
+# Commands worth fingerprinting and which part of them defines the query shape
+SHAPE_FIELDS = {
+    'find': ('filter', 'sort', 'projection'),
+    'aggregate': ('pipeline',),
+    'count': ('query',),
+    'distinct': ('key', 'query'),
+    'findAndModify': ('query', 'sort'),
+    'update': ('updates',),
+    'delete': ('deletes',),
+}
+# Read commands can be explained without side effects
+EXPLAINABLE = {'find', 'aggregate', 'count', 'distinct'}
+# Session and cluster bookkeeping that explain does not accept or need
+_COMMAND_METADATA = {'lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'readConcern', 'writeConcern',
+                     'cursor', 'batchSize', 'singleBatch', 'let', 'apiVersion', 'apiStrict', 'apiDeprecationErrors'}
+# Keys whose values are field names rather than values, so they stay part of the shape
+_STRUCTURAL = {'sort', 'projection', 'key', '$project', '$group', '$sort', '$unwind', '$lookup', '$count',
+               '$replaceRoot', '$addFields', '$set', '$unset', '$facet', '$sortByCount', '$bucket'}
+
+
+def shape(value: Any, structural: bool = False) -> Any:
+    """The query with every literal replaced by '?', keeping field names and operators."""
+    if isinstance(value, dict):
+        return {key: shape(inner, structural or key in _STRUCTURAL) for key, inner in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $in lists and update batches of any length share one shape
+        shapes = [shape(item, structural) for item in value]
+        unique = []
+        for item in shapes:
+            if item not in unique:
+                unique.append(item)
+        return unique
+    if structural:
+        return value if isinstance(value, (str, int, float, bool)) or value is None else '?'
+    return '?'
+
+
+def fingerprint(command_name: str, command: Dict[str, Any]) -> Tuple[str, str, str]:
+    """(id, collection, normalized text) for a monitored command."""
+    collection = command.get(command_name)
+    collection = collection if isinstance(collection, str) else ''
+    parts = {field: shape(command[field], field in _STRUCTURAL) for field in SHAPE_FIELDS[command_name]
+             if field in command}
+    text = f"{collection}.{command_name} {json.dumps(parts, default=str)}"
+    return hashlib.sha1(text.encode()).hexdigest()[:16], collection, text
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _find_key(document: Any, key: str) -> Optional[Any]:
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        values = document.values()
+    elif isinstance(document, list):
+        values = document
+    else:
+        return None
+    for value in values:
+        found = _find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for key in ('inputStage', 'queryPlan'):
+            stages.extend(_plan_stages(plan.get(key)))
+        for child in plan.get('inputStages', []):
+            stages.extend(_plan_stages(child))
+    return stages
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Docs/keys examined versus returned and the winning plan's stages.
+
+    Aggregations nest the find-layer explain under ``stages[0].$cursor``,
+    so both values are looked up wherever they appear.
+    """
+    stats = _find_key(explain, 'executionStats') or {}
+    stages = _plan_stages(_find_key(explain, 'winningPlan'))
+    returned = stats.get('nReturned', 0)
+    docs_examined = stats.get('totalDocsExamined', 0)
+    return {
+        'returned': returned,
+        'docs_examined': docs_examined,
+        'keys_examined': stats.get('totalKeysExamined', 0),
+        'execution_ms': stats.get('executionTimeMillis', 0),
+        'examined_per_returned': round(docs_examined / returned, 2) if returned else float(docs_examined),
+        'plan': stages,
+        'collection_scan': 'COLLSCAN' in stages,
+    }
+
+
+class QueryShape:
+    __slots__ = ('id', 'collection', 'command', 'text', 'count', 'errors', 'total_ms', 'max_ms',
+                 'recent', 'routes', 'first_seen', 'last_seen', 'last_explained')
+
+    def __init__(self, shape_id: str, collection: str, command: str, text: str, window: int):
+        self.id = shape_id
+        self.collection = collection
+        self.command = command
+        self.text = text
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+        self.routes: Set[str] = set()
+        self.first_seen = self.last_seen = time.time()
+        self.last_explained = 0.0
+
+    def record(self, ms: float, ok: bool, route: str):
+        self.count += 1
+        self.errors += 0 if ok else 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.recent.append(ms)
+        if len(self.routes) < 20:
+            self.routes.add(route)
+        self.last_seen = time.time()
+
+    def report(self) -> Dict[str, Any]:
+        ordered = sorted(self.recent)
+        return {
+            'id': self.id,
+            'collection': self.collection,
+            'command': self.command,
+            'shape': self.text,
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': round(_percentile(ordered, 0.50), 3),
+            'p95_ms': round(_percentile(ordered, 0.95), 3),
+            'routes': sorted(self.routes),
+            'first_seen': datetime.fromtimestamp(self.first_seen, timezone.utc).isoformat(),
+            'last_seen': datetime.fromtimestamp(self.last_seen, timezone.utc).isoformat(),
+        }
+
+
+class QueryProfiler(monitoring.CommandListener):
+    """Fingerprints every query shape and explains the slow ones.
+
+    Each monitored command is reduced to its shape (collection, command and
+    the filter/pipeline with literals replaced by '?') and timed into a
+    rolling window. When a read takes longer than ``slow_ms``, it is re-run
+    as ``explain`` with ``executionStats`` verbosity, at most once per
+    ``explain_interval`` seconds per shape, and the summary is upserted into
+    ``samples`` so it survives restarts and is shared by every worker.
+    """
+
+    def __init__(self, slow_ms: float = 100.0, explain_interval: float = 300.0,
+                 window: int = 200, max_shapes: int = 2000, enabled: bool = True):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.explain_interval = explain_interval
+        self.window = window
+        self.max_shapes = max_shapes
+        self._shapes: 'OrderedDict[str, QueryShape]' = OrderedDict()
+        self._pending: Dict[Tuple[Any, int], Tuple[str, Optional[Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self._samples = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._explaining: Set[str] = set()
+        self.explains = 0
+
+    def attach(self, db, samples):
+        """Enable explain capture; call from the event loop once the database is known."""
+        self._db = db
+        self._samples = samples
+        self._loop = asyncio.get_running_loop()
+
+    # ===== LISTENER =====
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if not self.enabled or event.command_name not in SHAPE_FIELDS:
+            return
+        shape_id, collection, text = fingerprint(event.command_name, event.command)
+        explainable = event.command_name in EXPLAINABLE and not any(
+            '$out' in stage or '$merge' in stage for stage in event.command.get('pipeline', [])
+        )
+        with self._lock:
+            if shape_id not in self._shapes:
+                if len(self._shapes) >= self.max_shapes:
+                    self._shapes.popitem(last=False)
+                self._shapes[shape_id] = QueryShape(shape_id, collection, event.command_name, text, self.window)
+            self._shapes.move_to_end(shape_id)
+            # the command is only kept until it finishes, in case it turns out to be slow
+            self._pending[(event.connection_id, event.request_id)] = (
+                shape_id, event.command if explainable else None
+            )
+
+    def _finished(self, event, ok: bool):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+            if pending is None:
+                return
+            shape_id, command = pending
+            query_shape = self._shapes.get(shape_id)
+            if query_shape is None:
+                return
+            ms = event.duration_micros / 1000
+            stats = current_request.get()
+            query_shape.record(ms, ok, stats.route if stats is not None else BACKGROUND)
+
+            explain = (
+                ok and command is not None and ms >= self.slow_ms and self._loop is not None
+                and shape_id not in self._explaining
+                and time.time() - query_shape.last_explained >= self.explain_interval
+            )
+            if explain:
+                self._explaining.add(shape_id)
+                query_shape.last_explained = time.time()
+        if explain:
+            # listeners run on Motor's executor threads; the explain runs on the loop
+            self._loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(self.explain(query_shape, command, ms))
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finished(event, True)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finished(event, False)
+
+    # ===== EXPLAIN =====
+
+    async def explain(self, query_shape: QueryShape, command: Dict[str, Any], observed_ms: float):
+        inner = {key: value for key, value in command.items() if key not in _COMMAND_METADATA}
+        if query_shape.command == 'aggregate':
+            # explain wraps the aggregate without its cursor options
+            inner['cursor'] = {}
+        try:
+            result = await self._db.command({'explain': inner, 'verbosity': 'executionStats'})
+            sample = {
+                **summarize_explain(result),
+                'observed_ms': round(observed_ms, 3),
+                # literals stripped like the fingerprint, so user data never lands in the samples
+                'command': {
+                    query_shape.command: query_shape.collection,
+                    **{key: shape(value, key in _STRUCTURAL) for key, value in inner.items()
+                       if key != query_shape.command},
+                },
+                'explained_at': datetime.now(timezone.utc).isoformat(),
+            }
+            await self._samples.update_one(
+                {'_id': query_shape.id},
+                {'$set': {'collection': query_shape.collection, 'command_name': query_shape.command,
+                          'shape': query_shape.text, 'sample': sample},
+                 '$inc': {'explains': 1}},
+                upsert=True
+            )
+            self.explains += 1
+            if sample['collection_scan']:
+                logger.warning("Slow query scans %s (%d examined for %d returned): %s",
+                               query_shape.collection, sample['docs_examined'], sample['returned'],
+                               query_shape.text)
+        except PyMongoError as e:
+            logger.warning("Could not explain %s: %s", query_shape.text, e)
+        finally:
+            with self._lock:
+                self._explaining.discard(query_shape.id)
+
+    # ===== REPORTING =====
+
+    async def report(self, sort: str = 'total_ms', limit: int = 50,
+                     collection: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            rows = [s.report() for s in self._shapes.values() if collection in (None, s.collection)]
+        rows.sort(key=lambda row: -row.get(sort, 0))
+        rows = rows[:limit]
+
+        samples = {}
+        if self._samples is not None and rows:
+            samples = {
+                doc['_id']: doc
+                async for doc in self._samples.find({'_id': {'$in': [row['id'] for row in rows]}})
+            }
+        for row in rows:
+            stored = samples.get(row['id'])
+            row['explain'] = stored['sample'] if stored else None
+        return {
+            'slow_ms': self.slow_ms,
+            'shapes_tracked': len(self._shapes),
+            'explains': self.explains,
+            'queries': rows,
+        }
+
+    async def unindexed(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Stored samples whose winning plan scanned the whole collection, worst first."""
+        if self._samples is None:
+            return []
+        cursor = self._samples.find({'sample.collection_scan': True}).sort('sample.docs_examined', -1)
+        return [
+            {'id': doc['_id'], 'collection': doc.get('collection'), 'shape': doc.get('shape'), **doc['sample']}
+            for doc in await cursor.to_list(limit)
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
@@ -0,0 +1,298 @@
+import hashlib
+import logging
+import random
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import jwt
+from pymongo import ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+DEFAULT_MIX = {'easy': 0.3, 'medium': 0.5, 'hard': 0.2}
+SCOPES = ('topic', 'subject', 'class')
+
+# Never sent with an assembled paper
+ANSWER_FIELDS = ('correct_answer', 'explanation')
+
+
+class InvalidPaper(Exception):
+    pass
+
+
+class Pool:
+    """Question positions with O(1) add/remove and O(k) random draws."""
+
+    __slots__ = ('items', 'index')
+
+    def __init__(self):
+        self.items: List[int] = []
+        self.index: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, position: int):
+        if position not in self.index:
+            self.index[position] = len(self.items)
+            self.items.append(position)
+
+    def remove(self, position: int):
+        i = self.index.pop(position, None)
+        if i is None:
+            return
+        last = self.items.pop()
+        if last != position:
+            self.items[i] = last
+            self.index[last] = i
+
+    def draw(self, rng: random.Random) -> Iterator[int]:
+        """Positions in random order without repeats, each in O(1).
+
+        A Fisher-Yates shuffle run lazily over a virtual copy, so taking k
+        items costs O(k) whatever the pool size.
+        """
+        n = len(self.items)
+        swapped: Dict[int, int] = {}
+        for i in range(n):
+            j = rng.randrange(i, n)
+            picked = swapped.get(j, j)
+            swapped[j] = swapped.get(i, i)
+            yield self.items[picked]
+
+
+def allocate(count: int, mix: Dict[str, float]) -> Dict[str, int]:
+    """Split ``count`` across difficulties in proportion to ``mix`` (largest remainder)."""
+    total = sum(weight for weight in mix.values() if weight > 0)
+    if not total:
+        raise ValueError("Difficulty mix must have a positive weight")
+    shares = {d: count * mix.get(d, 0) / total for d in DIFFICULTIES if mix.get(d, 0) > 0}
+    counts = {d: int(share) for d, share in shares.items()}
+    for d in sorted(shares, key=lambda d: shares[d] - counts[d], reverse=True)[:count - sum(counts.values())]:
+        counts[d] += 1
+    return counts
+
+
+def shuffled_options(question: Dict[str, Any], seed: int) -> Dict[str, Any]:
+    """The question with its options in a per-paper order; answers are graded by option text."""
+    options = list(question.get('options') or [])
+    rng = random.Random(f"{seed}:{question['id']}")
+    order = list(range(len(options)))
+    rng.shuffle(order)
+    shuffled = {**question, 'options': [options[i] for i in order]}
+    if len(question.get('options_hi') or []) == len(options):
+        shuffled['options_hi'] = [question['options_hi'][i] for i in order]
+    return shuffled
+
+
+class QuestionBank:
+    """In-memory index over the ``questions`` collection.
+
+    Every question sits in one pool per (scope, id, difficulty) for its
+    topic, subject and class, and in one per tag. Assembling a paper draws
+    from the smallest pool matching the request, so the cost follows the
+    number of questions asked for, not the size of the bank. Draws are
+    driven by a seeded RNG, and the option order of each question is
+    derived from the same seed, so a paper is reproducible from its seed
+    and question ids alone.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._questions: List[Optional[Dict[str, Any]]] = []
+        self._positions: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._pools: Dict[Tuple[str, str, str], Pool] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    @staticmethod
+    def _keys(question: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+        difficulty = question.get('difficulty') or 'medium'
+        keys = [(scope, question[f'{scope}_id'], difficulty) for scope in SCOPES if question.get(f'{scope}_id')]
+        keys.extend(('tag', tag, difficulty) for tag in question.get('tags') or [])
+        return keys
+
+    # ===== INDEX =====
+
+    async def load(self):
+        questions: List[Optional[Dict[str, Any]]] = []
+        positions: Dict[str, int] = {}
+        pools: Dict[Tuple[str, str, str], Pool] = {}
+        async for question in self._collection.find({}, {'_id': 0}):
+            positions[question['id']] = len(questions)
+            for key in self._keys(question):
+                pools.setdefault(key, Pool()).add(len(questions))
+            questions.append(question)
+        self._questions, self._positions, self._pools, self._free = questions, positions, pools, []
+        self.ready = True
+        logger.info("Question bank loaded: %d questions in %d pools", len(questions), len(pools))
+
+    def upsert(self, question: Dict[str, Any]):
+        self.remove(question['id'])
+        position = self._free.pop() if self._free else len(self._questions)
+        if position == len(self._questions):
+            self._questions.append(question)
+        else:
+            self._questions[position] = question
+        self._positions[question['id']] = position
+        for key in self._keys(question):
+            self._pools.setdefault(key, Pool()).add(position)
+
+    def remove(self, question_id: str):
+        position = self._positions.pop(question_id, None)
+        if position is None:
+            return
+        for key in self._keys(self._questions[position]):
+            pool = self._pools.get(key)
+            if pool is not None:
+                pool.remove(position)
+                if not pool:
+                    del self._pools[key]
+        self._questions[position] = None
+        self._free.append(position)
+
+    def get(self, question_id: str) -> Optional[Dict[str, Any]]:
+        position = self._positions.get(question_id)
+        return self._questions[position] if position is not None else None
+
+    def available(self, scope: str, scope_id: str) -> Dict[str, int]:
+        return {d: len(self._pools.get((scope, scope_id, d), ())) for d in DIFFICULTIES}
+
+    # ===== ASSEMBLY =====
+
+    def _take(self, pool: Pool, k: int, rng: random.Random, accept: Callable[[Dict[str, Any]], bool],
+              seen: Set[str]) -> List[Dict[str, Any]]:
+        picked: List[Dict[str, Any]] = []
+        fallback: List[Dict[str, Any]] = []
+        for position in pool.draw(rng):
+            question = self._questions[position]
+            if not accept(question):
+                continue
+            if question['id'] in seen:
+                # recently seen questions only fill in when the pool runs dry
+                if len(fallback) < k:
+                    fallback.append(question)
+                continue
+            picked.append(question)
+            if len(picked) == k:
+                return picked
+        return picked + fallback[:k - len(picked)]
+
+    def assemble(self, scope: str, scope_id: str, count: int, seed: int, mix: Optional[Dict[str, float]] = None,
+                 tags: Iterable[str] = (), seen: Iterable[str] = (),
+                 allowed: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+        """Sample ``count`` questions stratified by difficulty, in a seeded random order.
+
+        Each stratum draws from the smallest of the scope's and the tags'
+        pools. Strata that run short are topped up from the others; the
+        result is shorter than ``count`` only when the bank is. ``allowed``
+        drops questions the caller may not be shown, such as premium ones.
+        """
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown scope: {scope}")
+        tags = set(tags)
+        seen = set(seen)
+        rng = random.Random(seed)
+        chosen: Dict[str, Dict[str, Any]] = {}
+
+        def accept(question: Dict[str, Any]) -> bool:
+            return question.get(f'{scope}_id') == scope_id and tags <= set(question.get('tags') or ()) \
+                and question['id'] not in chosen and (allowed is None or allowed(question))
+
+        def pool_for(difficulty: str) -> Pool:
+            candidates = [self._pools.get((scope, scope_id, difficulty))]
+            candidates += [self._pools.get(('tag', tag, difficulty)) for tag in sorted(tags)]
+            if any(pool is None for pool in candidates):
+                return Pool()
+            return min(candidates, key=len)
+
+        counts = allocate(count, mix or DEFAULT_MIX)
+        for difficulty, want in counts.items():
+            for question in self._take(pool_for(difficulty), want, rng, accept, seen):
+                chosen[question['id']] = question
+        for difficulty in sorted(DIFFICULTIES, key=lambda d: -counts.get(d, 0)):
+            if len(chosen) >= count:
+                break
+            for question in self._take(pool_for(difficulty), count - len(chosen), rng, accept, seen):
+                chosen[question['id']] = question
+
+        questions = list(chosen.values())
+        rng.shuffle(questions)
+        return [shuffled_options(question, seed) for question in questions]
+
+    def paper(self, question_ids: Iterable[str], seed: int) -> List[Dict[str, Any]]:
+        """Rebuild an assembled paper from its ids; InvalidPaper if one has left the bank."""
+        questions = []
+        for question_id in question_ids:
+            question = self.get(question_id)
+            if question is None:
+                raise InvalidPaper(f"Question {question_id} is no longer in the bank")
+            questions.append(shuffled_options(question, seed))
+        return questions
+
+
+# ===== PAPER TOKENS =====
+
+def paper_id(question_ids: Iterable[str], seed: int) -> str:
+    return hashlib.sha1(f"{seed}:{','.join(question_ids)}".encode()).hexdigest()[:16]
+
+
+def sign_paper(user_id: str, question_ids: List[str], seed: int, secret: str, ttl_hours: float,
+               algorithm: str = 'HS256') -> str:
+    """Signed stand-in for a stored answer key: the paper's ids and seed, bound to one user."""
+    payload = {
+        'sub': user_id,
+        'qs': question_ids,
+        'seed': seed,
+        'exp': datetime.now(timezone.utc) + timedelta(hours=ttl_hours),
+    }
+    return jwt.encode(payload, secret, algorithm=algorithm)
+
+
+def open_paper(token: str, user_id: str, secret: str, algorithm: str = 'HS256') -> Tuple[List[str], int]:
+    try:
+        payload = jwt.decode(token, secret, algorithms=[algorithm])
+    except jwt.ExpiredSignatureError:
+        raise InvalidPaper("Paper expired")
+    except jwt.InvalidTokenError:
+        raise InvalidPaper("Invalid paper token")
+    if payload.get('sub') != user_id:
+        raise InvalidPaper("Paper was assembled for another user")
+    return payload['qs'], payload['seed']
+
+
+# ===== BACKFILL =====
+
+async def backfill_from_quizzes(questions, quizzes, topics, batch_size: int = 1000) -> int:
+    """Copy every embedded quiz question into the bank, tagged with its topic, subject and class."""
+    places = {
+        topic['id']: topic
+        async for topic in topics.find({}, {'_id': 0, 'id': 1, 'subject_id': 1, 'class_id': 1})
+    }
+    now = datetime.now(timezone.utc).isoformat()
+    written = 0
+    operations = []
+    async for quiz in quizzes.find({}, {'_id': 0, 'topic_id': 1, 'difficulty': 1, 'questions': 1}):
+        place = places.get(quiz.get('topic_id')) or {}
+        for question in quiz.get('questions') or []:
+            operations.append(ReplaceOne({'id': question['id']}, {
+                **question,
+                'topic_id': quiz.get('topic_id'),
+                'subject_id': place.get('subject_id'),
+                'class_id': place.get('class_id'),
+                'difficulty': question.get('difficulty') or quiz.get('difficulty') or 'medium',
+                'tags': question.get('tags') or [],
+                'created_at': now,
+            }, upsert=True))
+            if len(operations) >= batch_size:
+                await questions.bulk_write(operations, ordered=False)
+                written += len(operations)
+                operations = []
+    if operations:
+        await questions.bulk_write(operations, ordered=False)
+        written += len(operations)
+    return written
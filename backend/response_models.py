@@ -0,0 +1,324 @@
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict
+
+# Response shapes for the content, quiz and student routes. Declaring them as
+# response_model lets FastAPI serialize through pydantic-core instead of the
+# generic jsonable_encoder; the cached catalog routes apply the same models
+# when a cache entry is filled (see CatalogCache.get_or_load). Numbers stored
+# as ints (prices, amounts, marks) stay ints. Bilingual fields are optional because
+# language_projection drops the language that was not requested, and unknown
+# fields are kept so documents added by admins are passed through unchanged.
+
+
+class Document(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    id: str
+
+
+class ClassOut(Document):
+    name: Optional[str] = None
+    name_hi: Optional[str] = None
+    description: Optional[str] = None
+    description_hi: Optional[str] = None
+    class_number: Optional[int] = None
+
+
+class SubjectOut(Document):
+    class_id: Optional[str] = None
+    name: Optional[str] = None
+    name_hi: Optional[str] = None
+    icon: Optional[str] = None
+    description: Optional[str] = None
+    description_hi: Optional[str] = None
+
+
+class TopicOut(Document):
+    subject_id: Optional[str] = None
+    class_id: Optional[str] = None
+    title: Optional[str] = None
+    title_hi: Optional[str] = None
+    content: Optional[str] = None
+    content_hi: Optional[str] = None
+    formulas: Optional[List[str]] = []
+    diagrams: Optional[List[str]] = []
+    duration_minutes: Optional[int] = None
+
+
+class QuestionOut(Document):
+    question: Optional[str] = None
+    question_hi: Optional[str] = None
+    options: List[str] = []
+    correct_answer: Union[str, List[str], None] = None
+    marks: Union[int, float, None] = None
+
+
+class QuizOut(Document):
+    topic_id: Optional[str] = None
+    title: Optional[str] = None
+    title_hi: Optional[str] = None
+    duration_minutes: Optional[int] = None
+    questions: List[QuestionOut] = []
+
+
+class MockTestOut(Document):
+    title: Optional[str] = None
+    title_hi: Optional[str] = None
+    class_id: Optional[str] = None
+    subject: Optional[str] = None
+    duration_minutes: Optional[int] = None
+    total_marks: Union[int, float, None] = None
+    questions_count: Optional[int] = None
+
+
+class BookOut(Document):
+    title: Optional[str] = None
+    title_hi: Optional[str] = None
+    description: Optional[str] = None
+    description_hi: Optional[str] = None
+    price: Union[int, float, None] = None
+    image: Optional[str] = None
+    class_id: Optional[str] = None
+    pages: Optional[int] = None
+    author: Optional[str] = None
+
+
+class ClassList(BaseModel):
+    classes: List[ClassOut]
+
+
+class SubjectList(BaseModel):
+    subjects: List[SubjectOut]
+
+
+class TopicList(BaseModel):
+    topics: List[TopicOut]
+
+
+class TopicDetail(BaseModel):
+    topic: TopicOut
+
+
+class QuizDetail(BaseModel):
+    quiz: QuizOut
+
+
+class MockTestList(BaseModel):
+    tests: List[MockTestOut]
+
+
+class MockTestPaperOut(MockTestOut):
+    questions: List[QuestionOut] = []
+
+
+class MockTestPaper(BaseModel):
+    test: MockTestPaperOut
+
+
+class BookList(BaseModel):
+    books: List[BookOut]
+
+
+class BookDetail(BaseModel):
+    book: BookOut
+
+
+# --- quiz submission ---
+
+class QuizGrade(BaseModel):
+    score: float
+    correct: int
+    total: int
+    marks: float
+    max_marks: float
+
+
+class PracticeGrade(QuizGrade):
+    paper_id: str
+
+
+class BulkGradeItem(BaseModel):
+    quiz_id: str
+    score: Optional[float] = None
+    correct: Optional[int] = None
+    total: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkGradeResult(BaseModel):
+    graded: int
+    results: List[BulkGradeItem]
+
+
+# --- practice ---
+
+class PracticePaper(BaseModel):
+    paper_id: str
+    seed: int
+    token: str
+    questions: List[QuestionOut]
+
+
+# --- review ---
+
+class ReviewItem(BaseModel):
+    question_id: str
+    quiz_id: Optional[str] = None
+    topic_id: Optional[str] = None
+    ease: float
+    interval: float
+    reps: int
+    lapses: int = 0
+    attempts: int = 0
+    correct: int = 0
+    reviewed_at: str
+    due: str
+    question: QuestionOut
+
+
+class ReviewQueue(BaseModel):
+    items: List[ReviewItem]
+    due: int
+    total: int
+
+
+class ReviewGrade(BaseModel):
+    correct: int
+    total: int
+    results: Dict[str, bool]
+
+
+# --- leaderboards ---
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: str
+    name: str = ''
+    score: float
+    achieved_at: str
+
+
+class LeaderboardOut(BaseModel):
+    board: str
+    size: int
+    entries: List[LeaderboardEntry]
+    me: Optional[LeaderboardEntry] = None
+
+
+# --- mock test sessions ---
+
+class MockTestResult(QuizGrade):
+    answered: int
+
+
+class MockTestSessionOut(BaseModel):
+    id: str
+    test_id: str
+    status: str
+    started_at: str
+    deadline: str
+    remaining_seconds: Optional[float] = None
+    seq: int
+    answers: Dict[str, Union[str, List[str]]]
+    flags: List[str]
+    submitted_at: Optional[str] = None
+    submitted_by: Optional[str] = None
+    result: Optional[MockTestResult] = None
+
+
+class MockTestDeltaAck(BaseModel):
+    seq: int
+    applied: bool
+    remaining_seconds: float
+
+
+# --- student ---
+
+class QuizResultOut(Document):
+    user_id: Optional[str] = None
+    quiz_id: Optional[str] = None
+    topic_id: Optional[str] = None
+    score: Optional[float] = None
+    correct: Optional[int] = None
+    total: Optional[int] = None
+    marks: Optional[float] = None
+    submitted_at: Optional[str] = None
+
+
+class BookmarkOut(Document):
+    user_id: Optional[str] = None
+    topic_id: Optional[str] = None
+    title: Optional[str] = None
+    created_at: Optional[str] = None
+
+
+class OrderOut(Document):
+    user_id: Optional[str] = None
+    razorpay_order_id: Optional[str] = None
+    amount: Union[int, float, None] = None
+    currency: Optional[str] = None
+    items: List[Dict[str, Any]] = []
+    status: Optional[str] = None
+    created_at: Optional[str] = None
+    completed_at: Optional[str] = None
+
+
+class ProgressPage(BaseModel):
+    progress: List[QuizResultOut]
+    next_cursor: Optional[str] = None
+
+
+class BookmarkPage(BaseModel):
+    bookmarks: List[BookmarkOut]
+    next_cursor: Optional[str] = None
+
+
+class PurchasePage(BaseModel):
+    purchases: List[OrderOut]
+    next_cursor: Optional[str] = None
+
+
+class ProgressTotals(BaseModel):
+    attempts: int
+    average_score: float
+    best_score: float
+    topics_attempted: int
+
+
+class SubjectProgress(BaseModel):
+    subject_id: Optional[str] = None
+    attempts: int
+    average_score: float
+    best_score: float
+    topics_attempted: int
+    last_attempt: Optional[str] = None
+
+
+class ProgressSummary(BaseModel):
+    summary: ProgressTotals
+    subjects: List[SubjectProgress]
+
+
+class EntitlementsOut(BaseModel):
+    books: List[str]
+    classes: List[str]
+    plans: List[str]
+
+
+class MessageOut(BaseModel):
+    message: str
+
+
+# --- bootstrap ---
+
+class BootstrapOut(BaseModel):
+    # parts that failed or timed out are null and named in errors
+    user: Optional[Dict[str, Any]] = None
+    classes: Optional[List[ClassOut]] = None
+    progress: Optional[List[QuizResultOut]] = None
+    summary: Optional[ProgressSummary] = None
+    bookmarks: Optional[List[BookmarkOut]] = None
+    purchases: Optional[List[OrderOut]] = None
+    next_cursors: Dict[str, Optional[str]] = {}
+    errors: Dict[str, str] = {}
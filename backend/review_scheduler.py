@@ -0,0 +1,384 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400.0
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# SM-2 answer quality (0-5) for an auto-graded question
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+
+STATE_FIELDS = ('ease', 'interval', 'reps', 'lapses', 'attempts', 'correct')
+
+DUPLICATE_KEY = 11000
+# how often an item another worker wrote in between is re-read within one flush
+CONFLICT_RETRIES = 3
+
+# (user_id, question_id, quiz_id, topic_id, quality, reviewed_at)
+Review = Tuple[str, str, Optional[str], Optional[str], int, float]
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _ts(iso: str) -> float:
+    return datetime.fromisoformat(iso).timestamp()
+
+
+def item_fuzz(user_id: str, question_id: str) -> float:
+    """Stable value in [-1, 1] that spreads items reviewed together over nearby days."""
+    return zlib.crc32(f'{user_id}:{question_id}'.encode()) / 0x7FFFFFFF - 1.0
+
+
+def sm2(ease: np.ndarray, interval: np.ndarray, reps: np.ndarray, quality: np.ndarray
+        ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """One SM-2 step over arrays of item states: (ease, interval days, reps, lapsed)."""
+    q = quality.astype(np.float64)
+    passed = q >= 3
+    new_reps = np.where(passed, reps + 1, 0)
+    new_interval = np.where(
+        ~passed, 1.0,
+        np.where(new_reps == 1, 1.0, np.where(new_reps == 2, 6.0, np.ceil(interval * ease)))
+    )
+    new_ease = np.maximum(MIN_EASE, ease + 0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+    lapsed = ~passed & (reps > 0)
+    return new_ease, new_interval, new_reps, lapsed
+
+
+def due_at(reviewed_at: np.ndarray, interval: np.ndarray, fuzz: np.ndarray, max_interval: float,
+           fuzz_factor: float) -> np.ndarray:
+    """Due timestamps; intervals of three days or more are fuzzed by up to ``fuzz_factor``."""
+    days = np.minimum(interval, max_interval)
+    days = np.where(days >= 3, days * (1 + fuzz_factor * fuzz), days)
+    return reviewed_at + days * DAY
+
+
+class ReviewScheduler:
+    """SM-2 spaced repetition over every question a student has answered.
+
+    ``review_items`` holds one document per user and question with its
+    scheduling state and a ``due`` time. The ``(user_id, due)`` index is the
+    per-user priority queue: the next N due items are one bounded index
+    scan, with no history to read. Graded answers are queued by ``record``
+    and folded in by a background flush: one read of the touched items and
+    one bulk write per interval, with the SM-2 step vectorized over the
+    batch. Each write is conditional on the item's ``attempts`` as read, so
+    when two workers fold answers into one item the later write is
+    recomputed from the other's result instead of overwriting it. An
+    item's ``quiz_id`` and ``topic_id`` record where it was first answered
+    and are never overwritten. ``reschedule`` recomputes every item's due
+    date the same way in large batches; it runs nightly so parameter
+    changes (maximum interval, fuzz) reach items nobody has reviewed since.
+    """
+
+    def __init__(self, collection, locks, flush_interval: float = 2.0, max_interval: float = 365.0,
+                 fuzz: float = 0.05, nightly_hour: Optional[int] = 3):
+        self._collection = collection
+        self._locks = locks
+        self.flush_interval = flush_interval
+        self.max_interval = max_interval
+        self.fuzz = fuzz
+        self.nightly_hour = nightly_hour
+        self._pending: List[Review] = []
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._nightly_day: Optional[str] = None
+        self._stats = {'answers': 0, 'flushes': 0, 'updated_items': 0, 'conflicts': 0, 'reschedules': 0,
+                       'rescheduled_items': 0, 'reschedule_seconds': 0.0}
+
+    # ===== LIFECYCLE =====
+
+    def start(self):
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task:
+            await self._task
+            self._task = None
+        else:
+            await self.flush()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Review schedule flush failed")
+            now = datetime.now(timezone.utc)
+            if now.hour == self.nightly_hour and self._nightly_day != now.date().isoformat():
+                self._nightly_day = now.date().isoformat()
+                try:
+                    await self.nightly()
+                except Exception:
+                    logger.exception("Nightly review reschedule failed")
+
+    # ===== RECORDING =====
+
+    def record(self, user_id: str, key, responses: np.ndarray, correct: np.ndarray,
+               at: Optional[datetime] = None, origin: bool = True):
+        """Queue one graded attempt; only answered questions count as reviews.
+
+        ``at`` is for attempts made earlier, already bounded by the caller.
+        Pass ``origin=False`` for keys built on the fly (practice papers,
+        reviews), whose ids name no quiz.
+        """
+        ts = at.timestamp() if at else time.time()
+        quiz_id, topic_id = (key.quiz_id, key.topic_id) if origin else (None, None)
+        for position in np.flatnonzero(responses):
+            self._pending.append((
+                user_id, key.question_ids[position], quiz_id, topic_id,
+                QUALITY_CORRECT if correct[position] else QUALITY_WRONG, ts,
+            ))
+        self._stats['answers'] += int(np.count_nonzero(responses))
+
+    async def flush(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            failed = await self._apply(pending)
+        except Exception:
+            # requeue so the next flush retries them, ahead of newer answers
+            self._pending = pending + self._pending
+            raise
+        if failed:
+            self._pending = failed + self._pending
+            logger.warning("%d review answers not written, retrying next flush", len(failed))
+
+    async def _apply(self, answers: List[Review]) -> List[Review]:
+        """Fold answers into their items; returns the answers that could not be written."""
+        failed: List[Review] = []
+        for attempt in range(CONFLICT_RETRIES + 1):
+            try:
+                conflicted, errored = await self._fold(answers)
+            except Exception:
+                if not attempt:
+                    raise
+                # the first pass was written, so only this pass's answers are left over
+                logger.exception("Review conflict retry failed")
+                return failed + answers
+            failed += errored
+            if not conflicted:
+                break
+            self._stats['conflicts'] += len(conflicted)
+            answers = conflicted
+        else:
+            failed += conflicted
+        self._stats['flushes'] += 1
+        return failed
+
+    async def _fold(self, answers: List[Review]) -> Tuple[List[Review], List[Review]]:
+        """One read-compute-write pass: (answers whose items changed meanwhile, answers that failed)."""
+        users = sorted({answer[0] for answer in answers})
+        questions = sorted({answer[1] for answer in answers})
+        states: Dict[Tuple[str, str], Dict[str, Any]] = {
+            (item['user_id'], item['question_id']): item
+            async for item in self._collection.find(
+                {'user_id': {'$in': users}, 'question_id': {'$in': questions}},
+                {'_id': 0, 'user_id': 1, 'question_id': 1, 'fuzz': 1, **{field: 1 for field in STATE_FIELDS}}
+            )
+        }
+
+        # answers to the same item apply in order: round r holds each item's r-th answer
+        rounds: List[List[int]] = []
+        seen: Dict[Tuple[str, str], int] = {}
+        for answer in sorted(range(len(answers)), key=lambda i: answers[i][5]):
+            item = (answers[answer][0], answers[answer][1])
+            r = seen[item] = seen.get(item, -1) + 1
+            if r == len(rounds):
+                rounds.append([])
+            rounds[r].append(answer)
+
+        touched: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for batch in rounds:
+            items = [(answers[i][0], answers[i][1]) for i in batch]
+            current = [touched.get(item) or states.get(item) or {} for item in items]
+            ease = np.array([state.get('ease', DEFAULT_EASE) for state in current], dtype=np.float64)
+            interval = np.array([state.get('interval', 0.0) for state in current], dtype=np.float64)
+            reps = np.array([state.get('reps', 0) for state in current], dtype=np.int64)
+            quality = np.array([answers[i][4] for i in batch], dtype=np.int64)
+            reviewed = np.array([answers[i][5] for i in batch], dtype=np.float64)
+            fuzz = np.array([state.get('fuzz', item_fuzz(*item)) for state, item in zip(current, items)])
+
+            ease, interval, reps, lapsed = sm2(ease, interval, reps, quality)
+            due = due_at(reviewed, interval, fuzz, self.max_interval, self.fuzz)
+            for j, (i, item, state) in enumerate(zip(batch, items, current)):
+                touched[item] = {
+                    'fuzz': float(fuzz[j]),
+                    'ease': float(ease[j]),
+                    'interval': float(interval[j]),
+                    'reps': int(reps[j]),
+                    'lapses': state.get('lapses', 0) + int(lapsed[j]),
+                    'attempts': state.get('attempts', 0) + 1,
+                    'correct': state.get('correct', 0) + int(quality[j] >= 3),
+                    'reviewed_at': _iso(reviewed[j]),
+                    'due': _iso(due[j]),
+                }
+
+        # a new item takes its origin from the first answer that names one
+        origins: Dict[Tuple[str, str], Dict[str, str]] = {}
+        for answer in sorted(answers, key=lambda answer: answer[5]):
+            origin = origins.setdefault((answer[0], answer[1]), {})
+            for field, value in (('quiz_id', answer[2]), ('topic_id', answer[3])):
+                if value is not None:
+                    origin.setdefault(field, value)
+
+        items = list(touched)
+        operations = []
+        for user_id, question_id in items:
+            attempts = states.get((user_id, question_id), {}).get('attempts')
+            update = {'$set': touched[(user_id, question_id)]}
+            if origins[(user_id, question_id)]:
+                update['$setOnInsert'] = origins[(user_id, question_id)]
+            # an item created or answered elsewhere since the read no longer matches, and the upsert collides
+            operations.append(UpdateOne(
+                {'user_id': user_id, 'question_id': question_id,
+                 'attempts': attempts if attempts is not None else {'$exists': False}},
+                update, upsert=True
+            ))
+        conflicted, errored = set(), set()
+        try:
+            await self._collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors') or []:
+                (conflicted if error.get('code') == DUPLICATE_KEY else errored).add(items[error['index']])
+            if errored:
+                logger.error("Review item writes failed: %s", e.details.get('writeErrors'))
+        self._stats['updated_items'] += len(items) - len(conflicted) - len(errored)
+        return ([answer for answer in answers if (answer[0], answer[1]) in conflicted],
+                [answer for answer in answers if (answer[0], answer[1]) in errored])
+
+    # ===== QUEUES =====
+
+    async def due(self, user_id: str, limit: int, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        return await self._collection.find(
+            {'user_id': user_id, 'due': {'$lte': _iso(now or time.time())}},
+            {'_id': 0, 'user_id': 0, 'fuzz': 0}
+        ).sort('due', 1).limit(limit).to_list(limit)
+
+    async def due_ids(self, user_id: str, question_ids: List[str], now: Optional[float] = None) -> Set[str]:
+        """Which of ``question_ids`` are in the user's review queue and due."""
+        return {
+            item['question_id']
+            async for item in self._collection.find(
+                {'user_id': user_id, 'question_id': {'$in': question_ids}, 'due': {'$lte': _iso(now or time.time())}},
+                {'_id': 0, 'question_id': 1}
+            )
+        }
+
+    async def counts(self, user_id: str, now: Optional[float] = None) -> Dict[str, int]:
+        due, total = await asyncio.gather(
+            self._collection.count_documents({'user_id': user_id, 'due': {'$lte': _iso(now or time.time())}}),
+            self._collection.count_documents({'user_id': user_id})
+        )
+        return {'due': due, 'total': total}
+
+    # ===== NIGHTLY =====
+
+    async def nightly(self) -> bool:
+        """Run today's reschedule unless another worker already claimed it."""
+        day = datetime.now(timezone.utc).date().isoformat()
+        try:
+            await self._locks.update_one(
+                {'_id': 'review_reschedule', 'day': {'$ne': day}},
+                {'$set': {'day': day, 'claimed_at': datetime.now(timezone.utc).isoformat()}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        await self.reschedule()
+        return True
+
+    async def reschedule(self, batch_size: int = 50000) -> Dict[str, Any]:
+        """Recompute every item's due date from its stored state, writing only those that moved."""
+        started = time.perf_counter()
+        scanned = changed = 0
+        batch: List[Dict[str, Any]] = []
+        cursor = self._collection.find(
+            {}, {'_id': 1, 'user_id': 1, 'question_id': 1, 'interval': 1, 'fuzz': 1, 'reviewed_at': 1, 'due': 1}
+        ).batch_size(batch_size)
+        async for item in cursor:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                changed += await self._reschedule_batch(batch)
+                scanned += len(batch)
+                batch = []
+        changed += await self._reschedule_batch(batch)
+        scanned += len(batch)
+
+        elapsed = time.perf_counter() - started
+        self._stats['reschedules'] += 1
+        self._stats['rescheduled_items'] += changed
+        self._stats['reschedule_seconds'] = elapsed
+        logger.info("Rescheduled %d of %d review items in %.1fs", changed, scanned, elapsed)
+        return {'scanned': scanned, 'changed': changed, 'seconds': round(elapsed, 3)}
+
+    async def _reschedule_batch(self, items: List[Dict[str, Any]]) -> int:
+        items = [item for item in items if item.get('reviewed_at')]
+        if not items:
+            return 0
+        reviewed = np.array([_ts(item['reviewed_at']) for item in items])
+        interval = np.array([item.get('interval', 1.0) for item in items], dtype=np.float64)
+        fuzz = np.array([
+            item['fuzz'] if 'fuzz' in item else item_fuzz(item['user_id'], item['question_id']) for item in items
+        ])
+        current = np.array([_ts(item['due']) if item.get('due') else np.nan for item in items])
+        due = due_at(reviewed, interval, fuzz, self.max_interval, self.fuzz)
+
+        moved = np.flatnonzero(~(np.abs(due - current) < 1.0))
+        if len(moved):
+            await self._collection.bulk_write([
+                # skipped if the item was reviewed since it was read; the flush set its due date
+                UpdateOne({'_id': items[i]['_id'], 'reviewed_at': items[i]['reviewed_at']},
+                          {'$set': {'due': _iso(due[i]), 'fuzz': float(fuzz[i])}})
+                for i in moved.tolist()
+            ], ordered=False)
+        return len(moved)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self._stats, 'pending': len(self._pending)}
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description='Recompute every review item due date')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    scheduler = ReviewScheduler(
+        db.review_items, db.job_locks,
+        max_interval=float(os.environ.get('REVIEW_MAX_INTERVAL_DAYS', '365')),
+        fuzz=float(os.environ.get('REVIEW_FUZZ', '0.05'))
+    )
+    print(await scheduler.reschedule(batch_size=args.batch_size))
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import logging
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pymongo import UpdateOne, ReplaceOne, DESCENDING
+
+logger = logging.getLogger(__name__)
+
+TOTALS_ID = 'totals'
+TOTAL_FIELDS = ('users', 'topics', 'books', 'completed_orders', 'revenue', 'quiz_attempts')
+
+
+def day_of(timestamp: Optional[str]) -> str:
+    return (timestamp or datetime.now(timezone.utc).isoformat())[:10]
+
+
+class Rollups:
+    """Incrementally maintained analytics counters.
+
+    Writes only bump in-memory counters; a background task folds them into
+    MongoDB with one upserted $inc per touched document. Every worker can do
+    this independently because increments commute. Layout of the
+    ``analytics_rollups`` collection:
+
+    - ``{_id: 'totals', users, topics, books, completed_orders, revenue, quiz_attempts}``
+    - ``{_id: 'daily:YYYY-MM-DD', date, signups, quiz_attempts, score_sum, revenue,
+      completed_orders, subjects: {<subject_id>: {attempts, score_sum}}}``
+    """
+
+    def __init__(self, collection, flush_interval: float = 2.0):
+        self._collection = collection
+        self.flush_interval = flush_interval
+        self._totals: Counter = Counter()
+        self._daily: Dict[str, Counter] = defaultdict(Counter)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    # --- recording ---
+
+    def record_signup(self, at: Optional[str] = None):
+        self._totals['users'] += 1
+        self._daily[day_of(at)]['signups'] += 1
+
+    def record_topic_created(self, count: int = 1):
+        self._totals['topics'] += count
+
+    def record_book_created(self, count: int = 1):
+        self._totals['books'] += count
+
+    def record_quiz_attempt(self, subject_id: Optional[str], score: float, at: Optional[str] = None):
+        self._totals['quiz_attempts'] += 1
+        daily = self._daily[day_of(at)]
+        daily['quiz_attempts'] += 1
+        daily['score_sum'] += score
+        if subject_id:
+            daily[f'subjects.{subject_id}.attempts'] += 1
+            daily[f'subjects.{subject_id}.score_sum'] += score
+
+    def record_order_completed(self, amount: float, at: Optional[str] = None):
+        self._totals['completed_orders'] += 1
+        self._totals['revenue'] += amount
+        daily = self._daily[day_of(at)]
+        daily['completed_orders'] += 1
+        daily['revenue'] += amount
+
+    # --- flushing ---
+
+    async def flush(self):
+        totals, self._totals = self._totals, Counter()
+        daily, self._daily = self._daily, defaultdict(Counter)
+
+        ops = []
+        if totals:
+            ops.append(UpdateOne({'_id': TOTALS_ID}, {'$inc': dict(totals)}, upsert=True))
+        for day, counters in daily.items():
+            ops.append(UpdateOne(
+                {'_id': f'daily:{day}'},
+                {'$inc': dict(counters), '$setOnInsert': {'date': day}},
+                upsert=True
+            ))
+        if not ops:
+            return
+        try:
+            await self._collection.bulk_write(ops, ordered=False)
+        except Exception:
+            # put the increments back so the next flush retries them
+            self._totals.update(totals)
+            for day, counters in daily.items():
+                self._daily[day].update(counters)
+            raise
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Rollup flush failed")
+
+    def start(self):
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # let the loop finish its final flush rather than cancelling mid-write
+        self._stopping.set()
+        if self._task:
+            await self._task
+            self._task = None
+        else:
+            await self.flush()
+
+    # --- reading ---
+
+    async def read(self, days: int = 30) -> Dict[str, Any]:
+        totals = await self._collection.find_one({'_id': TOTALS_ID}) or {}
+        since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date().isoformat()
+        daily = await self._collection.find(
+            {'_id': {'$gte': f'daily:{since}', '$lt': 'daily;'}},
+            {'_id': 0}
+        ).sort('_id', DESCENDING).to_list(days)
+
+        # include increments this worker has not flushed yet
+        result = {field: totals.get(field, 0) + self._totals.get(field, 0) for field in TOTAL_FIELDS}
+        series = []
+        for doc in reversed(daily):
+            subjects = {
+                subject_id: {
+                    'attempts': stats.get('attempts', 0),
+                    'average_score': stats.get('score_sum', 0) / stats['attempts'] if stats.get('attempts') else 0
+                }
+                for subject_id, stats in (doc.get('subjects') or {}).items()
+            }
+            attempts = doc.get('quiz_attempts', 0)
+            series.append({
+                'date': doc['date'],
+                'signups': doc.get('signups', 0),
+                'quiz_attempts': attempts,
+                'average_score': doc.get('score_sum', 0) / attempts if attempts else 0,
+                'completed_orders': doc.get('completed_orders', 0),
+                'revenue': doc.get('revenue', 0),
+                'subjects': subjects,
+            })
+        result['daily'] = series
+        return result
+
+
+async def reconcile(db, collection) -> Dict[str, Any]:
+    """Recompute every rollup document from the source collections.
+
+    Used as a backfill and to repair drift (e.g. increments lost when a
+    worker was killed before flushing). Replaces documents wholesale, so run
+    it while write traffic is low.
+    """
+    totals = {
+        'users': await db.users.count_documents({}),
+        'topics': await db.topics.count_documents({}),
+        'books': await db.books.count_documents({}),
+        'completed_orders': 0,
+        'revenue': 0,
+        'quiz_attempts': 0,
+    }
+    daily: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+        'signups': 0, 'quiz_attempts': 0, 'score_sum': 0.0,
+        'completed_orders': 0, 'revenue': 0, 'subjects': {}
+    })
+
+    async for row in db.users.aggregate([
+        {'$group': {'_id': {'$substr': ['$created_at', 0, 10]}, 'count': {'$sum': 1}}}
+    ]):
+        daily[row['_id']]['signups'] = row['count']
+
+    async for row in db.orders.aggregate([
+        {'$match': {'status': 'completed'}},
+        {'$group': {
+            '_id': {'$substr': [{'$ifNull': ['$completed_at', '$created_at']}, 0, 10]},
+            'count': {'$sum': 1},
+            'revenue': {'$sum': '$amount'}
+        }}
+    ]):
+        daily[row['_id']]['completed_orders'] = row['count']
+        daily[row['_id']]['revenue'] = row['revenue']
+        totals['completed_orders'] += row['count']
+        totals['revenue'] += row['revenue']
+
+    per_topic_day = await db.quiz_results.aggregate([
+        {'$group': {
+            '_id': {'day': {'$substr': ['$submitted_at', 0, 10]}, 'topic_id': '$topic_id'},
+            'attempts': {'$sum': 1},
+            'score_sum': {'$sum': '$score'}
+        }}
+    ]).to_list(None)
+    topic_ids = list({row['_id']['topic_id'] for row in per_topic_day})
+    topic_subjects = {
+        topic['id']: topic.get('subject_id')
+        async for topic in db.topics.find({'id': {'$in': topic_ids}}, {'_id': 0, 'id': 1, 'subject_id': 1})
+    }
+    for row in per_topic_day:
+        day = daily[row['_id']['day']]
+        day['quiz_attempts'] += row['attempts']
+        day['score_sum'] += row['score_sum']
+        totals['quiz_attempts'] += row['attempts']
+        subject_id = topic_subjects.get(row['_id']['topic_id'])
+        if subject_id:
+            subject = day['subjects'].setdefault(subject_id, {'attempts': 0, 'score_sum': 0.0})
+            subject['attempts'] += row['attempts']
+            subject['score_sum'] += row['score_sum']
+
+    ops = [ReplaceOne({'_id': TOTALS_ID}, totals, upsert=True)]
+    for day, doc in daily.items():
+        ops.append(ReplaceOne({'_id': f'daily:{day}'}, {'date': day, **doc}, upsert=True))
+    await collection.bulk_write(ops, ordered=False)
+    await collection.delete_many({'_id': {'$regex': '^daily:', '$nin': [f'daily:{day}' for day in daily]}})
+
+    return {'totals': totals, 'days': len(daily)}
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description='Rebuild analytics rollups from source collections')
+    parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    result = await reconcile(db, db.analytics_rollups)
+    print(f"Totals: {result['totals']}")
+    print(f"Daily documents: {result['days']}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,393 @@
+import bisect
+import gzip
+import html
+import json
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Any, Iterable
+
+SNAPSHOT_VERSION = 1
+
+# Indexed fields and their BM25F-style weights
+FIELDS = ('title', 'content', 'formulas')
+FIELD_WEIGHTS = (3.0, 1.0, 1.5)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r'(?:[^\W_]|[\u0900-\u0963\u0966-\u097F])+')
+MARKDOWN_RE = re.compile(r'[#*_`>|~\[\]]+')
+DEVANAGARI_RE = re.compile(r'[\u0900-\u097F]')
+
+ENGLISH_STOPWORDS = frozenset(
+    'a an and are as at be by for from has in is it its of on or that the to was were what which with'.split()
+)
+HINDI_STOPWORDS_RAW = ('का', 'की', 'के', 'है', 'हैं', 'और', 'में', 'से', 'को', 'एक', 'यह', 'वह', 'पर', 'भी', 'तो', 'ही')
+
+# ===== NORMALIZATION =====
+
+# Nukta forms fold onto their base consonant, chandrabindu onto anusvara and
+# long vowels onto short ones, so common spelling variants collapse together.
+_NUKTA_FORMS = {
+    '\u0929': '\u0928', '\u0931': '\u0930', '\u0934': '\u0933',
+    '\u0958': '\u0915', '\u0959': '\u0916', '\u095A': '\u0917', '\u095B': '\u091C',
+    '\u095C': '\u0921', '\u095D': '\u0922', '\u095E': '\u092B', '\u095F': '\u092F',
+}
+_DEVANAGARI_FOLD = str.maketrans({
+    **_NUKTA_FORMS,
+    '\u093C': None,        # nukta
+    '\u200C': None,        # zero-width non-joiner
+    '\u200D': None,        # zero-width joiner
+    '\u0901': '\u0902',    # chandrabindu -> anusvara
+    '\u0940': '\u093F',    # ii matra -> i matra
+    '\u0942': '\u0941',    # uu matra -> u matra
+    '\u0944': '\u0943',    # vocalic rr matra -> vocalic r matra
+    '\u0908': '\u0907',    # II -> I
+    '\u090A': '\u0909',    # UU -> U
+    '\u0945': '\u0947',    # candra e -> e
+    '\u0949': '\u094B',    # candra o -> o
+})
+
+
+def normalize_devanagari(token: str) -> str:
+    return unicodedata.normalize('NFC', token).translate(_DEVANAGARI_FOLD)
+
+
+# Light Hindi stemmer (Ramanathan & Rao suffix lists), longest suffix first
+_HINDI_SUFFIXES_RAW = (
+    ('ाएंगी', 'ाएंगे', 'ाऊंगी', 'ाऊंगा', 'ाइयाँ', 'ाइयों', 'ाइयां'),
+    ('ाएगी', 'ाएगा', 'ाओगी', 'ाओगे', 'एंगी', 'ेंगी', 'एंगे', 'ेंगे', 'ूंगी', 'ूंगा', 'ातीं',
+     'नाओं', 'नाएं', 'ताओं', 'ताएं', 'ियाँ', 'ियों', 'ियां'),
+    ('ाकर', 'ाइए', 'ाईं', 'ाया', 'ेगी', 'ेगा', 'ोगी', 'ोगे', 'ाने', 'ाना', 'ाते', 'ाती', 'ाता',
+     'तीं', 'ाओं', 'ाएं', 'ुओं', 'ुएं', 'ुआं'),
+    ('कर', 'ाओ', 'िए', 'ाई', 'ाए', 'ने', 'नी', 'ना', 'ते', 'ीं', 'ती', 'ता', 'ाँ', 'ां', 'ों', 'ें'),
+    ('ो', 'े', 'ू', 'ु', 'ी', 'ि', 'ा'),
+)
+HINDI_SUFFIXES = tuple(
+    tuple(dict.fromkeys(normalize_devanagari(suffix) for suffix in group))
+    for group in _HINDI_SUFFIXES_RAW
+)
+HINDI_STOPWORDS = frozenset(normalize_devanagari(word) for word in HINDI_STOPWORDS_RAW)
+
+
+def stem_hindi(token: str) -> str:
+    for group in HINDI_SUFFIXES:
+        for suffix in group:
+            # keep at least two characters of stem
+            if len(token) > len(suffix) + 1 and token.endswith(suffix):
+                return token[:-len(suffix)]
+    return token
+
+
+_ENGLISH_SUFFIXES = (
+    ('ational', 'ate'), ('ization', 'ize'), ('fulness', 'ful'), ('iveness', 'ive'),
+    ('ations', 'ate'), ('ation', 'ate'), ('ments', ''), ('ment', ''), ('ness', ''),
+    ('ingly', ''), ('edly', ''), ('ies', 'y'), ('ied', 'y'), ('ing', ''), ('ed', ''), ('ly', ''),
+)
+
+
+def stem_english(token: str) -> str:
+    if len(token) <= 3 or not token.isascii():
+        return token
+    for suffix, replacement in _ENGLISH_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)] + replacement
+    if token.endswith(('sses', 'xes', 'zes', 'ches', 'shes')):
+        return token[:-2]
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def normalize_token(token: str) -> str:
+    if DEVANAGARI_RE.search(token):
+        return normalize_devanagari(token)
+    return token.lower()
+
+
+def analyze_token(token: str) -> Optional[str]:
+    """Normalize and stem one raw token; returns None for stopwords."""
+    if DEVANAGARI_RE.search(token):
+        token = normalize_devanagari(token)
+        return None if token in HINDI_STOPWORDS else stem_hindi(token)
+    token = token.lower()
+    return None if token in ENGLISH_STOPWORDS else stem_english(token)
+
+
+def analyze(text: str) -> List[str]:
+    terms = []
+    for match in TOKEN_RE.finditer(text or ''):
+        term = analyze_token(match.group())
+        if term:
+            terms.append(term)
+    return terms
+
+
+def topic_fields(topic: Dict[str, Any]) -> Tuple[str, str, str]:
+    return (
+        f"{topic.get('title', '')} {topic.get('title_hi', '')}",
+        f"{topic.get('content', '')} {topic.get('content_hi', '')}",
+        ' '.join(topic.get('formulas') or []),
+    )
+
+
+def doc_stamp(topic: Dict[str, Any]) -> str:
+    return topic.get('updated_at') or topic.get('created_at') or ''
+
+
+# ===== INDEX =====
+
+class SearchIndex:
+    """In-memory inverted index over topics with BM25 ranking.
+
+    Postings map term -> {topic_id: [tf per field]}; per-document metadata
+    holds what the result list needs so search never touches MongoDB except
+    to fetch snippet text for the returned page.
+    """
+
+    META_FIELDS = ('id', 'title', 'title_hi', 'class_id', 'subject_id')
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, List[int]]] = defaultdict(dict)
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self._field_length_totals = [0, 0, 0]
+        self._vocab: List[str] = []
+        self._vocab_dirty = False
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    # --- maintenance ---
+
+    def add(self, topic: Dict[str, Any]):
+        doc_id = topic['id']
+        if doc_id in self.docs:
+            self.remove(doc_id)
+
+        lengths = []
+        term_freqs: Dict[str, List[int]] = {}
+        for field_index, text in enumerate(topic_fields(topic)):
+            terms = analyze(text)
+            lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                term_freqs.setdefault(term, [0, 0, 0])[field_index] = count
+
+        for term, freqs in term_freqs.items():
+            if term not in self.postings:
+                self._vocab_dirty = True
+            self.postings[term][doc_id] = freqs
+
+        for i, length in enumerate(lengths):
+            self._field_length_totals[i] += length
+        self.docs[doc_id] = {
+            **{key: topic.get(key) for key in self.META_FIELDS},
+            'lengths': lengths,
+            'terms': list(term_freqs),
+            'stamp': doc_stamp(topic),
+        }
+        self.dirty = True
+
+    def remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for i, length in enumerate(doc['lengths']):
+            self._field_length_totals[i] -= length
+        for term in doc['terms']:
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+                self._vocab_dirty = True
+        self.dirty = True
+
+    def stamps(self) -> Dict[str, str]:
+        return {doc_id: doc['stamp'] for doc_id, doc in self.docs.items()}
+
+    # --- querying ---
+
+    def _vocabulary(self) -> List[str]:
+        if self._vocab_dirty or len(self._vocab) != len(self.postings):
+            self._vocab = sorted(self.postings)
+            self._vocab_dirty = False
+        return self._vocab
+
+    def expand_prefix(self, prefix: str, limit: int = 20) -> List[str]:
+        vocab = self._vocabulary()
+        start = bisect.bisect_left(vocab, prefix)
+        matches = []
+        for term in vocab[start:]:
+            if not term.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(term)
+        # most common completions first
+        return sorted(matches, key=lambda term: -len(self.postings[term]))
+
+    def query_terms(self, query: str, prefix: bool = False) -> Dict[str, float]:
+        raw_tokens = TOKEN_RE.findall(query or '')
+        weights: Dict[str, float] = {}
+        for i, token in enumerate(raw_tokens):
+            is_last = i == len(raw_tokens) - 1
+            term = analyze_token(token)
+            if term:
+                weights[term] = max(weights.get(term, 0.0), 1.0)
+            if prefix and is_last:
+                for expansion in self.expand_prefix(normalize_token(token)):
+                    weights.setdefault(expansion, 0.7)
+        return weights
+
+    def search(self, query: str, limit: int = 20, prefix: bool = False,
+               fields: Iterable[int] = (0, 1, 2)) -> List[Tuple[str, float]]:
+        weights = self.query_terms(query, prefix=prefix)
+        if not weights or not self.docs:
+            return []
+
+        n_docs = len(self.docs)
+        avg_lengths = [max(total / n_docs, 1.0) for total in self._field_length_totals]
+        fields = tuple(fields)
+        scores: Dict[str, float] = defaultdict(float)
+
+        for term, query_weight in weights.items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, freqs in postings.items():
+                lengths = self.docs[doc_id]['lengths']
+                tf = 0.0
+                for i in fields:
+                    if freqs[i]:
+                        norm = 1 - BM25_B + BM25_B * lengths[i] / avg_lengths[i]
+                        tf += FIELD_WEIGHTS[i] * freqs[i] / norm
+                if tf:
+                    scores[doc_id] += query_weight * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return ranked[:limit]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        hits = self.search(prefix, limit=limit, prefix=True, fields=(0,))
+        return [
+            {key: self.docs[doc_id][key] for key in self.META_FIELDS}
+            for doc_id, _ in hits
+        ]
+
+    def result(self, doc_id: str, score: float) -> Dict[str, Any]:
+        doc = self.docs[doc_id]
+        return {**{key: doc[key] for key in self.META_FIELDS}, 'score': round(score, 4)}
+
+    # --- persistence ---
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        # per-document term lists are derivable from postings, so leave them out
+        docs = {
+            doc_id: {key: value for key, value in doc.items() if key != 'terms'}
+            for doc_id, doc in self.docs.items()
+        }
+        return {
+            'version': SNAPSHOT_VERSION,
+            'docs': docs,
+            'postings': self.postings,
+            'field_length_totals': self._field_length_totals,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, Any]) -> 'SearchIndex':
+        index = cls()
+        if data.get('version') != SNAPSHOT_VERSION:
+            return index
+        index.docs = data['docs']
+        index.postings = defaultdict(dict, data['postings'])
+        for doc in index.docs.values():
+            doc['terms'] = []
+        for term, postings in index.postings.items():
+            for doc_id in postings:
+                index.docs[doc_id]['terms'].append(term)
+        index._field_length_totals = data['field_length_totals']
+        index._vocab_dirty = True
+        return index
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(self.to_snapshot(), f, ensure_ascii=False, separators=(',', ':'))
+        tmp_path.replace(path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> 'SearchIndex':
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return cls.from_snapshot(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return cls()
+
+
+# ===== SNIPPETS =====
+
+def highlight_snippet(text: str, terms: Iterable[str], window: int = 24) -> str:
+    """Return an HTML-escaped excerpt of ``text`` with matched terms in <mark>."""
+    text = MARKDOWN_RE.sub('', text or '')
+    terms = set(terms)
+    tokens = [(m.start(), m.end(), analyze_token(m.group()) in terms) for m in TOKEN_RE.finditer(text)]
+    if not tokens:
+        return ''
+
+    hit_positions = [i for i, token in enumerate(tokens) if token[2]]
+    best_start = 0
+    if hit_positions:
+        best_count = -1
+        for start in hit_positions:
+            count = bisect.bisect_left(hit_positions, start + window) - bisect.bisect_left(hit_positions, start)
+            if count > best_count:
+                best_start, best_count = max(start - 3, 0), count
+    selected = tokens[best_start:best_start + window]
+
+    parts = []
+    cursor = selected[0][0]
+    for start, end, matched in selected:
+        parts.append(html.escape(text[cursor:start]))
+        word = html.escape(text[start:end])
+        parts.append(f'<mark>{word}</mark>' if matched else word)
+        cursor = end
+    snippet = ' '.join(''.join(parts).split())
+    if best_start > 0:
+        snippet = '… ' + snippet
+    if best_start + window < len(tokens):
+        snippet += ' …'
+    return snippet
+
+
+# ===== SYNC =====
+
+async def reconcile(index: SearchIndex, topics, batch_size: int = 500) -> Dict[str, int]:
+    """Bring ``index`` in line with the topics collection.
+
+    Only ids and timestamps are read for the whole collection; full documents
+    are fetched just for topics that are new or changed since the snapshot.
+    """
+    known = index.stamps()
+    changed = []
+    seen = set()
+    async for topic in topics.find({}, {'_id': 0, 'id': 1, 'created_at': 1, 'updated_at': 1}):
+        seen.add(topic['id'])
+        if known.get(topic['id']) != doc_stamp(topic) or topic['id'] not in known:
+            changed.append(topic['id'])
+
+    removed = [doc_id for doc_id in known if doc_id not in seen]
+    for doc_id in removed:
+        index.remove(doc_id)
+
+    for start in range(0, len(changed), batch_size):
+        batch = changed[start:start + batch_size]
+        async for topic in topics.find({'id': {'$in': batch}}, {'_id': 0}):
+            index.add(topic)
+
+    return {'indexed': len(changed), 'removed': len(removed), 'total': len(index)}
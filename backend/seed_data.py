@@ -1,11 +1,17 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import argparse
 import asyncio
+import logging
 from dotenv import load_dotenv
 from pathlib import Path
 import uuid
 from datetime import datetime, timezone
 import bcrypt
+from indexes import ensure_indexes
+from topic_renders import store_renders
+from rollups import reconcile as reconcile_rollups
+from synthetic_data import generate, password_hash, det_uuid, GENERATED_COLLECTIONS
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -24,9 +30,13 @@ async def seed_database():
     await db.classes.delete_many({})
     await db.subjects.delete_many({})
     await db.topics.delete_many({})
+    await db.topic_renders.delete_many({})
     await db.quizzes.delete_many({})
     await db.books.delete_many({})
     await db.mock_tests.delete_many({})
+    await db.mock_test_sessions.delete_many({})
+    # rebuilt from the new quizzes when the server starts
+    await db.questions.delete_many({})
     await db.users.delete_many({})
     
     # Create admin user
@@ -239,6 +249,7 @@ Step 3: x = 3''',
     
     await db.topics.insert_many(topics_data)
     print(f"Created {len(topics_data)} topics")
+    await store_renders(db.topic_renders, topics_data)
     
     # Seed Quizzes
     quizzes_data = []
@@ -345,9 +356,32 @@ Step 3: x = 3''',
         }
     ]
     
+    # Mock tests carry their own paper, graded like quizzes
+    for test in mock_tests_data:
+        marks = test['total_marks'] / test['questions_count']
+        test['negative_marking'] = 0.25
+        test['questions'] = [
+            {
+                'id': str(uuid.uuid4()),
+                'question': f'{test["subject"]} question {i + 1}',
+                'question_hi': f'{test["subject"]} प्रश्न {i + 1}',
+                'options': ['Option A', 'Option B', 'Option C', 'Option D'],
+                'correct_answer': ['Option A', 'Option B', 'Option C', 'Option D'][i % 4],
+                'marks': marks
+            }
+            for i in range(test['questions_count'])
+        ]
+    
     await db.mock_tests.insert_many(mock_tests_data)
     print(f"Created {len(mock_tests_data)} mock tests")
     
+    report = await ensure_indexes(db)
+    print(f"Indexes created: {len(report['created'])}, errors: {len(report['errors'])}")
+    
+    # The server only backfills rollups when none exist, so recount them against the new data
+    rollup_report = await reconcile_rollups(db, db.analytics_rollups)
+    print(f"Analytics rollups rebuilt: {rollup_report['days']} days")
+    
     print("\n=== Database seeded successfully! ===")
     print(f"Admin: admin@educationroot.com / admin123")
     print(f"Student: student@test.com / student123")
@@ -359,6 +393,81 @@ Step 3: x = 3''',
     print(f"- {len(books_data)} books")
     print(f"- {len(mock_tests_data)} mock tests")
 
+async def generate_database(args):
+    print(f"Generating synthetic dataset (seed {args.seed})...")
+    for name in GENERATED_COLLECTIONS:
+        await db[name].drop()
+    
+    rounds = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+    as_of = datetime.fromisoformat(args.as_of).replace(tzinfo=timezone.utc) if args.as_of else \
+        datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    counts = await generate(
+        db,
+        seed=args.seed,
+        users=args.users,
+        results_per_user=args.results_per_user,
+        topics=args.topics,
+        quiz_ratio=args.quiz_ratio,
+        books=args.books,
+        bookmarks_per_user=args.bookmarks_per_user,
+        orders_per_user=args.orders_per_user,
+        # bcrypt once for everyone instead of once per user
+        password_hash=password_hash('student123', args.seed, rounds),
+        as_of=as_of,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        chunk_docs=args.chunk_size
+    )
+    
+    await db.users.insert_one({
+        'id': det_uuid(args.seed, 'admin', 0),
+        'name': 'Admin User',
+        'email': 'admin@educationroot.com',
+        'password': password_hash('admin123', args.seed, rounds),
+        'role': 'admin',
+        'language': 'en',
+        'token_version': 0,
+        'created_at': as_of.isoformat()
+    })
+    
+    print("Building indexes...")
+    report = await ensure_indexes(db)
+    print(f"Indexes created: {len(report['created'])}, errors: {len(report['errors'])}")
+    
+    print("\n=== Synthetic dataset generated! ===")
+    print("Admin: admin@educationroot.com / admin123")
+    print("Students: student<N>@synthetic.test / student123")
+    for name, count in counts.items():
+        print(f"- {count} {name}")
+    print("Topic renders and analytics rollups are rebuilt by the API on first use.")
+
+def count(value: str) -> int:
+    # accepts 1e6 as well as 1000000
+    return int(float(value))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Seed the database with sample content or a synthetic dataset')
+    parser.add_argument('--generate', action='store_true', help='generate a large synthetic dataset instead')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=count, default=10000)
+    parser.add_argument('--results-per-user', type=count, default=20)
+    parser.add_argument('--topics', type=count, default=2000)
+    parser.add_argument('--quiz-ratio', type=float, default=0.5, help='share of topics that get a quiz')
+    parser.add_argument('--books', type=count, default=200)
+    parser.add_argument('--bookmarks-per-user', type=float, default=3)
+    parser.add_argument('--orders-per-user', type=float, default=0.5)
+    parser.add_argument('--as-of', help='YYYY-MM-DD all timestamps are relative to (default: today, UTC)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='generator processes (0 generates in-process)')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent insert_many calls')
+    parser.add_argument('--chunk-size', type=count, default=10000, help='documents per insert_many')
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    asyncio.run(seed_database())
+    args = parse_args()
+    if args.generate:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+        asyncio.run(generate_database(args))
+    else:
+        asyncio.run(seed_database())
     client.close()
\ No newline at end of file
@@ -1,25 +1,69 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
+import random
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
-import bcrypt
-import razorpay
+import orjson
+from password_hashing import PasswordHasher, HasherOverloaded
+from instrumentation import CommandAccounting, InstrumentationMiddleware, LoopLagMonitor, metrics_payload
+from query_profiler import QueryProfiler
+from caching import TTLCache
+from indexes import ensure_indexes, log_index_report
+from catalog_cache import CatalogCache, etag_response, not_modified
+from grading import AnswerKey, AnswerKeyCache, grade_one, grade_many
+from mock_tests import MockTestEngine, SessionNotFound, SessionClosed
+from leaderboards import Leaderboards, SCOPES as LEADERBOARD_SCOPES
+from invalidation_bus import InvalidationBus, Change
+from entitlements import Entitlements, order_lines, order_quantities
+from review_scheduler import ReviewScheduler
+from question_bank import (
+    QuestionBank, InvalidPaper, ANSWER_FIELDS, DIFFICULTIES, SCOPES as BANK_SCOPES, sign_paper, open_paper,
+    paper_id, backfill_from_quizzes
+)
+from payments import create_gateway, PaymentGatewayError, CircuitOpen
+from write_behind import WriteBehindQueue
+from pagination import keyset_page, keyset_find, ndjson_lines, InvalidCursor
+from rollups import Rollups, reconcile as reconcile_rollups, TOTALS_ID
+from localization import resolve_language, language_projection, BOTH, HINDI_OVERLAYS, LANGUAGES
+from topic_renders import store_renders, pick_encoding
+from bulk_import import (
+    BulkImporter, ImportProgressResponse, ImportFormatError, NATURAL_KEYS, detect_format, read_rows, imported
+)
+from response_models import (
+    ClassList, SubjectList, TopicList, TopicDetail, QuizDetail, MockTestList, MockTestPaper, BookList, BookDetail,
+    QuizGrade, BulkGradeResult, LeaderboardOut, BootstrapOut, EntitlementsOut, MockTestSessionOut, MockTestDeltaAck,
+    ProgressPage, BookmarkPage, PurchasePage, ProgressSummary, MessageOut, PracticePaper, PracticeGrade,
+    ReviewQueue, ReviewGrade
+)
+from search_index import SearchIndex, DEVANAGARI_RE, highlight_snippet, reconcile as reconcile_search_index
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Attributes MongoDB commands and time to the request that issued them
+command_accounting = CommandAccounting()
+# Times every query shape and explains the slow ones
+query_profiler = QueryProfiler(
+    slow_ms=float(os.environ.get('SLOW_QUERY_MS', '100')),
+    explain_interval=float(os.environ.get('QUERY_EXPLAIN_INTERVAL', '300')),
+    enabled=os.environ.get('QUERY_PROFILER', 'true').lower() == 'true'
+)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[command_accounting, query_profiler])
 db = client[os.environ['DB_NAME']]
 
 # JWT Configuration
@@ -27,14 +71,130 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production'
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24 * 30
 
+# When true, every authenticated request re-validates the user against MongoDB
+# instead of trusting the signed token claims
+AUTH_STRICT_DB = os.environ.get('AUTH_STRICT_DB', 'false').lower() == 'true'
+
+# Full user profiles, and the lowest token version still accepted per user.
+# The versions mirror users.token_version and are reloaded from it on a miss.
+user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', '10000')),
+    ttl=int(os.environ.get('USER_CACHE_TTL', '300'))
+)
+token_versions = TTLCache(maxsize=int(os.environ.get('TOKEN_VERSION_CACHE_SIZE', '100000')))
+
+# Serialized catalog responses (classes, subjects, topics, books, mock tests)
+catalog_cache = CatalogCache(
+    maxsize=int(os.environ.get('CATALOG_CACHE_SIZE', '2048')),
+    ttl=int(os.environ.get('CATALOG_CACHE_TTL', '600'))
+)
+
+# Precompiled quiz answer keys
+answer_keys = AnswerKeyCache(db.quizzes, db.topics, maxsize=int(os.environ.get('ANSWER_KEY_CACHE_SIZE', '10000')))
+# How far back a student's offline attempt may be dated; admin uploads may go further
+OFFLINE_SUBMIT_WINDOW = timedelta(hours=float(os.environ.get('OFFLINE_SUBMIT_WINDOW_HOURS', '72')))
+
+# Timed mock test sittings, held in memory and autosaved in batches
+mock_test_keys = AnswerKeyCache(db.mock_tests, maxsize=int(os.environ.get('ANSWER_KEY_CACHE_SIZE', '10000')))
+mock_test_engine = MockTestEngine(
+    db.mock_test_sessions,
+    mock_test_keys,
+    flush_interval=float(os.environ.get('MOCK_TEST_FLUSH_INTERVAL', '5')),
+    grace=float(os.environ.get('MOCK_TEST_GRACE_SECONDS', '5'))
+)
+
+# Rankings kept in memory, updated as results are written by any worker
+leaderboards = Leaderboards(
+    db.quiz_results,
+    db.topics,
+    poll_interval=float(os.environ.get('LEADERBOARD_POLL_INTERVAL', '2')),
+    overlap=float(os.environ.get('LEADERBOARD_POLL_OVERLAP', '10'))
+)
+user_names = TTLCache(maxsize=int(os.environ.get('USER_NAME_CACHE_SIZE', '50000')), ttl=3600)
+
+# What each user has bought, materialized from completed orders
+entitlements = Entitlements(
+    db.entitlements,
+    db.orders,
+    db.books,
+    db.topics,
+    classes=db.classes,
+    plans=db.plans,
+    cache_size=int(os.environ.get('ENTITLEMENT_CACHE_SIZE', '50000')),
+    ttl=float(os.environ.get('ENTITLEMENT_CACHE_TTL', '600'))
+)
+
+# Question bank indexed in memory for randomized quiz and mock test assembly
+question_bank = QuestionBank(db.questions)
+PRACTICE_PAPER_TTL_HOURS = float(os.environ.get('PRACTICE_PAPER_TTL_HOURS', '6'))
+RECENT_QUESTIONS = int(os.environ.get('RECENT_QUESTIONS', '200'))
+
+# Spaced repetition state per user and question, fed by every graded answer
+REVIEW_NIGHTLY_HOUR = os.environ.get('REVIEW_NIGHTLY_HOUR', '3')  # UTC; empty disables the nightly pass
+review_scheduler = ReviewScheduler(
+    db.review_items,
+    db.job_locks,
+    flush_interval=float(os.environ.get('REVIEW_FLUSH_SECONDS', '2')),
+    max_interval=float(os.environ.get('REVIEW_MAX_INTERVAL_DAYS', '365')),
+    fuzz=float(os.environ.get('REVIEW_FUZZ', '0.05')),
+    nightly_hour=int(REVIEW_NIGHTLY_HOUR) if REVIEW_NIGHTLY_HOUR else None
+)
+
+# Keeps the caches above coherent when another worker writes
+invalidation_bus = InvalidationBus(
+    db,
+    ('topics', 'books', 'quizzes', 'users', 'orders', 'questions'),
+    mode=os.environ.get('CACHE_BUS_MODE', 'auto'),
+    poll_interval=float(os.environ.get('CACHE_BUS_POLL_INTERVAL', '1'))
+)
+
+# Batched inserts for append-only collections (quiz_results, bookmarks)
+write_behind = WriteBehindQueue(
+    db,
+    max_batch=int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '500')),
+    flush_interval=int(os.environ.get('WRITE_BEHIND_FLUSH_MS', '100')) / 1000,
+    max_pending=int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '20000')),
+    spill_path=Path(os.environ.get('WRITE_BEHIND_SPILL_PATH', ROOT_DIR / 'write_behind.spill.jsonl'))
+)
+
+# Analytics counters, updated as writes happen
+rollups = Rollups(db.analytics_rollups, flush_interval=float(os.environ.get('ROLLUP_FLUSH_SECONDS', '2')))
+
+# Pre-rendered topic content (sanitized HTML plus gzip/brotli bodies)
+render_cache = TTLCache(
+    maxsize=int(os.environ.get('RENDER_CACHE_SIZE', '1024')),
+    ttl=int(os.environ.get('RENDER_CACHE_TTL', '600'))
+)
+
+# Topic search index, persisted between restarts
+SEARCH_SNAPSHOT_PATH = Path(os.environ.get('SEARCH_SNAPSHOT_PATH', ROOT_DIR / 'search_index.json.gz'))
+search_index = SearchIndex()
+
 # Razorpay Configuration (Test mode)
 RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID', 'rzp_test_placeholder')
 RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', 'placeholder_secret')
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+payment_gateway = create_gateway(
+    os.environ.get('PAYMENT_GATEWAY', 'razorpay'),
+    RAZORPAY_KEY_ID,
+    RAZORPAY_KEY_SECRET,
+    timeout=float(os.environ.get('PAYMENT_TIMEOUT_SECONDS', '5')),
+    max_retries=int(os.environ.get('PAYMENT_MAX_RETRIES', '2')),
+    stub_latency=float(os.environ.get('PAYMENT_STUB_LATENCY', '0'))
+)
+
+# Password hashing pool (bcrypt runs off the event loop)
+password_hasher = PasswordHasher(
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', '12')),
+    max_workers=int(os.environ.get('AUTH_HASH_WORKERS', '4')),
+    max_queue=int(os.environ.get('AUTH_HASH_QUEUE_LIMIT', '64')),
+    retry_after=int(os.environ.get('AUTH_HASH_RETRY_AFTER', '2')),
+    use_processes=os.environ.get('AUTH_HASH_EXECUTOR', 'thread') == 'process'
+)
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # ===== MODELS =====
@@ -58,6 +218,13 @@ class User(BaseModel):
     language: str = "en"
     created_at: str
 
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
+class RoleUpdate(BaseModel):
+    role: str
+
 class TopicCreate(BaseModel):
     class_id: str
     subject_id: str
@@ -67,11 +234,24 @@ class TopicCreate(BaseModel):
     content_hi: str
     formulas: Optional[List[str]] = []
     diagrams: Optional[List[str]] = []
+    premium: bool = False
 
 class QuizSubmit(BaseModel):
     quiz_id: str
     topic_id: str
-    answers: Dict[str, str]
+    answers: Dict[str, Union[str, List[str]]]
+
+class BulkQuizSubmission(QuizSubmit):
+    user_id: Optional[str] = None
+    submitted_at: Optional[datetime] = None
+
+class BulkQuizSubmit(BaseModel):
+    submissions: List[BulkQuizSubmission] = Field(..., max_length=1000)
+
+class MockTestDelta(BaseModel):
+    seq: int = Field(..., ge=1)
+    answers: Dict[str, Union[str, List[str], None]] = Field(default_factory=dict, max_length=500)
+    flags: Dict[str, bool] = Field(default_factory=dict, max_length=500)
 
 class BookCreate(BaseModel):
     title: str
@@ -82,42 +262,202 @@ class BookCreate(BaseModel):
     class_id: str
 
 class OrderCreate(BaseModel):
-    amount: int
+    # the total the cart showed; the charge is always priced from the catalog
+    amount: Optional[int] = None
     currency: str = "INR"
-    items: List[Dict[str, Any]]
+    items: List[Dict[str, Any]] = Field(..., min_length=1, max_length=100)
+
+class PaymentVerify(BaseModel):
+    order_id: str
+    payment_id: str
+    signature: str
 
 class BookmarkCreate(BaseModel):
     topic_id: str
     title: str
 
+class QuestionCreate(BaseModel):
+    class_id: str
+    subject_id: str
+    topic_id: str
+    question: str
+    question_hi: str
+    options: List[str] = Field(..., min_length=2)
+    options_hi: Optional[List[str]] = None
+    correct_answer: Union[str, List[str]]
+    marks: float = 1
+    difficulty: str = 'medium'
+    tags: List[str] = []
+    explanation: Optional[str] = None
+
+class ReviewSubmit(BaseModel):
+    answers: Dict[str, Union[str, List[str]]] = Field(..., min_length=1, max_length=100)
+
+class PracticeSubmit(BaseModel):
+    token: str
+    answers: Dict[str, Union[str, List[str]]]
+
+class MockTestAssemble(BaseModel):
+    title: str
+    title_hi: str
+    scope: str = 'class'
+    scope_id: str
+    subject: Optional[str] = None
+    questions_count: int = Field(..., ge=1, le=500)
+    duration_minutes: int = Field(..., ge=1)
+    total_marks: float = Field(..., gt=0)
+    negative_marking: float = 0
+    mix: Optional[Dict[str, float]] = None
+    tags: List[str] = []
+    seed: Optional[int] = None
+
 # ===== HELPER FUNCTIONS =====
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_hasher.verify(password, hashed)
 
-def create_token(user_id: str) -> str:
+def create_token(user: dict) -> str:
     payload = {
-        'user_id': user_id,
+        'user_id': user['id'],
+        'name': user['name'],
+        'email': user['email'],
+        'role': user.get('role', 'student'),
+        'language': user.get('language', 'en'),
+        'tv': user.get('token_version', 0),
         'exp': datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+async def load_user(user_id: str, fresh: bool = False) -> Optional[dict]:
+    user = None if fresh else user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({'id': user_id}, {'_id': 0, 'password': 0})
+        if user:
+            user_cache.set(user_id, user)
+    return user
+
+def invalidate_user(user_id: str, token_version: Optional[int] = None):
+    user_cache.pop(user_id)
+    user_names.pop(user_id)
+    # versions only go up, and changes from other workers may arrive late
+    if token_version is not None and token_version > token_versions.get(user_id, 0):
+        token_versions.set(user_id, token_version)
+
+async def accepted_token_version(user_id: str) -> Optional[int]:
+    # The user document is the durable record; the cache only saves the read
+    version = token_versions.get(user_id)
+    if version is None:
+        user = await db.users.find_one({'id': user_id}, {'_id': 0, 'token_version': 1})
+        if user is None:
+            return None
+        # a revocation may have reached the cache while the read was in flight
+        version = max(user.get('token_version', 0), token_versions.get(user_id, 0))
+        token_versions.set(user_id, version)
+    return version
+
+async def revoke_user_tokens(user_id: str, changes: Optional[dict] = None) -> Optional[dict]:
+    update = {'$inc': {'token_version': 1}}
+    if changes:
+        update['$set'] = changes
+    user = await db.users.find_one_and_update(
+        {'id': user_id},
+        update,
+        {'_id': 0, 'password': 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if user:
+        invalidate_user(user_id, user['token_version'])
+        await invalidation_bus.publish('users', user_id, {'id': user_id, 'token_version': user['token_version']})
+    return user
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get('user_id')
-        user = await db.users.find_one({'id': user_id}, {'_id': 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    
+    user_id = payload.get('user_id')
+    token_version = payload.get('tv')
+    
+    # Legacy tokens carry no claims, so they always take the DB path
+    if AUTH_STRICT_DB or token_version is None:
+        user = await load_user(user_id, fresh=AUTH_STRICT_DB)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        if token_version is not None and token_version != user.get('token_version', 0):
+            raise HTTPException(status_code=401, detail="Token revoked")
+        return user
+    
+    accepted = await accepted_token_version(user_id)
+    if accepted is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    if token_version < accepted:
+        raise HTTPException(status_code=401, detail="Token revoked")
+    
+    return {
+        'id': user_id,
+        'name': payload.get('name'),
+        'email': payload.get('email'),
+        'role': payload.get('role', 'student'),
+        'language': payload.get('language', 'en')
+    }
+
+async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    # Claims only, no DB lookup; public routes just use them for personalization
+    if not credentials:
+        return None
+    try:
+        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        return None
+    return {'id': payload.get('user_id'), 'language': payload.get('language')}
+
+async def content_language(lang: Optional[str] = None, user: Optional[dict] = Depends(get_optional_user)) -> str:
+    try:
+        return resolve_language(lang, user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def check_premium_access(gate, user: dict):
+    if user['role'] != 'admin' and not await entitlements.has_access(user['id'], gate.class_id):
+        raise HTTPException(status_code=403, detail="Purchase required to access this content")
+
+async def require_topic_access(topic_id: str,
+                               credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    gate = await entitlements.gate(topic_id)
+    if gate is None or not gate.premium:
+        # free content, or an unknown topic the route itself answers with 404
+        return
+    if not credentials:
+        raise HTTPException(status_code=401, detail="Login required for premium content")
+    await check_premium_access(gate, await get_current_user(credentials))
+
+async def require_mock_test_access(test_id: str,
+                                   credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    # a paper is as premium as the most premium topic its questions come from
+    test = await db.mock_tests.find_one({'id': test_id}, {'_id': 0, 'topic_ids': 1, 'questions.id': 1})
+    if not test:
+        return
+    topic_ids = test.get('topic_ids')
+    if topic_ids is None:
+        # papers assembled before topic_ids was stored
+        question_ids = [question['id'] for question in test.get('questions') or []]
+        topic_ids = await db.questions.distinct('topic_id', {'id': {'$in': question_ids}})
+    gates = [gate for gate in [await entitlements.gate(topic_id) for topic_id in topic_ids]
+             if gate is not None and gate.premium]
+    if not gates:
+        return
+    if not credentials:
+        raise HTTPException(status_code=401, detail="Login required for premium content")
+    user = await get_current_user(credentials)
+    for gate in gates:
+        await check_premium_access(gate, user)
 
 # ===== AUTH ROUTES =====
 
@@ -132,14 +472,16 @@ async def register(data: UserRegister):
         'id': user_id,
         'name': data.name,
         'email': data.email,
-        'password': hash_password(data.password),
+        'password': await hash_password(data.password),
         'role': 'student',
         'language': data.language,
+        'token_version': 0,
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
     await db.users.insert_one(user_doc)
-    token = create_token(user_id)
+    rollups.record_signup(user_doc['created_at'])
+    token = create_token(user_doc)
     
     return {
         'token': token,
@@ -155,10 +497,21 @@ async def register(data: UserRegister):
 @api_router.post("/auth/login")
 async def login(data: UserLogin):
     user = await db.users.find_one({'email': data.email})
-    if not user or not verify_password(data.password, user['password']):
+    if not user or not await verify_password(data.password, user['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = create_token(user['id'])
+    # Upgrade the stored hash when BCRYPT_ROUNDS has changed
+    if password_hasher.needs_rehash(user['password']):
+        try:
+            await db.users.update_one(
+                {'id': user['id']},
+                {'$set': {'password': await hash_password(data.password)}}
+            )
+            password_hasher.record_rehash()
+        except HasherOverloaded:
+            pass
+    
+    token = create_token(user)
     
     return {
         'token': token,
@@ -173,156 +526,613 @@ async def login(data: UserLogin):
 
 @api_router.get("/auth/me")
 async def get_me(current_user: dict = Depends(get_current_user)):
-    return {'user': current_user}
+    user = await load_user(current_user['id'])
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return {'user': user}
+
+@api_router.post("/auth/change-password")
+async def change_password(data: PasswordChange, current_user: dict = Depends(get_current_user)):
+    user = await db.users.find_one({'id': current_user['id']}, {'_id': 0, 'password': 1})
+    if not user or not await verify_password(data.current_password, user['password']):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    user = await revoke_user_tokens(
+        current_user['id'],
+        {'password': await hash_password(data.new_password)}
+    )
+    
+    return {'message': 'Password changed', 'token': create_token(user)}
 
 # ===== CONTENT ROUTES =====
 
-@api_router.get("/classes")
-async def get_classes():
-    classes = await db.classes.find({}, {'_id': 0}).to_list(100)
-    return {'classes': classes}
-
-@api_router.get("/subjects/{class_id}")
-async def get_subjects(class_id: str):
-    subjects = await db.subjects.find({'class_id': class_id}, {'_id': 0}).to_list(100)
-    return {'subjects': subjects}
-
-@api_router.get("/topics/{subject_id}")
-async def get_topics(subject_id: str):
-    topics = await db.topics.find({'subject_id': subject_id}, {'_id': 0, 'content': 0, 'content_hi': 0}).to_list(100)
-    return {'topics': topics}
-
-@api_router.get("/topic/{topic_id}")
-async def get_topic(topic_id: str):
-    topic = await db.topics.find_one({'id': topic_id}, {'_id': 0})
-    if not topic:
+async def classes_entry(lang: str):
+    async def load():
+        classes = await db.classes.find({}, language_projection(lang)).to_list(100)
+        return {'classes': classes}
+    
+    return await catalog_cache.get_or_load(f'classes:{lang}', load, ClassList)
+
+@api_router.get("/classes", response_model=ClassList, response_model_exclude_unset=True)
+async def get_classes(request: Request, lang: str = Depends(content_language)):
+    return etag_response(request, await classes_entry(lang))
+
+@api_router.get("/subjects/{class_id}", response_model=SubjectList, response_model_exclude_unset=True)
+async def get_subjects(class_id: str, request: Request, lang: str = Depends(content_language)):
+    async def load():
+        subjects = await db.subjects.find({'class_id': class_id}, language_projection(lang)).to_list(100)
+        return {'subjects': subjects}
+    
+    return etag_response(request, await catalog_cache.get_or_load(f'subjects:{class_id}:{lang}', load, SubjectList))
+
+@api_router.get("/topics/{subject_id}", response_model=TopicList, response_model_exclude_unset=True)
+async def get_topics(subject_id: str, request: Request, lang: str = Depends(content_language)):
+    async def load():
+        projection = language_projection(lang, {'_id': 0, 'content': 0, 'content_hi': 0})
+        topics = await db.topics.find({'subject_id': subject_id}, projection).to_list(100)
+        return {'topics': topics}
+    
+    return etag_response(request, await catalog_cache.get_or_load(f'topics:{subject_id}:{lang}', load, TopicList))
+
+@api_router.get("/topic/{topic_id}", response_model=TopicDetail, response_model_exclude_unset=True, dependencies=[Depends(require_topic_access)])
+async def get_topic(topic_id: str, request: Request, content: bool = True, lang: str = Depends(content_language)):
+    # content=false is for pages that show the body from /rendered and only need the metadata
+    projection = language_projection(lang) if content else {**language_projection(lang), 'content': 0, 'content_hi': 0}
+    
+    async def load():
+        topic = await db.topics.find_one({'id': topic_id}, projection)
+        return {'topic': topic} if topic else None
+    
+    entry = await catalog_cache.get_or_load(f'topic:{topic_id}:{lang}:{"full" if content else "meta"}', load,
+                                         TopicDetail)
+    if not entry.found:
         raise HTTPException(status_code=404, detail="Topic not found")
-    return {'topic': topic}
+    return etag_response(request, entry)
 
-@api_router.get("/quiz/{topic_id}")
-async def get_quiz(topic_id: str):
-    quiz = await db.quizzes.find_one({'topic_id': topic_id}, {'_id': 0})
+async def load_topic_render(topic_id: str, lang: str) -> Optional[dict]:
+    key = f'{topic_id}:{lang}'
+    render = render_cache.get(key)
+    if render is None:
+        render = await db.topic_renders.find_one({'_id': key})
+        if render is None:
+            # topics written before renders existed are rendered on first view
+            topic = await db.topics.find_one({'id': topic_id}, {'_id': 0, 'id': 1, 'content': 1, 'content_hi': 1})
+            if not topic:
+                return None
+            render = next(doc for doc in await store_renders(db.topic_renders, [topic]) if doc['_id'] == key)
+        render_cache.set(key, render)
+    return render
+
+@api_router.get("/topic/{topic_id}/rendered", dependencies=[Depends(require_topic_access)])
+async def get_topic_rendered(topic_id: str, request: Request, lang: str = Depends(content_language)):
+    render = await load_topic_render(topic_id, 'en' if lang == BOTH else lang)
+    if not render:
+        raise HTTPException(status_code=404, detail="Topic not found")
+    
+    headers = {'ETag': render['etag'], 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if not_modified(request, render['etag']):
+        return Response(status_code=304, headers=headers)
+    encoding = pick_encoding(request.headers.get('accept-encoding'), render)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(content=render[encoding], media_type='application/json', headers=headers)
+
+@api_router.get("/quiz/{topic_id}", response_model=QuizDetail, response_model_exclude_unset=True, dependencies=[Depends(require_topic_access)])
+async def get_quiz(topic_id: str, lang: str = Depends(content_language)):
+    projection = language_projection(lang, language_projection(lang), prefix='questions.', overlays=HINDI_OVERLAYS)
+    quiz = await db.quizzes.find_one({'topic_id': topic_id}, projection)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     return {'quiz': quiz}
 
-@api_router.post("/quiz/submit")
+def submission_time(submitted_at: Optional[datetime], is_admin: bool) -> datetime:
+    # Client clocks date rollups, history order and leaderboard ties, so keep them in bounds
+    now = datetime.now(timezone.utc)
+    if submitted_at is None:
+        return now
+    if submitted_at.tzinfo is None:
+        submitted_at = submitted_at.replace(tzinfo=timezone.utc)
+    submitted_at = min(submitted_at.astimezone(timezone.utc), now)
+    if not is_admin:
+        submitted_at = max(submitted_at, now - OFFLINE_SUBMIT_WINDOW)
+    return submitted_at
+
+def quiz_result_doc(user_id: str, key, graded: dict, submitted_at: Optional[str] = None) -> dict:
+    return {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'quiz_id': key.quiz_id,
+        'topic_id': key.topic_id,
+        'score': graded['score'],
+        'correct': graded['correct'],
+        'total': graded['total'],
+        'marks': graded['marks'],
+        'submitted_at': submitted_at or datetime.now(timezone.utc).isoformat()
+    }
+
+@api_router.post("/quiz/submit", response_model=QuizGrade)
 async def submit_quiz(data: QuizSubmit, current_user: dict = Depends(get_current_user)):
-    quiz = await db.quizzes.find_one({'id': data.quiz_id}, {'_id': 0})
-    if not quiz:
+    key = await answer_keys.get(data.quiz_id)
+    if not key:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
-    correct_count = 0
-    total = len(quiz['questions'])
+    graded = grade_one(key, data.answers)
+    result_doc = quiz_result_doc(current_user['id'], key, graded)
     
-    for question in quiz['questions']:
-        q_id = question['id']
-        if data.answers.get(q_id) == question['correct_answer']:
-            correct_count += 1
+    await write_behind.put('quiz_results', result_doc)
+    rollups.record_quiz_attempt(key.subject_id, graded['score'], result_doc['submitted_at'])
+    leaderboards.record(current_user['id'], key.quiz_id, key.topic_id, key.class_id, graded['score'],
+                        result_doc['submitted_at'])
+    review_scheduler.record(current_user['id'], key, key.encode(data.answers), graded['per_question'])
+    
+    return {
+        'score': graded['score'],
+        'correct': graded['correct'],
+        'total': graded['total'],
+        'marks': graded['marks'],
+        'max_marks': graded['max_marks']
+    }
+
+@api_router.post("/quiz/submit/bulk", response_model=BulkGradeResult, response_model_exclude_unset=True)
+async def submit_quiz_bulk(data: BulkQuizSubmit, current_user: dict = Depends(get_current_user)):
+    # Students sync their own offline attempts; admins may upload for a class
+    is_admin = current_user['role'] == 'admin'
+    by_quiz: Dict[str, List[int]] = {}
+    for i, submission in enumerate(data.submissions):
+        if submission.user_id and submission.user_id != current_user['id'] and not is_admin:
+            raise HTTPException(status_code=403, detail="Admin access required")
+        by_quiz.setdefault(submission.quiz_id, []).append(i)
+    
+    results: List[Optional[dict]] = [None] * len(data.submissions)
+    result_docs = []
+    for quiz_id, positions in by_quiz.items():
+        key = await answer_keys.get(quiz_id)
+        if not key:
+            for i in positions:
+                results[i] = {'quiz_id': quiz_id, 'error': 'Quiz not found'}
+            continue
+        
+        submissions = [data.submissions[i] for i in positions]
+        for i, submission, graded in zip(positions, submissions, grade_many(key, [sub.answers for sub in submissions])):
+            submitted_at = submission_time(submission.submitted_at, is_admin)
+            result_doc = quiz_result_doc(submission.user_id or current_user['id'], key, graded,
+                                         submitted_at.isoformat())
+            result_docs.append(result_doc)
+            rollups.record_quiz_attempt(key.subject_id, graded['score'], result_doc['submitted_at'])
+            leaderboards.record(result_doc['user_id'], key.quiz_id, key.topic_id, key.class_id, graded['score'],
+                                result_doc['submitted_at'])
+            review_scheduler.record(result_doc['user_id'], key, key.encode(submission.answers),
+                                    graded['per_question'], submitted_at)
+            results[i] = {
+                'quiz_id': quiz_id,
+                'score': graded['score'],
+                'correct': graded['correct'],
+                'total': graded['total']
+            }
+    
+    if result_docs:
+        await db.quiz_results.insert_many(result_docs, ordered=False)
+    
+    return {'graded': len(result_docs), 'results': results}
+
+# ===== LEADERBOARD ROUTES =====
+
+async def with_names(entries: List[dict]) -> List[dict]:
+    missing = [entry['user_id'] for entry in entries if user_names.get(entry['user_id']) is None]
+    if missing:
+        async for user in db.users.find({'id': {'$in': missing}}, {'_id': 0, 'id': 1, 'name': 1}):
+            user_names.set(user['id'], user.get('name', ''))
+    return [{**entry, 'name': user_names.get(entry['user_id'], '')} for entry in entries]
+
+@api_router.get("/leaderboards/{scope}/{scope_id}", response_model=LeaderboardOut)
+async def get_leaderboard(scope: str, scope_id: str, limit: int = 10,
+                          user: Optional[dict] = Depends(get_optional_user)):
+    if scope not in LEADERBOARD_SCOPES:
+        raise HTTPException(status_code=404, detail="Leaderboard not found")
+    if not leaderboards.ready:
+        raise HTTPException(status_code=503, detail="Leaderboards are loading")
+    
+    size, top = leaderboards.top(scope, scope_id, max(1, min(limit, 100)))
+    me = leaderboards.rank(scope, scope_id, user['id']) if user and user.get('id') else None
+    return {
+        'board': f'{scope}:{scope_id}',
+        'size': size,
+        'entries': await with_names(top),
+        'me': (await with_names([me]))[0] if me else None
+    }
+
+@api_router.get("/mock-tests", response_model=MockTestList, response_model_exclude_unset=True)
+async def get_mock_tests(request: Request, lang: str = Depends(content_language)):
+    async def load():
+        tests = await db.mock_tests.find({}, language_projection(lang, {'_id': 0, 'questions': 0})).to_list(100)
+        return {'tests': tests}
+    
+    return etag_response(request, await catalog_cache.get_or_load(f'mock-tests:{lang}', load, MockTestList))
+
+@api_router.get("/mock-tests/{test_id}/paper", response_model=MockTestPaper, response_model_exclude_unset=True,
+                dependencies=[Depends(require_mock_test_access)])
+async def get_mock_test_paper(test_id: str, request: Request, lang: str = Depends(content_language)):
+    async def load():
+        projection = language_projection(lang, language_projection(lang), prefix='questions.', overlays=HINDI_OVERLAYS)
+        projection['questions.correct_answer'] = 0
+        test = await db.mock_tests.find_one({'id': test_id}, projection)
+        return {'test': test} if test else None
+    
+    entry = await catalog_cache.get_or_load(f'mock-test:{test_id}:{lang}', load, MockTestPaper)
+    if not entry.found:
+        raise HTTPException(status_code=404, detail="Mock test not found")
+    return etag_response(request, entry)
+
+@api_router.post("/mock-tests/{test_id}/start", response_model=MockTestSessionOut,
+                 dependencies=[Depends(require_mock_test_access)])
+async def start_mock_test(test_id: str, current_user: dict = Depends(get_current_user)):
+    test = await db.mock_tests.find_one({'id': test_id}, {'_id': 0, 'duration_minutes': 1})
+    key = await mock_test_keys.get(test_id) if test else None
+    if not key or not len(key):
+        raise HTTPException(status_code=404, detail="Mock test not found")
+    
+    return await mock_test_engine.begin(current_user['id'], key, test.get('duration_minutes') or 60)
+
+@api_router.get("/mock-tests/sessions/{session_id}", response_model=MockTestSessionOut)
+async def get_mock_test_session(session_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        return await mock_test_engine.get(session_id, current_user['id'])
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+@api_router.patch("/mock-tests/sessions/{session_id}", response_model=MockTestDeltaAck)
+async def save_mock_test_answers(session_id: str, delta: MockTestDelta, current_user: dict = Depends(get_current_user)):
+    try:
+        return await mock_test_engine.apply(session_id, current_user['id'], delta.seq, delta.answers, delta.flags)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except SessionClosed:
+        raise HTTPException(status_code=409, detail="Session already submitted")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.post("/mock-tests/sessions/{session_id}/submit", response_model=MockTestSessionOut)
+async def submit_mock_test(session_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        return await mock_test_engine.submit(session_id, current_user['id'])
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except SessionClosed:
+        raise HTTPException(status_code=409, detail="Session already submitted")
+
+# ===== PRACTICE ROUTES =====
+
+def parse_mix(mix: Optional[str]) -> Optional[Dict[str, float]]:
+    """'easy:3,medium:5,hard:2' -> weights per difficulty."""
+    if not mix:
+        return None
+    weights = {}
+    for part in mix.split(','):
+        difficulty, _, weight = part.partition(':')
+        if difficulty.strip() not in DIFFICULTIES:
+            raise ValueError(f"Unknown difficulty: {difficulty.strip()}")
+        weights[difficulty.strip()] = float(weight)
+    return weights
+
+@api_router.get("/practice/paper", response_model=PracticePaper, response_model_exclude_unset=True)
+async def get_practice_paper(scope: str, scope_id: str, count: int = 10,
+                             mix: Optional[str] = None, tags: Optional[str] = None, seed: Optional[int] = None,
+                             lang: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    if scope not in BANK_SCOPES:
+        raise HTTPException(status_code=400, detail=f"Unknown scope: {scope}")
+    gate = await entitlements.gate(scope_id) if scope == 'topic' else None
+    if gate is not None and gate.premium:
+        await check_premium_access(gate, current_user)
+    if not question_bank.ready:
+        raise HTTPException(status_code=503, detail="Question bank is loading, please retry",
+                            headers={'Retry-After': '5'})
+    try:
+        lang = resolve_language(lang, current_user)
+        weights = parse_mix(mix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # subject and class scopes span topics, so premium ones the user hasn't bought are left out
+    locked = set() if current_user['role'] == 'admin' \
+        else await entitlements.locked_topics(current_user['id'], {f'{scope}_id': scope_id})
+    exposures = await db.question_exposures.find_one({'user_id': current_user['id']}, {'_id': 0, 'recent': 1})
+    seed = seed if seed is not None else random.getrandbits(32)
+    try:
+        questions = question_bank.assemble(
+            scope, scope_id, max(1, min(count, 100)), seed, weights,
+            tags=[tag.strip() for tag in tags.split(',') if tag.strip()] if tags else (),
+            seen=(exposures or {}).get('recent', ()),
+            allowed=(lambda question: question.get('topic_id') not in locked) if locked else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not questions:
+        raise HTTPException(status_code=404, detail="No questions match")
     
-    score = (correct_count / total) * 100
+    question_ids = [question['id'] for question in questions]
+    await db.question_exposures.update_one(
+        {'user_id': current_user['id']},
+        {'$push': {'recent': {'$each': question_ids, '$slice': -RECENT_QUESTIONS}}},
+        upsert=True
+    )
+    hidden = language_projection(lang, {field: 0 for field in ANSWER_FIELDS}, overlays=HINDI_OVERLAYS)
+    return {
+        'paper_id': paper_id(question_ids, seed),
+        'seed': seed,
+        'token': sign_paper(current_user['id'], question_ids, seed, JWT_SECRET, PRACTICE_PAPER_TTL_HOURS,
+                            JWT_ALGORITHM),
+        'questions': [{k: v for k, v in question.items() if k not in hidden} for question in questions],
+    }
+
+@api_router.post("/practice/submit", response_model=PracticeGrade)
+async def submit_practice(data: PracticeSubmit, current_user: dict = Depends(get_current_user)):
+    try:
+        question_ids, seed = open_paper(data.token, current_user['id'], JWT_SECRET, JWT_ALGORITHM)
+        questions = question_bank.paper(question_ids, seed)
+    except InvalidPaper as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    result_doc = {
+    # the key is rebuilt from the bank, so nothing was stored when the paper was handed out
+    key = AnswerKey({'id': paper_id(question_ids, seed), 'questions': questions})
+    graded = grade_one(key, data.answers)
+    review_scheduler.record(current_user['id'], key, key.encode(data.answers), graded['per_question'], origin=False)
+    await write_behind.put('practice_results', {
         'id': str(uuid.uuid4()),
         'user_id': current_user['id'],
-        'quiz_id': data.quiz_id,
-        'topic_id': data.topic_id,
-        'score': score,
-        'correct': correct_count,
-        'total': total,
+        'paper_id': key.quiz_id,
+        'question_ids': question_ids,
+        'seed': seed,
+        'score': graded['score'],
+        'correct': graded['correct'],
+        'total': graded['total'],
+        'marks': graded['marks'],
         'submitted_at': datetime.now(timezone.utc).isoformat()
+    })
+    
+    return {
+        'paper_id': key.quiz_id,
+        'score': graded['score'],
+        'correct': graded['correct'],
+        'total': graded['total'],
+        'marks': graded['marks'],
+        'max_marks': graded['max_marks']
     }
+
+# ===== REVIEW ROUTES =====
+
+@api_router.get("/student/review", response_model=ReviewQueue, response_model_exclude_unset=True)
+async def get_review_queue(limit: int = 20, lang: Optional[str] = None,
+                           current_user: dict = Depends(get_current_user)):
+    try:
+        lang = resolve_language(lang, current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    await db.quiz_results.insert_one(result_doc)
+    items, counts = await asyncio.gather(
+        review_scheduler.due(current_user['id'], max(1, min(limit, 100))),
+        review_scheduler.counts(current_user['id'])
+    )
+    hidden = language_projection(lang, {field: 0 for field in ANSWER_FIELDS}, overlays=HINDI_OVERLAYS)
+    queue = []
+    for item in items:
+        # questions retired from the bank drop out of review
+        question = question_bank.get(item['question_id'])
+        if question is not None:
+            queue.append({**item, 'question': {k: v for k, v in question.items() if k not in hidden}})
+    return {'items': queue, **counts}
+
+@api_router.post("/student/review", response_model=ReviewGrade)
+async def submit_review(data: ReviewSubmit, current_user: dict = Depends(get_current_user)):
+    # only due items, or the per-question results would grade any question in the bank on demand
+    due = await review_scheduler.due_ids(current_user['id'], list(data.answers))
+    if len(due) < len(data.answers):
+        raise HTTPException(status_code=409, detail="Only questions due for review can be submitted")
+    questions = [question_bank.get(question_id) for question_id in data.answers]
+    if any(question is None for question in questions):
+        raise HTTPException(status_code=404, detail="Question not found")
     
+    key = AnswerKey({'id': 'review', 'questions': questions})
+    graded = grade_one(key, data.answers)
+    review_scheduler.record(current_user['id'], key, key.encode(data.answers), graded['per_question'], origin=False)
     return {
-        'score': score,
-        'correct': correct_count,
-        'total': total
+        'correct': graded['correct'],
+        'total': graded['total'],
+        'results': {question_id: bool(right) for question_id, right in zip(key.question_ids, graded['per_question'])}
     }
 
-@api_router.get("/mock-tests")
-async def get_mock_tests():
-    tests = await db.mock_tests.find({}, {'_id': 0}).to_list(100)
-    return {'tests': tests}
-
 # ===== BOOKSTORE ROUTES =====
 
-@api_router.get("/books")
-async def get_books():
-    books = await db.books.find({}, {'_id': 0}).to_list(100)
-    return {'books': books}
+@api_router.get("/books", response_model=BookList, response_model_exclude_unset=True)
+async def get_books(request: Request, lang: str = Depends(content_language)):
+    async def load():
+        books = await db.books.find({}, language_projection(lang)).to_list(100)
+        return {'books': books}
+    
+    return etag_response(request, await catalog_cache.get_or_load(f'books:{lang}', load, BookList))
 
-@api_router.get("/book/{book_id}")
-async def get_book(book_id: str):
-    book = await db.books.find_one({'id': book_id}, {'_id': 0})
-    if not book:
+@api_router.get("/book/{book_id}", response_model=BookDetail, response_model_exclude_unset=True)
+async def get_book(book_id: str, request: Request, lang: str = Depends(content_language)):
+    async def load():
+        book = await db.books.find_one({'id': book_id}, language_projection(lang))
+        return {'book': book} if book else None
+    
+    entry = await catalog_cache.get_or_load(f'book:{book_id}:{lang}', load, BookDetail)
+    if not entry.found:
         raise HTTPException(status_code=404, detail="Book not found")
-    return {'book': book}
+    return etag_response(request, entry)
 
 # ===== ORDER ROUTES =====
 
+async def price_items(items: List[Dict[str, Any]]) -> Tuple[List[dict], int]:
+    try:
+        quantities = order_quantities(items)
+        books = {
+            book['id']: book
+            async for book in db.books.find({'id': {'$in': list(quantities)}},
+                                            {'_id': 0, 'id': 1, 'title': 1, 'title_hi': 1, 'price': 1})
+        }
+        return order_lines(quantities, books)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @api_router.post("/orders/create")
 async def create_order(data: OrderCreate, current_user: dict = Depends(get_current_user)):
+    items, amount = await price_items(data.items)
+    if data.amount is not None and data.amount != amount:
+        raise HTTPException(status_code=409, detail="Prices have changed, please review your cart")
+    
+    order_id = str(uuid.uuid4())
     try:
-        razor_order = razorpay_client.order.create({
-            'amount': data.amount * 100,
-            'currency': data.currency,
-            'payment_capture': 1
-        })
-        
-        order_doc = {
-            'id': str(uuid.uuid4()),
-            'user_id': current_user['id'],
-            'razorpay_order_id': razor_order['id'],
-            'amount': data.amount,
-            'currency': data.currency,
-            'items': data.items,
-            'status': 'created',
-            'created_at': datetime.now(timezone.utc).isoformat()
-        }
-        
-        await db.orders.insert_one(order_doc)
-        
-        return {
-            'order_id': razor_order['id'],
-            'amount': data.amount,
-            'currency': data.currency,
-            'key_id': RAZORPAY_KEY_ID
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Order creation failed: {str(e)}")
+        razor_order = await payment_gateway.create_order(amount * 100, data.currency, receipt=order_id)
+    except CircuitOpen as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Payment gateway unavailable, please retry",
+            headers={'Retry-After': str(e.retry_after)}
+        )
+    except PaymentGatewayError as e:
+        raise HTTPException(status_code=502, detail=f"Order creation failed: {str(e)}")
+    
+    order_doc = {
+        'id': order_id,
+        'user_id': current_user['id'],
+        'razorpay_order_id': razor_order['id'],
+        'amount': amount,
+        'currency': data.currency,
+        'items': items,
+        'status': 'created',
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+    
+    await db.orders.insert_one(order_doc)
+    await invalidation_bus.publish('orders', order_id, {'id': order_id, 'user_id': current_user['id']}, 'insert')
+    
+    return {
+        'order_id': razor_order['id'],
+        'amount': amount,
+        'currency': data.currency,
+        'key_id': payment_gateway.key_id
+    }
 
 @api_router.post("/orders/verify")
-async def verify_payment(payment_data: dict, current_user: dict = Depends(get_current_user)):
-    order = await db.orders.find_one({'razorpay_order_id': payment_data['order_id']})
+async def verify_payment(data: PaymentVerify, current_user: dict = Depends(get_current_user)):
+    if not payment_gateway.verify_signature(data.order_id, data.payment_id, data.signature):
+        raise HTTPException(status_code=400, detail="Invalid payment signature")
+    
+    order = await db.orders.find_one(
+        {'razorpay_order_id': data.order_id, 'user_id': current_user['id']},
+        {'_id': 0, 'id': 1, 'status': 1, 'amount': 1, 'items': 1}
+    )
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    await db.orders.update_one(
-        {'razorpay_order_id': payment_data['order_id']},
-        {'$set': {
-            'status': 'completed',
-            'razorpay_payment_id': payment_data.get('payment_id'),
-            'completed_at': datetime.now(timezone.utc).isoformat()
-        }}
-    )
+    if order['status'] != 'completed':
+        completed_at = datetime.now(timezone.utc).isoformat()
+        result = await db.orders.update_one(
+            {'razorpay_order_id': data.order_id, 'status': {'$ne': 'completed'}},
+            {'$set': {
+                'status': 'completed',
+                'razorpay_payment_id': data.payment_id,
+                'completed_at': completed_at
+            }}
+        )
+        if result.modified_count:
+            rollups.record_order_completed(order['amount'], completed_at)
+    
+    # on every verify, so a grant lost after the status flipped is retried; granting is idempotent
+    await entitlements.grant(current_user['id'], order['id'], order.get('items'))
+    await invalidation_bus.publish('orders', order['id'], {'id': order['id'], 'user_id': current_user['id']})
     
     return {'status': 'success', 'message': 'Payment verified'}
 
 # ===== STUDENT ROUTES =====
 
-@api_router.get("/student/progress")
-async def get_progress(current_user: dict = Depends(get_current_user)):
-    results = await db.quiz_results.find({'user_id': current_user['id']}, {'_id': 0}).to_list(1000)
-    return {'progress': results}
+async def student_history(name: str, collection, query: dict, sort_field: str,
+                          limit: int, cursor: Optional[str], format: str):
+    try:
+        if format == 'ndjson':
+            find = keyset_find(collection, query, sort_field, cursor, {'_id': 0})
+            return StreamingResponse(ndjson_lines(find), media_type='application/x-ndjson')
+        
+        docs, next_cursor = await keyset_page(collection, query, sort_field, cursor, {'_id': 0}, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {name: docs, 'next_cursor': next_cursor}
+
+@api_router.get("/student/progress", response_model=ProgressPage, response_model_exclude_unset=True)
+async def get_progress(limit: int = 100, cursor: Optional[str] = None, format: str = 'json',
+                       current_user: dict = Depends(get_current_user)):
+    return await student_history(
+        'progress', db.quiz_results, {'user_id': current_user['id']}, 'submitted_at', limit, cursor, format
+    )
+
+async def progress_summary(user_id: str) -> dict:
+    per_topic = await db.quiz_results.aggregate([
+        {'$match': {'user_id': user_id}},
+        {'$group': {
+            '_id': '$topic_id',
+            'attempts': {'$sum': 1},
+            'score_sum': {'$sum': '$score'},
+            'best_score': {'$max': '$score'},
+            'last_attempt': {'$max': '$submitted_at'}
+        }}
+    ]).to_list(None)
+    
+    # One row per attempted topic, so resolving subjects here stays small
+    topic_subjects = {
+        topic['id']: topic.get('subject_id')
+        async for topic in db.topics.find(
+            {'id': {'$in': [row['_id'] for row in per_topic]}},
+            {'_id': 0, 'id': 1, 'subject_id': 1}
+        )
+    }
+    
+    subjects: Dict[Optional[str], dict] = {}
+    for row in per_topic:
+        subject_id = topic_subjects.get(row['_id'])
+        subject = subjects.setdefault(subject_id, {
+            'subject_id': subject_id,
+            'attempts': 0,
+            'score_sum': 0.0,
+            'best_score': 0.0,
+            'topics_attempted': 0,
+            'last_attempt': None
+        })
+        subject['attempts'] += row['attempts']
+        subject['score_sum'] += row['score_sum']
+        subject['best_score'] = max(subject['best_score'], row['best_score'])
+        subject['topics_attempted'] += 1
+        subject['last_attempt'] = max(filter(None, [subject['last_attempt'], row['last_attempt']]), default=None)
+    
+    attempts = sum(row['attempts'] for row in per_topic)
+    score_sum = sum(row['score_sum'] for row in per_topic)
+    subject_rows = []
+    for subject in subjects.values():
+        subject['average_score'] = subject.pop('score_sum') / subject['attempts']
+        subject_rows.append(subject)
+    
+    return {
+        'summary': {
+            'attempts': attempts,
+            'average_score': score_sum / attempts if attempts else 0,
+            'best_score': max((row['best_score'] for row in per_topic), default=0),
+            'topics_attempted': len(per_topic)
+        },
+        'subjects': subject_rows
+    }
+
+@api_router.get("/student/progress/summary", response_model=ProgressSummary)
+async def get_progress_summary(current_user: dict = Depends(get_current_user)):
+    return await progress_summary(current_user['id'])
 
-@api_router.get("/student/bookmarks")
-async def get_bookmarks(current_user: dict = Depends(get_current_user)):
-    bookmarks = await db.bookmarks.find({'user_id': current_user['id']}, {'_id': 0}).to_list(1000)
-    return {'bookmarks': bookmarks}
+@api_router.get("/student/bookmarks", response_model=BookmarkPage, response_model_exclude_unset=True)
+async def get_bookmarks(limit: int = 100, cursor: Optional[str] = None, format: str = 'json',
+                        current_user: dict = Depends(get_current_user)):
+    return await student_history(
+        'bookmarks', db.bookmarks, {'user_id': current_user['id']}, 'created_at', limit, cursor, format
+    )
 
-@api_router.post("/student/bookmarks")
+@api_router.post("/student/bookmarks", response_model=MessageOut)
 async def add_bookmark(data: BookmarkCreate, current_user: dict = Depends(get_current_user)):
     bookmark_doc = {
         'id': str(uuid.uuid4()),
@@ -331,16 +1141,89 @@ async def add_bookmark(data: BookmarkCreate, current_user: dict = Depends(get_cu
         'title': data.title,
         'created_at': datetime.now(timezone.utc).isoformat()
     }
-    await db.bookmarks.insert_one(bookmark_doc)
+    await write_behind.put('bookmarks', bookmark_doc)
     return {'message': 'Bookmark added'}
 
-@api_router.get("/student/purchases")
-async def get_purchases(current_user: dict = Depends(get_current_user)):
-    orders = await db.orders.find(
-        {'user_id': current_user['id'], 'status': 'completed'}, 
-        {'_id': 0}
-    ).to_list(1000)
-    return {'purchases': orders}
+@api_router.get("/student/entitlements", response_model=EntitlementsOut)
+async def get_entitlements(current_user: dict = Depends(get_current_user)):
+    return (await entitlements.get(current_user['id'])).view()
+
+@api_router.get("/student/purchases", response_model=PurchasePage, response_model_exclude_unset=True)
+async def get_purchases(limit: int = 100, cursor: Optional[str] = None, format: str = 'json',
+                        current_user: dict = Depends(get_current_user)):
+    return await student_history(
+        'purchases', db.orders, {'user_id': current_user['id'], 'status': 'completed'},
+        'created_at', limit, cursor, format
+    )
+
+# ===== BOOTSTRAP =====
+
+BOOTSTRAP_PARTS = ('user', 'classes', 'progress', 'summary', 'bookmarks', 'purchases')
+BOOTSTRAP_PART_TIMEOUT = float(os.environ.get('BOOTSTRAP_PART_TIMEOUT', '2'))
+
+# Only the fields the first screens render
+PROGRESS_FIELDS = {'_id': 0, 'id': 1, 'quiz_id': 1, 'topic_id': 1, 'score': 1, 'correct': 1, 'total': 1,
+                   'submitted_at': 1}
+BOOKMARK_FIELDS = {'_id': 0, 'id': 1, 'topic_id': 1, 'title': 1, 'created_at': 1}
+PURCHASE_FIELDS = {'_id': 0, 'id': 1, 'amount': 1, 'currency': 1, 'items': 1, 'status': 1, 'created_at': 1}
+
+@api_router.get("/bootstrap", response_model=BootstrapOut, response_model_exclude_unset=True)
+async def bootstrap(parts: Optional[str] = None, lang: Optional[str] = None, progress_limit: int = 5,
+                    limit: int = 100, current_user: dict = Depends(get_current_user)):
+    wanted = tuple(dict.fromkeys(part.strip() for part in parts.split(',') if part.strip())) if parts \
+        else BOOTSTRAP_PARTS
+    unknown = [part for part in wanted if part not in BOOTSTRAP_PARTS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown parts: {', '.join(unknown)}")
+    try:
+        # the token's claims already carry the language, so no second decode
+        lang = resolve_language(lang, current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    user_id = current_user['id']
+    next_cursors = {}
+    
+    async def page(name: str, collection, query: dict, sort_field: str, projection: dict, size: int):
+        docs, next_cursors[name] = await keyset_page(collection, query, sort_field, None, projection, size)
+        return docs
+    
+    async def classes():
+        return orjson.loads((await classes_entry(lang)).body)['classes']
+    
+    loaders = {
+        'user': lambda: load_user(user_id),
+        'classes': classes,
+        'progress': lambda: page('progress', db.quiz_results, {'user_id': user_id}, 'submitted_at',
+                                 PROGRESS_FIELDS, progress_limit),
+        'summary': lambda: progress_summary(user_id),
+        'bookmarks': lambda: page('bookmarks', db.bookmarks, {'user_id': user_id}, 'created_at',
+                                  BOOKMARK_FIELDS, limit),
+        'purchases': lambda: page('purchases', db.orders, {'user_id': user_id, 'status': 'completed'},
+                                  'created_at', PURCHASE_FIELDS, limit),
+    }
+    
+    async def run(name: str):
+        try:
+            return await asyncio.wait_for(loaders[name](), BOOTSTRAP_PART_TIMEOUT), None
+        except asyncio.TimeoutError:
+            return None, 'timeout'
+        except Exception:
+            logger.exception("Bootstrap part %s failed", name)
+            return None, 'failed'
+    
+    # one round trip for the first screen; a slow or failing part only blanks itself
+    results = await asyncio.gather(*(run(name) for name in wanted))
+    response = {'errors': {}}
+    for name, (value, error) in zip(wanted, results):
+        response[name] = value
+        if error:
+            response['errors'][name] = error
+    if 'user' in wanted and response['user'] is None and 'user' not in response['errors']:
+        raise HTTPException(status_code=401, detail="User not found")
+    if next_cursors:
+        response['next_cursors'] = next_cursors
+    return response
 
 # ===== ADMIN ROUTES =====
 
@@ -356,9 +1239,94 @@ async def create_topic(data: TopicCreate, current_user: dict = Depends(get_curre
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.topics.insert_one(topic_doc)
+    try:
+        await db.topics.insert_one(topic_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A topic with this title already exists in the subject")
+    await store_renders(db.topic_renders, [topic_doc])
+    catalog_cache.invalidate(f'topics:{data.subject_id}:', f'topic:{topic_id}:')
+    entitlements.forget_topic(topic_id)
+    search_index.add(topic_doc)
+    rollups.record_topic_created()
+    await invalidation_bus.publish('topics', topic_id, {'id': topic_id, 'subject_id': data.subject_id}, 'insert')
     return {'message': 'Topic created', 'id': topic_id}
 
+@api_router.post("/admin/questions")
+async def create_question(data: QuestionCreate, current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if data.difficulty not in DIFFICULTIES:
+        raise HTTPException(status_code=400, detail=f"Unknown difficulty: {data.difficulty}")
+    
+    question_id = str(uuid.uuid4())
+    question_doc = {
+        'id': question_id,
+        **data.model_dump(exclude_none=True),
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+    
+    await db.questions.insert_one(question_doc)
+    question_doc.pop('_id', None)
+    question_bank.upsert(question_doc)
+    await invalidation_bus.publish('questions', question_id, {'id': question_id}, 'insert')
+    return {'message': 'Question created', 'id': question_id}
+
+@api_router.get("/admin/question-bank")
+async def get_question_bank(scope: Optional[str] = None, scope_id: Optional[str] = None,
+                            current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    bank = {'ready': question_bank.ready, 'questions': len(question_bank)}
+    if scope and scope_id:
+        bank['available'] = question_bank.available(scope, scope_id)
+    return {'question_bank': bank}
+
+@api_router.post("/admin/mock-tests/assemble")
+async def assemble_mock_test(data: MockTestAssemble, current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    seed = data.seed if data.seed is not None else random.getrandbits(32)
+    try:
+        questions = question_bank.assemble(data.scope, data.scope_id, data.questions_count, seed, data.mix,
+                                           tags=data.tags)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(questions) < data.questions_count:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Only {len(questions)} of {data.questions_count} questions available"
+        )
+    
+    marks = data.total_marks / data.questions_count
+    test_id = str(uuid.uuid4())
+    test_doc = {
+        'id': test_id,
+        'title': data.title,
+        'title_hi': data.title_hi,
+        f'{data.scope}_id': data.scope_id,
+        'subject': data.subject,
+        'duration_minutes': data.duration_minutes,
+        'total_marks': data.total_marks,
+        'questions_count': data.questions_count,
+        'negative_marking': data.negative_marking,
+        'topic_ids': sorted({question['topic_id'] for question in questions if question.get('topic_id')}),
+        # a fixed paper: every sitting gets the same questions, keyed once per test
+        'questions': [
+            {field: question[field] for field in
+             ('id', 'question', 'question_hi', 'options', 'options_hi', 'correct_answer') if field in question}
+            | {'marks': marks}
+            for question in questions
+        ],
+        'seed': seed,
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+    
+    await db.mock_tests.insert_one(test_doc)
+    catalog_cache.invalidate('mock-tests:')
+    return {'message': 'Mock test assembled', 'id': test_id, 'seed': seed}
+
 @api_router.post("/admin/books")
 async def create_book(data: BookCreate, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
@@ -371,46 +1339,314 @@ async def create_book(data: BookCreate, current_user: dict = Depends(get_current
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.books.insert_one(book_doc)
+    try:
+        await db.books.insert_one(book_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A book with this title already exists for the class")
+    catalog_cache.invalidate('books:', f'book:{book_id}:')
+    rollups.record_book_created()
+    await invalidation_bus.publish('books', book_id, {'id': book_id}, 'insert')
     return {'message': 'Book created', 'id': book_id}
 
-@api_router.get("/admin/analytics")
-async def get_analytics(current_user: dict = Depends(get_current_user)):
+IMPORT_MODELS = {'topics': TopicCreate, 'books': BookCreate}
+
+async def refresh_after_import(kind: str, importer: BulkImporter):
+    # One rebuild for the whole import instead of one per row
+    if kind == 'topics':
+        async for batch in imported(db.topics, importer.stamp):
+            await store_renders(db.topic_renders, batch)
+        render_cache.clear()
+        catalog_cache.invalidate('topics:', 'topic:')
+        # an import can flip premium on existing topics
+        entitlements.forget_topic()
+        await reconcile_search_index(search_index, db.topics)
+        rollups.record_topic_created(importer.stats['inserted'])
+    else:
+        catalog_cache.invalidate('books:', 'book:')
+        rollups.record_book_created(importer.stats['inserted'])
+    await invalidation_bus.publish(kind)
+
+@api_router.post("/admin/import/{kind}")
+async def bulk_import(kind: str, request: Request, format: Optional[str] = None, chunk_size: int = 500,
+                      current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if kind not in IMPORT_MODELS:
+        raise HTTPException(status_code=404, detail="Unknown import type")
+    try:
+        fmt = detect_format(request.headers.get('content-type'), format)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    importer = BulkImporter(db[kind], IMPORT_MODELS[kind], NATURAL_KEYS[kind], chunk_size=max(1, min(chunk_size, 5000)))
+    
+    async def events():
+        async for event in importer.run(read_rows(fmt, request.stream()), csv_rows=fmt == 'csv'):
+            if event['event'] == 'done':
+                await refresh_after_import(kind, importer)
+                logger.info("Imported %s: %s", kind, importer.stats)
+            yield orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE)
+    
+    return ImportProgressResponse(events())
+
+@api_router.put("/admin/users/{user_id}/role")
+async def update_user_role(user_id: str, data: RoleUpdate, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
+    if data.role not in ('student', 'admin'):
+        raise HTTPException(status_code=400, detail="Invalid role")
     
-    total_users = await db.users.count_documents({})
-    total_topics = await db.topics.count_documents({})
-    total_orders = await db.orders.count_documents({'status': 'completed'})
+    user = await revoke_user_tokens(user_id, {'role': data.role})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    revenue_pipeline = [
-        {'$match': {'status': 'completed'}},
-        {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-    ]
-    revenue_result = await db.orders.aggregate(revenue_pipeline).to_list(1)
-    total_revenue = revenue_result[0]['total'] if revenue_result else 0
+    return {'message': 'Role updated', 'user': user}
+
+@api_router.get("/admin/analytics")
+async def get_analytics(days: int = 30, current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    analytics = await rollups.read(days=max(1, min(days, 366)))
     
     return {
-        'total_users': total_users,
-        'total_topics': total_topics,
-        'total_orders': total_orders,
-        'total_revenue': total_revenue
+        'total_users': analytics['users'],
+        'total_topics': analytics['topics'],
+        'total_orders': analytics['completed_orders'],
+        'total_revenue': analytics['revenue'],
+        'total_quiz_attempts': analytics['quiz_attempts'],
+        'daily': analytics['daily']
     }
 
+@api_router.post("/admin/analytics/reconcile")
+async def reconcile_analytics(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    await rollups.flush()
+    result = await reconcile_rollups(db, db.analytics_rollups)
+    return {'message': 'Analytics reconciled', **result}
+
+@api_router.get("/admin/auth/metrics")
+async def get_auth_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {'hashing': password_hasher.metrics()}
+
+@api_router.get("/admin/mock-tests/metrics")
+async def get_mock_test_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {'mock_tests': mock_test_engine.metrics()}
+
+@api_router.get("/admin/leaderboards/metrics")
+async def get_leaderboard_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {'leaderboards': leaderboards.metrics()}
+
+@api_router.post("/admin/leaderboards/rebuild")
+async def rebuild_leaderboards(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    await leaderboards.rebuild()
+    return {'message': 'Leaderboards rebuilt', 'leaderboards': leaderboards.metrics()}
+
+@api_router.get("/admin/entitlements/metrics")
+async def get_entitlement_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {'entitlements': entitlements.metrics()}
+
+@api_router.post("/admin/entitlements/rebuild")
+async def rebuild_entitlements(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    rebuilt = await entitlements.rebuild()
+    return {'message': 'Entitlements rebuilt', **rebuilt}
+
+@api_router.get("/admin/review/metrics")
+async def get_review_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {'review': review_scheduler.metrics()}
+
+@api_router.post("/admin/review/reschedule")
+async def reschedule_reviews(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    rescheduled = await review_scheduler.reschedule()
+    return {'message': 'Review items rescheduled', **rescheduled}
+
+@api_router.get("/admin/write-behind/metrics")
+async def get_write_behind_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {'write_behind': write_behind.metrics()}
+
+QUERY_PROFILE_SORTS = ('total_ms', 'count', 'mean_ms', 'max_ms', 'p95_ms')
+
+@api_router.get("/admin/queries")
+async def get_query_profile(sort: str = 'total_ms', limit: int = 50, collection: Optional[str] = None,
+                            current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if sort not in QUERY_PROFILE_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(QUERY_PROFILE_SORTS)}")
+    
+    return await query_profiler.report(sort=sort, limit=max(1, min(limit, 500)), collection=collection)
+
+@api_router.get("/admin/queries/unindexed")
+async def get_unindexed_queries(limit: int = 50, current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {'queries': await query_profiler.unindexed(limit=max(1, min(limit, 500)))}
+
+@api_router.delete("/admin/queries")
+async def reset_query_profile(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    query_profiler.reset()
+    return {'message': 'Query profile reset'}
+
 @api_router.get("/search")
-async def search(q: str):
-    topics = await db.topics.find(
-        {'$or': [
-            {'title': {'$regex': q, '$options': 'i'}},
-            {'title_hi': {'$regex': q, '$options': 'i'}}
-        ]},
-        {'_id': 0}
-    ).to_list(50)
+async def search(q: str, limit: int = 20, prefix: bool = False,
+                 credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    limit = max(1, min(limit, 50))
+    hits = search_index.search(q, limit=limit, prefix=prefix)
+    if not hits:
+        return {'results': []}
+    
+    # Snippets come from the language the query was written in
+    content_field = 'content_hi' if DEVANAGARI_RE.search(q) else 'content'
+    topics = {
+        topic['id']: topic
+        async for topic in db.topics.find(
+            {'id': {'$in': [doc_id for doc_id, _ in hits]}},
+            {'_id': 0, 'id': 1, 'premium': 1, 'class_id': 1, content_field: 1}
+        )
+    }
+    terms = search_index.query_terms(q, prefix=prefix)
+    
+    # premium text is only quoted to users who could open the topic
+    user = None
+    if credentials and any(topic.get('premium') for topic in topics.values()):
+        try:
+            user = await get_current_user(credentials)
+        except HTTPException:
+            pass
+    
+    async def readable(topic: dict) -> bool:
+        if not topic.get('premium'):
+            return True
+        if user is None:
+            return False
+        return user['role'] == 'admin' or await entitlements.has_access(user['id'], topic.get('class_id'))
+    
+    results = []
+    for doc_id, score in hits:
+        result = search_index.result(doc_id, score)
+        topic = topics.get(doc_id, {})
+        result['snippet'] = highlight_snippet(topic.get(content_field, ''), terms) if await readable(topic) else None
+        results.append(result)
+    
+    return {'results': results}
+
+@api_router.get("/search/suggest")
+async def search_suggest(q: str, limit: int = 10):
+    return {'suggestions': search_index.suggest(q, limit=max(1, min(limit, 20)))}
+
+# ===== CACHE COHERENCE =====
+
+async def on_topic_change(change: Change):
+    if change.broad:
+        catalog_cache.invalidate('topics:', 'topic:')
+        render_cache.clear()
+        entitlements.forget_topic()
+        await reconcile_search_index(search_index, db.topics)
+        return
+    subject_id = change.document.get('subject_id')
+    if subject_id and (change.operation == 'insert' or not change.changed('subject_id')):
+        catalog_cache.invalidate(f'topics:{subject_id}:', f'topic:{change.id}:')
+    else:
+        # the topic may have moved, leaving the old subject's list stale too
+        catalog_cache.invalidate('topics:', f'topic:{change.id}:')
+    for lang in LANGUAGES:
+        render_cache.pop(f'{change.id}:{lang}')
+    entitlements.forget_topic(change.id)
+    topic = change.document if 'content' in change.document else \
+        await db.topics.find_one({'id': change.id}, {'_id': 0})
+    if topic:
+        search_index.add(topic)
+    else:
+        search_index.remove(change.id)
+
+async def on_book_change(change: Change):
+    catalog_cache.invalidate('books:', 'book:' if change.broad else f'book:{change.id}:')
+
+async def on_quiz_change(change: Change):
+    answer_keys.invalidate(change.id)
+
+async def on_user_change(change: Change):
+    if change.broad:
+        user_cache.clear()
+        user_names.clear()
+        token_versions.clear()
+        return
+    # password rehashes on login don't touch anything cached
+    if change.updated_fields is not None and set(change.updated_fields) <= {'password'}:
+        return
+    invalidate_user(change.id, change.document.get('token_version'))
+
+async def on_order_change(change: Change):
+    # the worker that verified the payment wrote the grant before publishing
+    entitlements.invalidate(None if change.broad else change.document.get('user_id'))
+
+async def on_question_change(change: Change):
+    if change.broad:
+        await question_bank.load()
+        return
+    question = await db.questions.find_one({'id': change.id}, {'_id': 0})
+    if question:
+        question_bank.upsert(question)
+    else:
+        question_bank.remove(change.id)
+
+invalidation_bus.subscribe('topics', on_topic_change)
+invalidation_bus.subscribe('books', on_book_change)
+invalidation_bus.subscribe('quizzes', on_quiz_change)
+invalidation_bus.subscribe('users', on_user_change)
+invalidation_bus.subscribe('orders', on_order_change)
+invalidation_bus.subscribe('questions', on_question_change)
+
+@api_router.get("/admin/cache-bus/metrics")
+async def get_cache_bus_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    return {'results': topics}
+    return {'cache_bus': invalidation_bus.metrics()}
 
 app.include_router(api_router)
 
+@app.exception_handler(HasherOverloaded)
+async def hasher_overloaded_handler(request: Request, exc: HasherOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={'detail': 'Server busy, please retry'},
+        headers={'Retry-After': str(exc.retry_after)}
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -419,12 +1655,142 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so latency covers every other middleware too
+app.add_middleware(
+    InstrumentationMiddleware,
+    slow_ms=float(os.environ.get('SLOW_REQUEST_MS', '500'))
+)
+
+# ===== METRICS =====
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+loop_lag_monitor = LoopLagMonitor()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get('authorization') != f'Bearer {METRICS_TOKEN}':
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_loop_lag_monitor():
+    loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_loop_lag_monitor():
+    await loop_lag_monitor.stop()
+
+@app.on_event("startup")
+async def startup_query_profiler():
+    query_profiler.attach(db, db.query_explains)
+
+@app.on_event("startup")
+async def startup_indexes():
+    if os.environ.get('ENSURE_INDEXES', 'true').lower() == 'true':
+        log_index_report(await ensure_indexes(db))
+
+@app.on_event("startup")
+async def startup_search_index():
+    global search_index
+    search_index = await asyncio.to_thread(SearchIndex.load, SEARCH_SNAPSHOT_PATH)
+    stats = await reconcile_search_index(search_index, db.topics)
+    logger.info("Search index ready: %s", stats)
+    if search_index.dirty:
+        await asyncio.to_thread(search_index.save, SEARCH_SNAPSHOT_PATH)
+
+@app.on_event("startup")
+async def startup_rollups():
+    # Backfill on first run, then keep counters current from the write paths
+    if not await db.analytics_rollups.find_one({'_id': TOTALS_ID}, {'_id': 1}):
+        try:
+            await reconcile_rollups(db, db.analytics_rollups)
+        except Exception:
+            logger.exception("Analytics backfill failed")
+    rollups.start()
+
+@app.on_event("startup")
+async def startup_entitlements():
+    # Backfill on first run; afterwards verify_payment keeps them current
+    if not await db.entitlements.find_one({}, {'_id': 1}) and \
+            await db.orders.find_one({'status': 'completed'}, {'_id': 1}):
+        try:
+            await entitlements.rebuild()
+        except Exception:
+            logger.exception("Entitlements backfill failed")
+
+@app.on_event("startup")
+async def startup_question_bank():
+    # Seed the bank from the embedded quiz questions on first run
+    try:
+        if not await db.questions.find_one({}, {'_id': 1}):
+            written = await backfill_from_quizzes(db.questions, db.quizzes, db.topics)
+            logger.info("Question bank backfilled with %d quiz questions", written)
+    except Exception:
+        # e.g. another worker backfilling at the same time; serve whatever is there
+        logger.exception("Question bank backfill failed")
+    try:
+        await question_bank.load()
+    except Exception:
+        logger.exception("Question bank load failed")
+
+@app.on_event("shutdown")
+async def flush_rollups():
+    await rollups.stop()
+
+@app.on_event("startup")
+async def startup_write_behind():
+    await write_behind.start()
+
+@app.on_event("shutdown")
+async def flush_write_behind():
+    await write_behind.stop()
+
+@app.on_event("startup")
+async def startup_invalidation_bus():
+    await invalidation_bus.start()
+
+@app.on_event("shutdown")
+async def stop_invalidation_bus():
+    await invalidation_bus.stop()
+
+@app.on_event("startup")
+async def startup_leaderboards():
+    await leaderboards.start()
+
+@app.on_event("shutdown")
+async def stop_leaderboards():
+    await leaderboards.stop()
+
+@app.on_event("startup")
+async def startup_review_scheduler():
+    review_scheduler.start()
+
+@app.on_event("shutdown")
+async def flush_review_scheduler():
+    await review_scheduler.stop()
+
+@app.on_event("startup")
+async def startup_mock_tests():
+    await mock_test_engine.start()
+
+@app.on_event("shutdown")
+async def flush_mock_tests():
+    await mock_test_engine.stop()
+
+@app.on_event("shutdown")
+async def save_search_index():
+    if search_index.dirty:
+        await asyncio.to_thread(search_index.save, SEARCH_SNAPSHOT_PATH)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    password_hasher.shutdown()
+    await payment_gateway.close()
\ No newline at end of file
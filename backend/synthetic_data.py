@@ -0,0 +1,443 @@
+"""Deterministic synthetic dataset at production scale, used by ``seed_data.py --generate``.
+
+Everything is derived from the parameters (``seed``, ``as_of``, sizes and
+chunk size): ids come from hashing (seed, kind, index) and every chunk has
+its own RNG stream, so chunks can be generated in any order, in any process,
+and still produce identical data.
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Optional
+
+import bcrypt
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CLASSES = range(6, 13)
+SUBJECTS = [
+    ('Mathematics', 'गणित', 'Calculator', [
+        ('Algebra', 'बीजगणित'), ('Geometry', 'ज्यामिति'), ('Trigonometry', 'त्रिकोणमिति'),
+        ('Probability', 'प्रायिकता'), ('Statistics', 'सांख्यिकी'), ('Number Systems', 'संख्या पद्धति'),
+        ('Linear Equations', 'रैखिक समीकरण'), ('Quadratic Equations', 'द्विघात समीकरण'),
+        ('Mensuration', 'क्षेत्रमिति'), ('Coordinate Geometry', 'निर्देशांक ज्यामिति'),
+    ]),
+    ('Science', 'विज्ञान', 'Microscope', [
+        ('Photosynthesis', 'प्रकाश संश्लेषण'), ('Motion', 'गति'), ('Electricity', 'विद्युत'),
+        ('Acids and Bases', 'अम्ल और क्षार'), ('Cell Structure', 'कोशिका संरचना'), ('Magnetism', 'चुंबकत्व'),
+        ('Chemical Reactions', 'रासायनिक अभिक्रियाएँ'), ('Light', 'प्रकाश'), ('Sound', 'ध्वनि'),
+        ('Heredity', 'आनुवंशिकता'),
+    ]),
+    ('English', 'अंग्रेज़ी', 'BookOpen', [
+        ('Tenses', 'काल'), ('Active and Passive Voice', 'कर्तृवाच्य और कर्मवाच्य'),
+        ('Reported Speech', 'अप्रत्यक्ष कथन'), ('Letter Writing', 'पत्र लेखन'), ('Prepositions', 'पूर्वसर्ग'),
+        ('Comprehension', 'अपठित गद्यांश'), ('Essay Writing', 'निबंध लेखन'), ('Poetry', 'कविता'),
+    ]),
+    ('Hindi', 'हिन्दी', 'Languages', [
+        ('Sandhi', 'संधि'), ('Samas', 'समास'), ('Alankar', 'अलंकार'), ('Muhavare', 'मुहावरे'),
+        ('Vyakaran', 'व्याकरण'), ('Kavya', 'काव्य'), ('Nibandh', 'निबंध'), ('Patra Lekhan', 'पत्र लेखन'),
+    ]),
+]
+SENTENCES = [
+    ('{concept} is one of the core ideas students meet in {cls}.',
+     '{concept_hi} {cls_hi} में विद्यार्थियों के लिए एक मूल अवधारणा है।'),
+    ('Work through each example step by step before attempting the exercises.',
+     'अभ्यास करने से पहले प्रत्येक उदाहरण को चरण दर चरण हल करें।'),
+    ('Most board exam questions on {concept} test definitions and direct application.',
+     '{concept_hi} पर बोर्ड परीक्षा के अधिकांश प्रश्न परिभाषा और प्रत्यक्ष प्रयोग पर आधारित होते हैं।'),
+    ('Revise the key terms and write a short summary in your own words.',
+     'मुख्य शब्दों को दोहराएँ और अपने शब्दों में एक छोटा सारांश लिखें।'),
+    ('Common mistakes come from skipping units and rushing the final step.',
+     'सामान्य गलतियाँ इकाइयाँ छोड़ने और अंतिम चरण में जल्दबाज़ी से होती हैं।'),
+]
+FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Ananya', 'Diya', 'Ishaan', 'Kavya', 'Rohan', 'Saanvi', 'Priya',
+               'Arjun', 'Meera', 'Kabir', 'Riya', 'Aditi', 'Vihaan', 'Neha', 'Rahul', 'Pooja', 'Sneha']
+LAST_NAMES = ['Sharma', 'Verma', 'Gupta', 'Singh', 'Kumar', 'Patel', 'Yadav', 'Mishra', 'Joshi', 'Reddy']
+
+# Collections a generated dataset replaces: what generate() writes and everything derived from it.
+# Callers drop them first, which also lets inserts skip index maintenance.
+GENERATED_COLLECTIONS = [
+    'classes', 'subjects', 'topics', 'topic_renders', 'quizzes', 'books', 'mock_tests', 'mock_test_sessions',
+    'questions', 'question_exposures', 'practice_results', 'review_items',
+    'users', 'quiz_results', 'bookmarks', 'orders', 'entitlements', 'analytics_rollups'
+]
+
+# Per-collection RNG stream ids, so chunk k of two collections never share a stream
+_STREAMS = {'users': 1, 'quiz_results': 2, 'bookmarks': 3, 'orders': 4, 'catalog': 5, 'mock_tests': 6}
+
+# Catalog arrays shared with worker processes (set once per process)
+_meta: Dict[str, Any] = {}
+
+
+def det_uuid(seed: int, kind: str, index: int) -> str:
+    digest = hashlib.sha1(f'{seed}:{kind}:{index}'.encode('ascii')).digest()
+    return str(uuid.UUID(bytes=digest[:16], version=4))
+
+
+def password_hash(password: str, seed: int, rounds: int) -> str:
+    """One bcrypt hash shared by every synthetic user, with a salt derived from ``seed``."""
+    raw = hashlib.sha256(f'{seed}:salt'.encode('ascii')).digest()[:16]
+    # bcrypt's base64 alphabet is ./A-Za-z0-9 instead of A-Za-z0-9+/
+    salt = base64.b64encode(raw).decode('ascii').rstrip('=').translate(str.maketrans(
+        'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/',
+        './ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+    ))
+    return bcrypt.hashpw(password.encode('utf-8'), f'$2b${rounds:02d}${salt}'.encode('ascii')).decode('utf-8')
+
+
+def _uuids(rng: np.random.Generator, n: int) -> List[str]:
+    bits = rng.integers(0, 2 ** 63, size=(n, 2), dtype=np.int64, endpoint=False)
+    return [str(uuid.UUID(int=(int(hi) << 64) | int(lo), version=4)) for hi, lo in bits]
+
+
+def _timestamps(as_of: datetime, seconds_ago: np.ndarray) -> List[str]:
+    return [(as_of - timedelta(seconds=int(s))).isoformat() for s in seconds_ago]
+
+
+def _recent_seconds(rng: np.random.Generator, n: int, days: int = 365) -> np.ndarray:
+    # activity is skewed towards the recent past
+    return rng.beta(1.0, 3.0, size=n) * days * 86400
+
+
+def _zipf_weights(n: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+# ===== CATALOG =====
+
+def _content(rng: np.random.Generator, title: str, title_hi: str, concept: str, concept_hi: str,
+             cls: int) -> Dict[str, str]:
+    en, hi = [f'# {title}'], [f'# {title_hi}']
+    for section in range(int(rng.integers(2, 6))):
+        en.append(f'\n## {concept}: Part {section + 1}\n')
+        hi.append(f'\n## {concept_hi}: भाग {section + 1}\n')
+        for _ in range(int(rng.integers(3, 12))):
+            sentence, sentence_hi = SENTENCES[int(rng.integers(len(SENTENCES)))]
+            fields = {'concept': concept, 'concept_hi': concept_hi, 'cls': f'Class {cls}', 'cls_hi': f'कक्षा {cls}'}
+            en.append(sentence.format(**fields))
+            hi.append(sentence_hi.format(**fields))
+    return {'content': '\n'.join(en), 'content_hi': '\n'.join(hi)}
+
+
+def build_catalog(seed: int, topics: int, quiz_ratio: float, books: int, as_of: datetime) -> Dict[str, Any]:
+    """Catalog collections, quizzes and mock tests with their answer keys, plus the arrays chunks sample from."""
+    rng = np.random.default_rng([seed, _STREAMS['catalog']])
+    created_at = (as_of - timedelta(days=400)).isoformat()
+
+    classes, subjects = [], []
+    for cls in CLASSES:
+        class_id = det_uuid(seed, 'class', cls)
+        classes.append({
+            'id': class_id, 'name': f'Class {cls}', 'name_hi': f'कक्षा {cls}',
+            'description': f'Comprehensive learning materials for Class {cls}',
+            'description_hi': f'कक्षा {cls} के लिए व्यापक शिक्षण सामग्री', 'class_number': cls,
+        })
+        for name, name_hi, icon, concepts in SUBJECTS:
+            subjects.append({
+                'id': det_uuid(seed, 'subject', len(subjects)), 'class_id': class_id, 'class_number': cls,
+                'name': name, 'name_hi': name_hi, 'icon': icon, 'concepts': concepts,
+                'description': f'{name} for Class {cls}', 'description_hi': f'कक्षा {cls} के लिए {name_hi}',
+            })
+
+    topic_docs = []
+    for i in range(topics):
+        subject = subjects[i % len(subjects)]
+        round_ = i // len(subjects)
+        concept, concept_hi = subject['concepts'][round_ % len(subject['concepts'])]
+        part = round_ // len(subject['concepts']) + 1
+        title = f'{concept} {part}' if part > 1 else concept
+        title_hi = f'{concept_hi} {part}' if part > 1 else concept_hi
+        topic_docs.append({
+            'id': det_uuid(seed, 'topic', i), 'subject_id': subject['id'], 'class_id': subject['class_id'],
+            'title': title, 'title_hi': title_hi,
+            **_content(rng, title, title_hi, concept, concept_hi, subject['class_number']),
+            'formulas': [], 'diagrams': [], 'duration_minutes': int(rng.integers(10, 46)),
+            'created_at': created_at,
+        })
+
+    quiz_docs = []
+    quiz_count = int(topics * quiz_ratio)
+    quiz_totals = rng.integers(5, 16, size=quiz_count)
+    for i in range(quiz_count):
+        topic = topic_docs[i]
+        questions = []
+        for q in range(int(quiz_totals[i])):
+            options = [f'Option {letter}' for letter in 'ABCD']
+            questions.append({
+                'id': det_uuid(seed, f'question:{i}', q),
+                'question': f'Question {q + 1} on {topic["title"]}?',
+                'question_hi': f'{topic["title_hi"]} पर प्रश्न {q + 1}?',
+                'options': options,
+                'correct_answer': options[int(rng.integers(4))],
+            })
+        quiz_docs.append({
+            'id': det_uuid(seed, 'quiz', i), 'topic_id': topic['id'],
+            'title': f'Quiz: {topic["title"]}', 'title_hi': f'प्रश्नोत्तरी: {topic["title_hi"]}',
+            'duration_minutes': 10, 'questions': questions,
+        })
+
+    book_docs = []
+    for i in range(books):
+        subject = subjects[i % len(subjects)]
+        book_docs.append({
+            'id': det_uuid(seed, 'book', i),
+            'title': f'{subject["name"]} Guide {i // len(subjects) + 1} - Class {subject["class_number"]}',
+            'title_hi': f'{subject["name_hi"]} गाइड {i // len(subjects) + 1} - कक्षा {subject["class_number"]}',
+            'description': f'Practice book for {subject["description"]}.',
+            'description_hi': f'{subject["description_hi"]} के लिए अभ्यास पुस्तक।',
+            'price': int(rng.integers(4, 13)) * 50 - 1, 'image': '', 'class_id': subject['class_id'],
+            'created_at': created_at,
+        })
+
+    mock_test_docs = build_mock_tests(seed, subjects, created_at)
+
+    for subject in subjects:
+        del subject['concepts'], subject['class_number']
+
+    return {
+        'classes': classes, 'subjects': subjects, 'topics': topic_docs, 'quizzes': quiz_docs, 'books': book_docs,
+        'mock_tests': mock_test_docs,
+        'meta': {
+            'seed': seed,
+            'as_of': as_of,
+            'topic_ids': [t['id'] for t in topic_docs],
+            'topic_titles': [t['title'] for t in topic_docs],
+            'topic_weights': _zipf_weights(len(topic_docs), 1.1),
+            'quiz_ids': [q['id'] for q in quiz_docs],
+            'quiz_topic_ids': [q['topic_id'] for q in quiz_docs],
+            'quiz_totals': quiz_totals,
+            'quiz_difficulty': rng.beta(2.0, 2.0, size=quiz_count),
+            'quiz_weights': _zipf_weights(quiz_count, 1.1),
+            'book_ids': [b['id'] for b in book_docs],
+            'book_titles': [b['title'] for b in book_docs],
+            'book_prices': np.array([b['price'] for b in book_docs]),
+            'book_weights': _zipf_weights(len(book_docs), 0.8),
+        },
+    }
+
+
+def build_mock_tests(seed: int, subjects: List[Dict[str, Any]], created_at: str) -> List[Dict[str, Any]]:
+    """One full-length paper per class and subject, graded like the seeded mock tests."""
+    # its own stream, so adding mock tests left the rest of the catalog unchanged
+    rng = np.random.default_rng([seed, _STREAMS['mock_tests']])
+    options = [f'Option {letter}' for letter in 'ABCD']
+    tests = []
+    for i, subject in enumerate(subjects):
+        count = int(rng.integers(20, 41))
+        answers = rng.integers(len(options), size=count)
+        concepts = subject['concepts']
+        tests.append({
+            'id': det_uuid(seed, 'mock_test', i),
+            'title': f'Class {subject["class_number"]} {subject["name"]} Mock Test',
+            'title_hi': f'कक्षा {subject["class_number"]} {subject["name_hi"]} मॉक टेस्ट',
+            'class_id': subject['class_id'],
+            'subject': subject['name'],
+            'duration_minutes': count * 2,
+            'total_marks': count * 2,
+            'questions_count': count,
+            'negative_marking': 0.25,
+            'questions': [
+                {
+                    'id': det_uuid(seed, f'mock_question:{i}', q),
+                    'question': f'{concepts[q % len(concepts)][0]} question {q + 1}',
+                    'question_hi': f'{concepts[q % len(concepts)][1]} प्रश्न {q + 1}',
+                    'options': options,
+                    'correct_answer': options[int(answers[q])],
+                    'marks': 2,
+                }
+                for q in range(count)
+            ],
+            'created_at': created_at,
+        })
+    return tests
+
+
+# ===== PER-USER CHUNKS =====
+
+def set_meta(meta: Dict[str, Any]):
+    _meta.clear()
+    _meta.update(meta)
+
+
+def user_chunk(start: int, stop: int, password_hash: str) -> List[Dict[str, Any]]:
+    seed, as_of = _meta['seed'], _meta['as_of']
+    rng = np.random.default_rng([seed, _STREAMS['users'], start])
+    n = stop - start
+    first = rng.integers(len(FIRST_NAMES), size=n)
+    last = rng.integers(len(LAST_NAMES), size=n)
+    hindi = rng.random(n) < 0.4
+    created = _timestamps(as_of, _recent_seconds(rng, n, days=400))
+    return [
+        {
+            'id': det_uuid(seed, 'user', start + i),
+            'name': f'{FIRST_NAMES[first[i]]} {LAST_NAMES[last[i]]}',
+            'email': f'student{start + i}@synthetic.test',
+            'password': password_hash,
+            'role': 'student',
+            'language': 'hi' if hindi[i] else 'en',
+            'token_version': 0,
+            'created_at': created[i],
+        }
+        for i in range(n)
+    ]
+
+
+def result_chunk(start: int, stop: int, per_user: int) -> List[Dict[str, Any]]:
+    """Quiz results for users [start, stop): user ability ~ Beta(5, 2) (left-skewed), quiz popularity ~ Zipf."""
+    seed, as_of = _meta['seed'], _meta['as_of']
+    rng = np.random.default_rng([seed, _STREAMS['quiz_results'], start])
+    n_users = stop - start
+    n = n_users * per_user
+    if not n or not len(_meta['quiz_ids']):
+        return []
+    user = np.repeat(np.arange(n_users), per_user)
+    ability = rng.beta(5.0, 2.0, size=n_users)[user]
+    quiz = rng.choice(len(_meta['quiz_ids']), size=n, p=_meta['quiz_weights'])
+    total = _meta['quiz_totals'][quiz]
+    p_correct = np.clip(ability * (1.25 - 0.5 * _meta['quiz_difficulty'][quiz]), 0.02, 0.99)
+    correct = rng.binomial(total, p_correct)
+    score = correct / total * 100
+    submitted = _timestamps(as_of, _recent_seconds(rng, n))
+    ids = _uuids(rng, n)
+    user_ids = [det_uuid(seed, 'user', start + i) for i in range(n_users)]
+    return [
+        {
+            'id': ids[i],
+            'user_id': user_ids[user[i]],
+            'quiz_id': _meta['quiz_ids'][quiz[i]],
+            'topic_id': _meta['quiz_topic_ids'][quiz[i]],
+            'score': float(score[i]),
+            'correct': int(correct[i]),
+            'total': int(total[i]),
+            'marks': float(correct[i]),
+            'submitted_at': submitted[i],
+        }
+        for i in range(n)
+    ]
+
+
+def bookmark_chunk(start: int, stop: int, per_user: float) -> List[Dict[str, Any]]:
+    seed, as_of = _meta['seed'], _meta['as_of']
+    rng = np.random.default_rng([seed, _STREAMS['bookmarks'], start])
+    counts = rng.poisson(per_user, size=stop - start)
+    n = int(counts.sum())
+    if not n or not len(_meta['topic_ids']):
+        return []
+    user = np.repeat(np.arange(stop - start), counts)
+    topic = rng.choice(len(_meta['topic_ids']), size=n, p=_meta['topic_weights'])
+    created = _timestamps(as_of, _recent_seconds(rng, n))
+    ids = _uuids(rng, n)
+    return [
+        {
+            'id': ids[i],
+            'user_id': det_uuid(seed, 'user', start + int(user[i])),
+            'topic_id': _meta['topic_ids'][topic[i]],
+            'title': _meta['topic_titles'][topic[i]],
+            'created_at': created[i],
+        }
+        for i in range(n)
+    ]
+
+
+def order_chunk(start: int, stop: int, per_user: float) -> List[Dict[str, Any]]:
+    seed, as_of = _meta['seed'], _meta['as_of']
+    rng = np.random.default_rng([seed, _STREAMS['orders'], start])
+    counts = rng.poisson(per_user, size=stop - start)
+    n = int(counts.sum())
+    if not n or not len(_meta['book_ids']):
+        return []
+    user = np.repeat(np.arange(stop - start), counts)
+    book = rng.choice(len(_meta['book_ids']), size=n, p=_meta['book_weights'])
+    completed = rng.random(n) < 0.85
+    seconds_ago = _recent_seconds(rng, n)
+    created = _timestamps(as_of, seconds_ago)
+    completed_at = _timestamps(as_of, np.maximum(seconds_ago - rng.integers(30, 600, size=n), 0))
+    ids = _uuids(rng, n)
+    orders = []
+    for i in range(n):
+        price = int(_meta['book_prices'][book[i]])
+        order = {
+            'id': ids[i],
+            'user_id': det_uuid(seed, 'user', start + int(user[i])),
+            'razorpay_order_id': f'order_syn_{ids[i].replace("-", "")[:14]}',
+            'amount': price,
+            'currency': 'INR',
+            'items': [{'book_id': _meta['book_ids'][book[i]], 'title': _meta['book_titles'][book[i]],
+                       'price': price, 'quantity': 1}],
+            'status': 'completed' if completed[i] else 'created',
+            'created_at': created[i],
+        }
+        if completed[i]:
+            order['completed_at'] = completed_at[i]
+        orders.append(order)
+    return orders
+
+
+# ===== LOADING =====
+
+async def load(db, collection: str, make_chunk: Callable[..., List[Dict[str, Any]]], users: int,
+               users_per_chunk: int, args: tuple, pool: Optional[ProcessPoolExecutor], concurrency: int) -> int:
+    """Generate per-user chunks (in ``pool`` if given) and insert them with ``concurrency`` writers."""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    inserted = 0
+
+    async def one(start: int):
+        nonlocal inserted
+        async with semaphore:
+            stop = min(start + users_per_chunk, users)
+            if pool is None:
+                docs = make_chunk(start, stop, *args)
+            else:
+                docs = await loop.run_in_executor(pool, make_chunk, start, stop, *args)
+            if docs:
+                await db[collection].insert_many(docs, ordered=False)
+                inserted += len(docs)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one(start) for start in range(0, users, users_per_chunk)))
+    elapsed = time.perf_counter() - started_at
+    logger.info("%s: %d docs in %.1fs (%.0f/s)", collection, inserted, elapsed, inserted / elapsed if elapsed else 0)
+    return inserted
+
+
+async def generate(db, *, seed: int, users: int, results_per_user: int, topics: int, quiz_ratio: float,
+                   books: int, bookmarks_per_user: float, orders_per_user: float, password_hash: str,
+                   as_of: datetime, workers: int = 4, concurrency: int = 8,
+                   chunk_docs: int = 10000) -> Dict[str, int]:
+    catalog = build_catalog(seed, topics, quiz_ratio, books, as_of)
+    counts = {}
+    for name in ('classes', 'subjects', 'topics', 'quizzes', 'books', 'mock_tests'):
+        docs = catalog[name]
+        for start in range(0, len(docs), chunk_docs):
+            await db[name].insert_many(docs[start:start + chunk_docs], ordered=False)
+        counts[name] = len(docs)
+
+    set_meta(catalog['meta'])
+    # spawn rather than fork: the parent already holds an open MongoDB client
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context('spawn'), initializer=set_meta, initargs=(catalog['meta'],)
+    ) if workers > 0 else None
+    def per_chunk(docs_per_user: float) -> int:
+        return max(1, int(chunk_docs // max(docs_per_user, 1)))
+
+    try:
+        counts['users'] = await load(db, 'users', user_chunk, users, per_chunk(1), (password_hash,), pool, concurrency)
+        counts['quiz_results'] = await load(db, 'quiz_results', result_chunk, users, per_chunk(results_per_user),
+                                            (results_per_user,), pool, concurrency)
+        counts['bookmarks'] = await load(db, 'bookmarks', bookmark_chunk, users, per_chunk(bookmarks_per_user),
+                                         (bookmarks_per_user,), pool, concurrency)
+        counts['orders'] = await load(db, 'orders', order_chunk, users, per_chunk(orders_per_user),
+                                      (orders_per_user,), pool, concurrency)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return counts
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from markdown_it import MarkdownIt
+from pymongo import ReplaceOne
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip and identity are always stored
+    brotli = None
+
+RENDER_VERSION = 1
+LANGUAGE_FIELDS = {'en': 'content', 'hi': 'content_hi'}
+WORDS_PER_MINUTE = 200
+ENCODINGS = ('br', 'gzip')
+
+# 'js-default' leaves raw HTML disabled, so any markup in the source is
+# escaped and unsafe link schemes (javascript:, vbscript:, ...) are refused
+_md = MarkdownIt('js-default').enable('table')
+
+_SLUG_DASH_RE = re.compile(r'[\s_-]+')
+
+
+def slugify(text: str) -> str:
+    # keep letters, digits and combining marks so Devanagari matras survive
+    text = ''.join(
+        c for c in unicodedata.normalize('NFC', text).lower()
+        if unicodedata.category(c)[0] in 'LNM' or c in ' _-'
+    )
+    return _SLUG_DASH_RE.sub('-', text).strip('-') or 'section'
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(f'{RENDER_VERSION}:{text}'.encode('utf-8')).hexdigest()
+
+
+def render_markdown(text: str) -> Dict[str, Any]:
+    """Render markdown to sanitized HTML with heading anchors and a table of contents."""
+    tokens = _md.parse(text or '')
+    toc: List[Dict[str, Any]] = []
+    seen: Dict[str, int] = {}
+    for i, token in enumerate(tokens):
+        if token.type != 'heading_open':
+            continue
+        inline = tokens[i + 1]
+        title = ''.join(child.content for child in inline.children or [] if child.type in ('text', 'code_inline'))
+        slug = slugify(title)
+        count = seen.get(slug, 0)
+        seen[slug] = count + 1
+        if count:
+            slug = f'{slug}-{count}'
+        token.attrSet('id', slug)
+        toc.append({'level': int(token.tag[1]), 'title': title, 'id': slug})
+
+    words = len((text or '').split())
+    return {
+        'html': _md.renderer.render(tokens, _md.options, {}),
+        'toc': toc,
+        'word_count': words,
+        'reading_minutes': max(1, math.ceil(words / WORDS_PER_MINUTE)) if words else 0,
+    }
+
+
+def build_render(topic: Dict[str, Any], lang: str) -> Dict[str, Any]:
+    """Render one language of a topic and pre-compress the response body."""
+    text = topic.get(LANGUAGE_FIELDS[lang]) or ''
+    digest = content_hash(text)
+    rendered = render_markdown(text)
+    body = json.dumps({
+        'topic_id': topic['id'],
+        'lang': lang,
+        'content_hash': digest,
+        **rendered,
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    doc = {
+        '_id': f"{topic['id']}:{lang}",
+        'topic_id': topic['id'],
+        'lang': lang,
+        'content_hash': digest,
+        # weak, since the same tag covers every stored encoding
+        'etag': f'W/"{digest[:32]}"',
+        'identity': body,
+        # mtime=0 keeps the bytes identical for identical content
+        'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        doc['br'] = brotli.compress(body, quality=11)
+    return doc
+
+
+def build_renders(topic: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [build_render(topic, lang) for lang in LANGUAGE_FIELDS]
+
+
+async def store_renders(collection, topics: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Render and upsert every language of ``topics``; returns the stored documents."""
+    docs = [doc for topic in topics for doc in await asyncio.to_thread(build_renders, topic)]
+    if docs:
+        await collection.bulk_write([ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in docs], ordered=False)
+    return docs
+
+
+def pick_encoding(accept_encoding: Optional[str], render: Dict[str, Any]) -> str:
+    """Choose the best stored encoding the client accepts (br, then gzip, else identity)."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in ENCODINGS:
+        if render.get(encoding) and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description='Rebuild pre-rendered topic content')
+    parser.add_argument('--all', action='store_true', help='re-render topics whose content is unchanged too')
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    current = {
+        doc['_id']: doc['content_hash']
+        async for doc in db.topic_renders.find({}, {'content_hash': 1})
+    }
+    stale = []
+    async for topic in db.topics.find({}, {'_id': 0, 'id': 1, 'content': 1, 'content_hi': 1}):
+        if args.all or any(
+            current.get(f"{topic['id']}:{lang}") != content_hash(topic.get(field) or '')
+            for lang, field in LANGUAGE_FIELDS.items()
+        ):
+            stale.append(topic)
+
+    written = await store_renders(db.topic_renders, stale)
+    print(f"Re-rendered {len(stale)} topics ({len(written)} documents)")
+    if brotli is None:
+        print("brotli is not installed; only gzip variants were stored")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from bson.errors import BSONError
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+_RETRY_DELAYS = (0.1, 0.5, 1.0)
+
+
+class WriteBehindQueue:
+    """Coalesces append-only inserts into insert_many batches off the request path.
+
+    Documents are flushed when ``max_batch`` are pending or ``flush_interval``
+    seconds after the first one arrived. ``put`` blocks once ``max_pending``
+    documents are queued, which pushes back on callers instead of growing
+    without bound. Batches that still fail after retries are appended to a
+    per-process spill file next to ``spill_path`` and replayed by whichever
+    worker starts next.
+    """
+
+    def __init__(self, db, max_batch: int = 500, flush_interval: float = 0.1,
+                 max_pending: int = 20000, spill_path: Optional[Path] = None):
+        self._db = db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'batch_size_max': 0,
+            'flush_seconds_total': 0.0,
+            'flush_seconds_max': 0.0,
+            'retries': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'rejected_lines': 0,
+        }
+
+    async def start(self):
+        await self.replay_spill()
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, collection: str, doc: Dict[str, Any]):
+        await self._queue.put((collection, doc))
+        self._stats['enqueued'] += 1
+
+    async def stop(self, timeout: float = 10.0):
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Write-behind queue did not drain in %.1fs", timeout)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        leftover = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        if leftover:
+            await self._spill(leftover)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._flush(batch)
+            except Exception:
+                logger.exception("Write-behind flush failed")
+                await self._spill(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        started_at = time.perf_counter()
+        by_collection: Dict[str, List[Dict[str, Any]]] = {}
+        for collection, doc in batch:
+            by_collection.setdefault(collection, []).append(doc)
+
+        for collection, docs in by_collection.items():
+            if not await self._insert(collection, docs):
+                await self._spill([(collection, doc) for doc in docs])
+
+        elapsed = time.perf_counter() - started_at
+        self._stats['batches'] += 1
+        self._stats['batch_size_max'] = max(self._stats['batch_size_max'], len(batch))
+        self._stats['flush_seconds_total'] += elapsed
+        self._stats['flush_seconds_max'] = max(self._stats['flush_seconds_max'], elapsed)
+
+    async def _insert(self, collection: str, docs: List[Dict[str, Any]]) -> bool:
+        # pymongo assigns _id in place, so a retried batch only hits duplicate
+        # key errors for the documents that already made it
+        for delay in (0.0,) + _RETRY_DELAYS:
+            if delay:
+                self._stats['retries'] += 1
+                await asyncio.sleep(delay)
+            try:
+                await self._db[collection].insert_many(docs, ordered=False)
+                self._stats['written'] += len(docs)
+                return True
+            except BulkWriteError as e:
+                errors = [err for err in e.details.get('writeErrors', []) if err.get('code') != DUPLICATE_KEY]
+                if not errors:
+                    self._stats['written'] += e.details.get('nInserted', 0)
+                    return True
+                logger.error("Write-behind insert into %s rejected %d docs: %s",
+                             collection, len(errors), errors[0].get('errmsg'))
+                return False
+            except (AutoReconnect, ConnectionFailure):
+                continue
+            except PyMongoError:
+                logger.exception("Write-behind insert into %s failed", collection)
+                return False
+        return False
+
+    # --- spill file ---
+
+    def _spill_file(self) -> Path:
+        # one file per process, so workers sharing spill_path never interleave writes
+        return self.spill_path.with_name(f'{self.spill_path.stem}.{os.getpid()}{self.spill_path.suffix}')
+
+    def _append_spill(self, lines: List[str]):
+        with open(self._spill_file(), 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+
+    async def _spill(self, items: List[Tuple[str, Dict[str, Any]]]):
+        if not self.spill_path:
+            logger.error("Dropping %d write-behind docs (no spill file configured)", len(items))
+            return
+        lines = [json_util.dumps({'collection': c, 'doc': d}) + '\n' for c, d in items]
+        await asyncio.to_thread(self._append_spill, lines)
+        self._stats['spilled'] += len(items)
+        logger.warning("Spilled %d write-behind docs to %s", len(items), self._spill_file())
+
+    def _spill_files(self) -> List[Path]:
+        """Spill files left by any worker, oldest work first.
+
+        ``.replay`` files were claimed by a worker that died mid-replay;
+        then come the per-process files and a legacy shared ``spill_path``.
+        """
+        directory, stem = self.spill_path.parent, self.spill_path.stem
+        leftovers = sorted(directory.glob(f'{stem}.*.replay'))
+        spills = sorted(directory.glob(f'{stem}*{self.spill_path.suffix}'))
+        return leftovers + spills
+
+    def _rejected_file(self) -> Path:
+        # outside the spill glob, so quarantined lines are never replayed
+        return self.spill_path.with_name(f'{self.spill_path.stem}.rejected')
+
+    def _parse_spill(self, text: str) -> List[Dict[str, Any]]:
+        """Spill entries in ``text``; lines torn by a crash mid-write are quarantined."""
+        entries, rejected = [], []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json_util.loads(line)
+                if not isinstance(entry.get('collection'), str) or not isinstance(entry.get('doc'), dict):
+                    raise ValueError('not a spill entry')
+            except (ValueError, AttributeError, BSONError):
+                rejected.append(line + '\n')
+                continue
+            entries.append(entry)
+        if rejected:
+            with open(self._rejected_file(), 'a', encoding='utf-8') as f:
+                f.writelines(rejected)
+            self._stats['rejected_lines'] += len(rejected)
+            logger.error("Moved %d malformed write-behind spill lines to %s", len(rejected), self._rejected_file())
+        return entries
+
+    @staticmethod
+    def _restamp(path: Path, entries: List[Dict[str, Any]]):
+        """Give every doc a new _id and save it before inserting.
+
+        Pollers read new documents by _id, so replayed ones must not carry
+        the time they were first written. Saving the new ids first keeps a
+        replay cut short by a crash idempotent: the next one hits duplicate
+        keys for whatever already made it.
+        """
+        for entry in entries:
+            entry['doc']['_id'] = ObjectId()
+        staged = path.with_name(f'{path.name}.tmp')
+        staged.write_text(''.join(json_util.dumps(entry) + '\n' for entry in entries), encoding='utf-8')
+        staged.replace(path)
+
+    async def replay_spill(self):
+        if not self.spill_path:
+            return
+        for path in self._spill_files():
+            # claiming by rename is atomic; losing the race to another worker is fine
+            replaying = path.with_name(f'{self.spill_path.stem}.{os.getpid()}-{secrets.token_hex(4)}.replay')
+            try:
+                path.replace(replaying)
+                text = await asyncio.to_thread(replaying.read_text, encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            entries = await asyncio.to_thread(self._parse_spill, text)
+            # a .replay file was restamped by the worker that died replaying it
+            if path.suffix != '.replay':
+                await asyncio.to_thread(self._restamp, replaying, entries)
+            await self._replay(entries)
+            replaying.unlink(missing_ok=True)
+
+    async def _replay(self, entries: List[Dict[str, Any]]):
+        by_collection: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            by_collection.setdefault(entry['collection'], []).append(entry['doc'])
+
+        for collection, docs in by_collection.items():
+            for start in range(0, len(docs), self.max_batch):
+                chunk = docs[start:start + self.max_batch]
+                if await self._insert(collection, chunk):
+                    self._stats['replayed'] += len(chunk)
+                else:
+                    await self._spill([(collection, doc) for doc in chunk])
+
+    def metrics(self) -> Dict[str, Any]:
+        batches = self._stats['batches']
+        return {
+            'pending': self._queue.qsize(),
+            'batch_size_avg': (self._stats['written'] / batches) if batches else 0.0,
+            **self._stats,
+        }
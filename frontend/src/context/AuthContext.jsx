@@ -1,4 +1,4 @@
-import React, { createContext, useContext, useEffect, useState } from "react";
+import React, { createContext, useContext, useEffect, useRef, useState } from "react";
 import api from "../utils/api";
 
 const AuthContext = createContext(null);
@@ -7,6 +7,8 @@ export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [loading, setLoading] = useState(true);
   const [language, setLanguage] = useState("en");
+  // first-screen data fetched together with the user; each part is handed out once
+  const bootstrap = useRef(null);
 
   // Load token & language on refresh
   useEffect(() => {
@@ -16,9 +18,15 @@ export const AuthProvider = ({ children }) => {
 
     if (token) {
       api
-        .get("/auth/me")
-        .then((res) => {
-          setUser(res.data);
+        .get("/bootstrap")
+        .then(async (res) => {
+          bootstrap.current = res.data;
+          if (res.data.errors?.user) {
+            const me = await api.get("/auth/me");
+            setUser(me.data.user);
+          } else {
+            setUser(res.data.user);
+          }
         })
         .catch(() => {
           localStorage.removeItem("token");
@@ -69,12 +77,28 @@ export const AuthProvider = ({ children }) => {
   // LOGOUT
   const logout = () => {
     localStorage.removeItem("token");
+    bootstrap.current = null;
     setUser(null);
   };
 
+  // BOOTSTRAP
+  const takeBootstrap = (part) => {
+    const data = bootstrap.current;
+    if (!data || data[part] == null || data.errors?.[part]) {
+      return null;
+    }
+    const value = data[part];
+    data[part] = null;
+    return value;
+  };
+
   // LANGUAGE
   const toggleLanguage = () => {
     const newLang = language === "en" ? "hi" : "en";
+    // catalog parts were loaded in the old language
+    if (bootstrap.current) {
+      bootstrap.current.classes = null;
+    }
     setLanguage(newLang);
     localStorage.setItem("language", newLang);
   };
@@ -89,6 +113,7 @@ export const AuthProvider = ({ children }) => {
         logout,
         language,
         toggleLanguage,
+        takeBootstrap,
       }}
     >
       {children}
@@ -27,17 +27,18 @@ export default function Cart() {
                 currency: 'INR',
                 items: cart.map(item => ({
                     id: item.id,
-                    title: item.title,
+                    title: item.title || item.title_hi,
                     price: item.price,
                     quantity: item.quantity
                 }))
             });
 
-            const { order_id, key_id } = response.data;
+            // the server prices the order from the catalog
+            const { order_id, key_id, amount } = response.data;
 
             const options = {
                 key: key_id,
-                amount: getTotal() * 100,
+                amount: amount * 100,
                 currency: 'INR',
                 order_id: order_id,
                 name: 'EducationRoot',
@@ -46,7 +47,8 @@ export default function Cart() {
                     try {
                         await api.post('/orders/verify', {
                             order_id: order_id,
-                            payment_id: response.razorpay_payment_id
+                            payment_id: response.razorpay_payment_id,
+                            signature: response.razorpay_signature
                         });
                         toast.success(language === 'en' ? 'Payment successful!' : 'भुगतान सफल!');
                         clearCart();
@@ -106,12 +108,12 @@ export default function Cart() {
                         >
                             <img
                                 src={item.image}
-                                alt={item.title}
+                                alt={item.title || item.title_hi}
                                 className="w-20 h-28 object-cover rounded-lg"
                             />
                             <div className="flex-1">
                                 <h3 className="font-semibold text-slate-900">
-                                    {language === 'en' ? item.title : item.title_hi}
+                                    {language === 'en' ? item.title || item.title_hi : item.title_hi || item.title}
                                 </h3>
                                 <p className="text-[#0B6FFF] font-bold mt-1">₹{item.price}</p>
                             </div>
@@ -20,7 +20,7 @@ export default function ClassDetail() {
 
     useEffect(() => {
         fetchSubjects();
-    }, [classId]);
+    }, [classId, language]);
 
     const fetchSubjects = async () => {
         try {
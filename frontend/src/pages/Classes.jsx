@@ -8,13 +8,20 @@ import { toast } from 'sonner';
 export default function Classes() {
     const [classes, setClasses] = useState([]);
     const [loading, setLoading] = useState(true);
-    const { language } = useAuth();
+    const { language, takeBootstrap } = useAuth();
 
     useEffect(() => {
         fetchClasses();
-    }, []);
+    }, [language]);
 
     const fetchClasses = async () => {
+        // the app loaded the classes on start in the saved language; later switches refetch
+        const cached = takeBootstrap('classes');
+        if (cached) {
+            setClasses(cached.sort((a, b) => a.class_number - b.class_number));
+            setLoading(false);
+            return;
+        }
         try {
             const response = await api.get('/classes');
             setClasses(response.data.classes.sort((a, b) => a.class_number - b.class_number));
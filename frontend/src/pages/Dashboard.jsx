@@ -6,8 +6,9 @@ import { Link } from 'react-router-dom';
 import { toast } from 'sonner';
 
 export default function Dashboard() {
-    const { user, language } = useAuth();
+    const { user, language, takeBootstrap } = useAuth();
     const [progress, setProgress] = useState([]);
+    const [summary, setSummary] = useState({ attempts: 0, average_score: 0 });
     const [bookmarks, setBookmarks] = useState([]);
     const [purchases, setPurchases] = useState([]);
     const [loading, setLoading] = useState(true);
@@ -19,13 +20,26 @@ export default function Dashboard() {
     }, [user]);
 
     const fetchDashboardData = async () => {
+        // reuse what the app loaded on start, unless a part of it is missing
+        const cached = ['progress', 'summary', 'bookmarks', 'purchases'].map(takeBootstrap);
+        if (cached.every((part) => part !== null)) {
+            const [cachedProgress, cachedSummary, cachedBookmarks, cachedPurchases] = cached;
+            setProgress(cachedProgress);
+            setSummary(cachedSummary.summary);
+            setBookmarks(cachedBookmarks);
+            setPurchases(cachedPurchases);
+            setLoading(false);
+            return;
+        }
         try {
-            const [progressRes, bookmarksRes, purchasesRes] = await Promise.all([
-                api.get('/student/progress'),
+            const [progressRes, summaryRes, bookmarksRes, purchasesRes] = await Promise.all([
+                api.get('/student/progress', { params: { limit: 5 } }),
+                api.get('/student/progress/summary'),
                 api.get('/student/bookmarks'),
                 api.get('/student/purchases')
             ]);
             setProgress(progressRes.data.progress);
+            setSummary(summaryRes.data.summary);
             setBookmarks(bookmarksRes.data.bookmarks);
             setPurchases(purchasesRes.data.purchases);
         } catch (error) {
@@ -51,14 +65,12 @@ export default function Dashboard() {
         );
     }
 
-    const avgScore = progress.length > 0
-        ? (progress.reduce((acc, p) => acc + p.score, 0) / progress.length).toFixed(1)
-        : 0;
+    const avgScore = summary.average_score.toFixed(1);
 
     const stats = [
         {
             label: language === 'en' ? 'Quizzes Taken' : 'क्विज़ लिए',
-            value: progress.length,
+            value: summary.attempts,
             icon: Award,
             color: 'text-blue-500'
         },
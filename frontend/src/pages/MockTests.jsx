@@ -12,7 +12,7 @@ export default function MockTests() {
 
     useEffect(() => {
         fetchMockTests();
-    }, []);
+    }, [language]);
 
     const fetchMockTests = async () => {
         try {
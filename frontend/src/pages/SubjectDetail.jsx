@@ -13,7 +13,7 @@ export default function SubjectDetail() {
 
     useEffect(() => {
         fetchTopics();
-    }, [subjectId]);
+    }, [subjectId, language]);
 
     const fetchTopics = async () => {
         try {
@@ -5,11 +5,11 @@ import api from '../utils/api';
 import { Bookmark, Download, Clock, CheckCircle } from 'lucide-react';
 import { Button } from '../components/ui/button';
 import { toast } from 'sonner';
-import ReactMarkdown from 'react-markdown';
 
 export default function TopicDetail() {
     const { topicId } = useParams();
     const [topic, setTopic] = useState(null);
+    const [rendered, setRendered] = useState(null);
     const [quiz, setQuiz] = useState(null);
     const [showQuiz, setShowQuiz] = useState(false);
     const [answers, setAnswers] = useState({});
@@ -21,7 +21,7 @@ export default function TopicDetail() {
     useEffect(() => {
         fetchTopic();
         fetchQuiz();
-    }, [topicId]);
+    }, [topicId, language]);
 
     useEffect(() => {
         if (showQuiz && quiz && timeLeft === null) {
@@ -46,16 +46,34 @@ export default function TopicDetail() {
     }, [timeLeft, quizResult]);
 
     const fetchTopic = async () => {
+        // The body comes pre-rendered, so the topic itself is fetched without it
+        fetchRendered();
         try {
-            const response = await api.get(`/topic/${topicId}`);
+            const response = await api.get(`/topic/${topicId}`, { params: { content: false } });
             setTopic(response.data.topic);
         } catch (error) {
-            toast.error('Failed to load topic');
+            const status = error.response?.status;
+            if (status === 401 || status === 403) {
+                toast.error(error.response.data.detail);
+            } else {
+                toast.error('Failed to load topic');
+            }
         } finally {
             setLoading(false);
         }
     };
 
+    const fetchRendered = async () => {
+        setRendered(null);
+        try {
+            const response = await api.get(`/topic/${topicId}/rendered`);
+            setRendered(response.data);
+        } catch (error) {
+            // access errors are reported by fetchTopic; the metadata still shows
+            console.log('Failed to load topic content');
+        }
+    };
+
     const fetchQuiz = async () => {
         try {
             const response = await api.get(`/quiz/${topicId}`);
@@ -74,7 +92,8 @@ export default function TopicDetail() {
         try {
             await api.post('/student/bookmarks', {
                 topic_id: topicId,
-                title: topic.title
+                // the page is loaded in one language, so only one title may be present
+                title: topic.title || topic.title_hi
             });
             toast.success(language === 'en' ? 'Bookmarked!' : 'बुकमार्क किया गया!');
         } catch (error) {
@@ -160,7 +179,28 @@ export default function TopicDetail() {
 
                         {/* Topic Content */}
                         <div className="bg-white rounded-xl p-8 shadow-sm border border-slate-100 mb-6 topic-content">
-                            <ReactMarkdown>{language === 'en' ? topic.content : topic.content_hi}</ReactMarkdown>
+                            {rendered && rendered.reading_minutes > 0 && (
+                                <p className="flex items-center text-sm text-slate-500 mb-4">
+                                    <Clock className="h-4 w-4 mr-1" />
+                                    {rendered.reading_minutes} {language === 'en' ? 'min read' : 'मिनट पढ़ने का समय'}
+                                </p>
+                            )}
+                            {rendered && rendered.toc.length > 1 && (
+                                <nav className="mb-6 text-sm" data-testid="topic-toc">
+                                    {rendered.toc.map((heading) => (
+                                        <a
+                                            key={heading.id}
+                                            href={`#${heading.id}`}
+                                            className="block text-slate-600 hover:text-slate-900"
+                                            style={{ paddingLeft: `${(heading.level - 1) * 12}px` }}
+                                        >
+                                            {heading.title}
+                                        </a>
+                                    ))}
+                                </nav>
+                            )}
+                            {/* HTML is rendered and sanitized server-side when the topic is written */}
+                            {rendered && <div dangerouslySetInnerHTML={{ __html: rendered.html }} />}
 
                             {topic.formulas && topic.formulas.length > 0 && (
                                 <div className="mt-8">
@@ -40,6 +40,12 @@ api.interceptors.request.use(
       config.headers.Authorization = `Bearer ${token}`;
     }
 
+    // Only the selected language is sent back for bilingual content
+    config.params = {
+      lang: localStorage.getItem("language") || "en",
+      ...config.params,
+    };
+
     return config;
   },
   (error) => {
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from mongomock_motor import AsyncMongoMockClient
+
+from entitlements import Entitlements, Grants, order_lines, order_quantities, parse_items
+
+
+def test_parse_items_by_kind():
+    owned = parse_items([
+        {'id': 'b1', 'class_id': 'c1'},  # cart book, which names its class too
+        {'book_id': 'b2'},
+        {'class_id': 'c2'},
+        {'plan_id': 'p1', 'class_id': 'c3'},
+    ])
+    assert owned == {'books': {'b1', 'b2'}, 'classes': {'c2'}, 'plans': {'p1'}}
+
+
+def test_parse_items_skips_malformed_entries():
+    assert parse_items(None) == {'books': set(), 'classes': set(), 'plans': set()}
+    owned = parse_items(['b1', None, 7, {}, {'id': ''}, {'book_id': 12}])
+    assert owned == {'books': {'12'}, 'classes': set(), 'plans': set()}
+
+
+def test_grants_allow_owned_classes_or_any_plan():
+    assert Grants(classes=['c1']).allows('c1')
+    assert not Grants(classes=['c1']).allows('c2')
+    assert Grants(plans=['p1']).allows('c2')
+    assert not Grants().allows(None)
+
+
+def test_grant_adds_book_classes_and_is_idempotent():
+    async def run():
+        db = AsyncMongoMockClient()['test']
+        await db.books.insert_one({'id': 'b1', 'class_id': 'c1'})
+        entitlements = Entitlements(db.entitlements, db.orders, db.books, db.topics)
+        for _ in range(2):
+            await entitlements.grant('u1', 'o1', [{'id': 'b1'}])
+        grants = await entitlements.get('u1')
+        assert grants.view() == {'books': ['b1'], 'classes': ['c1'], 'plans': []}
+        assert (await db.entitlements.find_one({'user_id': 'u1'}))['orders'] == ['o1']
+
+    asyncio.run(run())
+
+
+def test_forged_items_grant_nothing():
+    async def run():
+        db = AsyncMongoMockClient()['test']
+        await db.books.insert_one({'id': 'b1', 'class_id': 'c1'})
+        await db.topics.insert_one({'id': 't1', 'class_id': 'c1', 'premium': True})
+        entitlements = Entitlements(db.entitlements, db.orders, db.books, db.topics,
+                                    classes=db.classes, plans=db.plans)
+        await entitlements.grant('u1', 'o1', [{'plan_id': 'anything'}, {'id': 'nope'}, {'class_id': 'c1'}])
+        grants = await entitlements.get('u1')
+        assert grants.view() == {'books': [], 'classes': [], 'plans': []}
+        assert not grants.allows('c1')
+        assert await entitlements.locked_topics('u1', {}) == {'t1'}
+
+    asyncio.run(run())
+
+
+def test_orders_are_priced_from_the_catalog():
+    books = {'b1': {'id': 'b1', 'title': 'Physics', 'price': 250}, 'b2': {'id': 'b2', 'title_hi': 'भौतिकी', 'price': 100}}
+    quantities = order_quantities([{'id': 'b1', 'price': 1, 'quantity': 2}, {'book_id': 'b2'}])
+    items, amount = order_lines(quantities, books)
+    assert amount == 600
+    assert items[1] == {'id': 'b2', 'title': 'भौतिकी', 'price': 100, 'quantity': 1}
+
+
+@pytest.mark.parametrize('items', [
+    [{'plan_id': 'anything'}],
+    [{'class_id': 'c1'}],
+    [{'id': 'b1', 'quantity': 0}],
+    [{'id': 'b1', 'quantity': 1.5}],
+    [{'id': 'b1', 'quantity': True}],
+    ['b1'],
+])
+def test_unsellable_items_are_rejected(items):
+    with pytest.raises(ValueError):
+        order_quantities(items)
+
+
+def test_unknown_books_are_rejected():
+    with pytest.raises(ValueError, match='nope'):
+        order_lines({'nope': 1}, {})
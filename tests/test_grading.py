@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from grading import AnswerKey, grade, grade_many, grade_one
+
+QUIZ = {
+    'id': 'q1',
+    'topic_id': 't1',
+    'questions': [
+        {'id': 'a', 'options': ['A', 'B', 'C'], 'correct_answer': 'A'},
+        {'id': 'b', 'options': ['A', 'B', 'C'], 'correct_answer': 'B', 'marks': 2},
+        {'id': 'c', 'options': ['X', 'Y', 'Z'], 'correct_answer': ['X', 'Z']},
+    ],
+}
+
+
+def key(**overrides) -> AnswerKey:
+    return AnswerKey({**QUIZ, **overrides}, {'subject_id': 's1', 'class_id': 'c1'})
+
+
+def test_all_correct_scores_full_marks():
+    graded = grade_one(key(), {'a': 'A', 'b': 'B', 'c': ['Z', 'X']})
+    assert graded['correct'] == 3
+    assert graded['marks'] == graded['max_marks'] == 4.0
+    assert graded['score'] == 100.0
+    assert graded['per_question'].tolist() == [True, True, True]
+
+
+def test_unanswered_and_unknown_answers():
+    graded = grade_one(key(), {'a': 'nope', 'zz': 'A'})
+    assert graded['correct'] == 0
+    assert graded['marks'] == 0.0
+
+
+def test_negative_marking_only_for_wrong_answers():
+    graded = grade_one(key(negative_marking=0.25), {'a': 'B', 'b': 'B'})
+    # -0.25 on a, +2 on b, nothing for the unanswered c
+    assert graded['marks'] == pytest.approx(1.75)
+
+
+def test_partial_marking_for_multi_select():
+    graded = grade_one(key(partial_marking=True), {'c': ['X']})
+    assert graded['marks'] == pytest.approx(0.5)
+    assert graded['correct'] == 0
+    # a wrong pick forfeits the partial credit
+    assert grade_one(key(partial_marking=True), {'c': ['X', 'Y']})['marks'] == 0.0
+
+
+def test_grade_many_matches_grade_one():
+    answer_key = key(negative_marking=0.5, partial_marking=True)
+    submissions = [{'a': 'A'}, {'b': 'C', 'c': ['Z']}, {}]
+    for many, answers in zip(grade_many(answer_key, submissions), submissions):
+        one = grade_one(answer_key, answers)
+        assert many['marks'] == one['marks']
+        assert many['correct'] == one['correct']
+
+
+def test_grade_of_empty_key():
+    empty = AnswerKey({'id': 'q0', 'questions': []})
+    graded = grade(empty, np.zeros((2, 0), dtype=np.int64))
+    assert graded['score'].tolist() == [0.0, 0.0]
+
+
+def test_encode_decode_round_trip():
+    answer_key = key()
+    answers = {'a': 'C', 'c': ['X', 'Z']}
+    assert answer_key.decode(answer_key.encode(answers)) == answers
+
+
+def test_encode_answer_rejects_unknown_question_and_option():
+    answer_key = key()
+    assert answer_key.encode_answer('b', 'B') == (1, 2)
+    with pytest.raises(ValueError):
+        answer_key.encode_answer('zz', 'A')
+    with pytest.raises(ValueError):
+        answer_key.encode_answer('a', 'D')
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+from bson import ObjectId, Timestamp
+
+from invalidation_bus import Change
+
+WALL = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_update_lists_updated_and_removed_fields():
+    change = Change.from_event('topics', {
+        'operationType': 'update',
+        'fullDocument': {'id': 't1', 'title': 'Cells'},
+        'updateDescription': {'updatedFields': {'title': 'Cells', 'meta.views': 3}, 'removedFields': ['premium']},
+        'wallTime': WALL,
+    })
+    assert (change.collection, change.operation, change.id, change.at) == ('topics', 'update', 't1', WALL)
+    assert change.updated_fields == ['title', 'meta.views', 'premium']
+    assert change.changed('meta') and change.changed('premium')
+    assert not change.changed('content') and not change.broad
+
+
+def test_insert_and_replace_may_change_any_field():
+    for operation in ('insert', 'replace'):
+        change = Change.from_event('books', {'operationType': operation, 'fullDocument': {'id': 'b1'}})
+        assert change.id == 'b1'
+        assert change.updated_fields is None
+        assert change.changed('price')
+
+
+def test_delete_is_broad():
+    change = Change.from_event('topics', {'operationType': 'delete', 'documentKey': {'_id': ObjectId()}})
+    assert change.id is None and change.broad
+    assert change.document == {}
+
+
+def test_update_of_a_since_deleted_document_is_broad():
+    # updateLookup finds nothing once the document is gone
+    change = Change.from_event('topics', {'operationType': 'update', 'fullDocument': None,
+                                          'updateDescription': {'updatedFields': {'title': 'x'}}})
+    assert change.broad
+
+
+def test_cluster_time_stands_in_for_wall_time():
+    cluster_time = Timestamp(WALL, 1)
+    change = Change.from_event('topics', {'operationType': 'insert', 'fullDocument': {'id': 't1'},
+                                          'clusterTime': cluster_time})
+    assert change.at == cluster_time.as_datetime()
+    assert Change.from_event('topics', {'operationType': 'drop'}).at is None
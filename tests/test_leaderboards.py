@@ -0,0 +1,54 @@
+import itertools
+
+from leaderboards import Standings, board_id
+
+RESULTS = [
+    ('u1', 'q1', 't1', 'c1', 60, '2024-01-01T10:00:00'),
+    ('u1', 'q1', 't1', 'c1', 80, '2024-01-02T10:00:00'),
+    ('u1', 'q2', 't2', 'c1', 50, '2024-01-03T10:00:00'),
+    ('u2', 'q1', 't1', 'c1', 80, '2024-01-01T12:00:00'),
+    ('u2', 'q3', None, None, 90, '2024-01-02T12:00:00'),
+]
+
+
+def apply_all(results) -> Standings:
+    standings = Standings()
+    for result in results:
+        standings.apply(*result)
+    return standings
+
+
+def snapshot(standings: Standings):
+    return {name: board.top(len(board)) for name, board in standings.boards.items()}
+
+
+def test_best_score_per_user_and_earlier_attempt_wins_ties():
+    standings = apply_all(RESULTS)
+    top = standings.board(board_id('quiz', 'q1')).top(10)
+    # both reached 80, u2 a day earlier
+    assert [(entry['user_id'], entry['score']) for entry in top] == [('u2', 80.0), ('u1', 80.0)]
+    assert top[1]['achieved_at'] == '2024-01-02T10:00:00'
+    assert standings.board(board_id('topic', 't1')).rank('u1')['rank'] == 2
+
+
+def test_class_board_sums_best_topic_scores():
+    standings = apply_all(RESULTS)
+    board = standings.board(board_id('class', 'c1'))
+    assert board.rank('u1') == {'rank': 1, 'user_id': 'u1', 'score': 130.0, 'achieved_at': '2024-01-03T10:00:00'}
+    assert board.rank('u2')['score'] == 80.0
+    # a lower retry changes nothing
+    standings.apply('u1', 'q2', 't2', 'c1', 10, '2024-01-04T10:00:00')
+    assert board.rank('u1')['score'] == 130.0
+
+
+def test_results_without_a_topic_only_rank_the_quiz():
+    standings = apply_all(RESULTS)
+    assert standings.board(board_id('quiz', 'q3')).rank('u2')['score'] == 90.0
+    assert board_id('topic', None) not in standings.boards
+
+
+def test_apply_is_idempotent_and_order_independent():
+    expected = snapshot(apply_all(RESULTS))
+    assert snapshot(apply_all(RESULTS + RESULTS)) == expected
+    for order in itertools.permutations(RESULTS):
+        assert snapshot(apply_all(order)) == expected
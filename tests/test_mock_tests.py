@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from grading import AnswerKey, AnswerKeyCache
+from mock_tests import MockTestEngine, SessionClosed
+
+TEST = {
+    'id': 'm1',
+    'questions': [
+        {'id': 'a', 'options': ['A', 'B'], 'correct_answer': 'A'},
+        {'id': 'b', 'options': ['A', 'B'], 'correct_answer': 'B'},
+    ],
+}
+
+
+class Yielding:
+    """Collection whose calls yield to the loop first, as a real round trip does."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+        if not asyncio.iscoroutinefunction(method):
+            return method
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(0)
+            return await method(*args, **kwargs)
+
+        return call
+
+
+def engine(db=None):
+    db = db if db is not None else AsyncMongoMockClient()['test']
+    return MockTestEngine(Yielding(db.mock_test_sessions), AnswerKeyCache(db.mock_tests)), db
+
+
+async def workers(n: int):
+    db = AsyncMongoMockClient()['test']
+    await db.mock_tests.insert_one(dict(TEST))
+    return [engine(db)[0] for _ in range(n)], db
+
+
+def test_concurrent_starts_share_one_session():
+    async def run():
+        mock_tests, db = engine()
+        key = AnswerKey(TEST)
+        views = await asyncio.gather(*(mock_tests.begin('u1', key, 30) for _ in range(5)))
+        assert len({view['id'] for view in views}) == 1
+        assert await db.mock_test_sessions.count_documents({'status': 'active'}) == 1
+
+    asyncio.run(run())
+
+
+def test_delta_waiting_on_submit_is_rejected():
+    async def run():
+        mock_tests, db = engine()
+        view = await mock_tests.begin('u1', AnswerKey(TEST), 30)
+        submitted = asyncio.ensure_future(mock_tests.submit(view['id'], 'u1'))
+        await asyncio.sleep(0)  # submit holds the session lock
+        with pytest.raises(SessionClosed):
+            await mock_tests.apply(view['id'], 'u1', 1, {'a': 'A'}, {})
+        assert (await submitted)['status'] == 'submitted'
+        stored = await db.mock_test_sessions.find_one({'id': view['id']})
+        assert stored['answers'] == {}
+
+    asyncio.run(run())
+
+
+def test_session_moves_to_the_worker_a_request_reaches():
+    async def run():
+        (first, second), db = await workers(2)
+        view = await first.begin('u1', AnswerKey(TEST), 30)
+        await first.apply(view['id'], 'u1', 1, {'a': 'A'}, {})
+        await first.flush()
+        await first.apply(view['id'], 'u1', 2, {'b': 'A'}, {})
+
+        # not 409: the second worker takes over from the last flushed state
+        ack = await second.apply(view['id'], 'u1', 2, {'b': 'B'}, {})
+        assert (ack['seq'], ack['applied']) == (2, True)
+        await second.flush()
+        # the first worker's stale write matches nothing, so it lets the session go
+        await first.flush()
+        assert first.metrics()['lost'] == 1 and first.metrics()['active'] == 0
+
+        stored = await db.mock_test_sessions.find_one({'id': view['id']})
+        assert stored['answers'] == {'a': 'A', 'b': 'B'}
+        result = await first.submit(view['id'], 'u1')
+        assert result['status'] == 'submitted' and result['result']['correct'] == 2
+
+    asyncio.run(run())
+
+
+def test_restarted_worker_claims_sessions_on_use_and_sweeps_orphans():
+    async def run():
+        (before,), db = await workers(1)
+        kept = await before.begin('u1', AnswerKey(TEST), 30)
+        orphan = await before.begin('u2', AnswerKey(TEST), 30)
+        await before.apply(kept['id'], 'u1', 1, {'a': 'A'}, {})
+        await before.flush()
+        await db.mock_test_sessions.update_one({'id': orphan['id']},
+                                               {'$set': {'deadline': '2000-01-01T00:00:00+00:00'}})
+
+        after = engine(db)[0]
+        await after.start()
+        try:
+            assert after.metrics()['active'] == 0
+            view = await after.get(kept['id'], 'u1')
+            assert view['answers'] == {'a': 'A'} and 0 < view['remaining_seconds'] <= 1800
+            await after.sweep()
+            assert (await db.mock_test_sessions.find_one({'id': orphan['id']}))['submitted_by'] == 'timer'
+            assert (await after.submit(kept['id'], 'u1'))['result']['correct'] == 1
+        finally:
+            await after.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,46 @@
+import base64
+import json
+
+import pytest
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_query
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor('2025-01-01T00:00:00+00:00', 'abc')
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == ('2025-01-01T00:00:00+00:00', 'abc')
+
+
+def test_cursor_for_missing_sort_value():
+    assert decode_cursor(encode_cursor(None, 'abc')) == (None, 'abc')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    raw_cursor('just a string'),
+    raw_cursor(['2025-01-01', 'a', 'extra']),
+    raw_cursor(['2025-01-01', {'$ne': ''}]),
+    raw_cursor([{'$gt': ''}, 'abc']),
+    raw_cursor([['2025-01-01'], 'abc']),
+    raw_cursor([5, 'abc']),
+])
+def test_malformed_or_injected_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_keyset_query_continues_after_cursor():
+    query = keyset_query({'user_id': 'u1'}, 'submitted_at', encode_cursor('2025-01-02', 'r9'))
+    assert query == {
+        'user_id': 'u1',
+        '$or': [
+            {'submitted_at': {'$lt': '2025-01-02'}},
+            {'submitted_at': '2025-01-02', 'id': {'$lt': 'r9'}},
+        ],
+    }
+    assert keyset_query({'user_id': 'u1'}, 'submitted_at', None) == {'user_id': 'u1'}
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from password_hashing import HasherOverloaded, PasswordHasher, hash_cost
+
+
+def test_hash_cost_reads_bcrypt_rounds():
+    assert hash_cost('$2b$12$abcdefghijklmnopqrstuv') == 12
+    assert hash_cost('$2b$04$abcdefghijklmnopqrstuv') == 4
+
+
+def test_hash_cost_of_malformed_hash_is_zero():
+    assert hash_cost('') == 0
+    assert hash_cost('plaintext') == 0
+    assert hash_cost('$2b$xx$abc') == 0
+
+
+def test_needs_rehash_when_rounds_change():
+    hasher = PasswordHasher(rounds=4, max_workers=1)
+    try:
+        assert not hasher.needs_rehash('$2b$04$abcdefghijklmnopqrstuv')
+        assert hasher.needs_rehash('$2b$12$abcdefghijklmnopqrstuv')
+    finally:
+        hasher.shutdown()
+
+
+def test_hash_and_verify_round_trip():
+    async def run():
+        hasher = PasswordHasher(rounds=4, max_workers=1)
+        try:
+            hashed = await hasher.hash('secret')
+            assert hash_cost(hashed) == 4
+            assert await hasher.verify('secret', hashed)
+            assert not await hasher.verify('wrong', hashed)
+        finally:
+            hasher.shutdown()
+
+    asyncio.run(run())
+
+
+def test_rejects_callers_beyond_the_queue():
+    async def run():
+        hasher = PasswordHasher(rounds=4, max_workers=1, max_queue=1, retry_after=7)
+        try:
+            await hasher._slots.acquire()  # hold the only worker slot
+            waiting = asyncio.ensure_future(hasher.hash('a'))
+            await asyncio.sleep(0)
+            with pytest.raises(HasherOverloaded) as excinfo:
+                await hasher.hash('b')
+            assert excinfo.value.retry_after == 7
+            assert hasher.metrics()['rejected'] == 1
+            hasher._slots.release()
+            assert hash_cost(await waiting) == 4
+        finally:
+            hasher.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import pytest
+
+from payments import CircuitBreaker, CircuitOpen, PaymentGateway, PaymentGatewayError, RazorpayGateway
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('payments.time.monotonic', clock)
+    return clock
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+
+def test_breaker_lets_one_trial_through_when_half_open(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 31
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.retry_after() == 30
+
+
+def gateway(handler, **kwargs) -> RazorpayGateway:
+    gateway = RazorpayGateway('key', 'secret', **kwargs)
+    gateway._client = httpx.AsyncClient(base_url=RazorpayGateway.BASE_URL, transport=httpx.MockTransport(handler))
+    return gateway
+
+
+def test_create_order_returns_gateway_order():
+    def handler(request):
+        return httpx.Response(200, json={'id': 'order_1', 'receipt': 'r1'})
+
+    order = asyncio.run(gateway(handler).create_order(100, 'INR', 'r1'))
+    assert order['id'] == 'order_1'
+
+
+def test_client_error_without_json_body_is_a_gateway_error():
+    def handler(request):
+        return httpx.Response(400, text='<html>Bad Request</html>')
+
+    pay = gateway(handler)
+    with pytest.raises(PaymentGatewayError, match='HTTP 400'):
+        asyncio.run(pay.create_order(100, 'INR', 'r1'))
+    assert pay.breaker.state == 'closed'
+    assert pay.breaker.failures == 0
+
+
+def test_unreadable_success_body_counts_as_failure():
+    def handler(request):
+        return httpx.Response(200, text='<html>gateway</html>')
+
+    pay = gateway(handler, max_retries=0, breaker=CircuitBreaker(failure_threshold=1))
+    with pytest.raises(PaymentGatewayError, match='Unreadable'):
+        asyncio.run(pay.create_order(100, 'INR', 'r1'))
+    assert pay.breaker.state == 'open'
+
+
+def test_half_open_trial_is_released_on_unexpected_errors(clock):
+    def handler(request):
+        raise RuntimeError('boom')
+
+    pay = gateway(handler, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30))
+    pay.breaker.record_failure()
+    clock.now += 30
+    with pytest.raises(RuntimeError):
+        asyncio.run(pay.create_order(100, 'INR', 'r1'))
+    with pytest.raises(CircuitOpen):
+        asyncio.run(pay.create_order(100, 'INR', 'r1'))
+    clock.now += 30
+    assert pay.breaker.allow()
+
+
+def test_gateway_without_create_order_cannot_be_built():
+    class Incomplete(PaymentGateway):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete('key', 'secret')
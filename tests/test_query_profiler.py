@@ -0,0 +1,21 @@
+from query_profiler import fingerprint, shape
+
+
+def test_shape_replaces_literals_but_keeps_operators():
+    query = {'user_id': 'u1', 'score': {'$gte': 50}, 'id': {'$in': ['a', 'b', 'c']}}
+    assert shape(query) == {'user_id': '?', 'score': {'$gte': '?'}, 'id': {'$in': ['?']}}
+
+
+def test_shape_keeps_structural_values():
+    pipeline = [{'$match': {'user_id': 'u1'}}, {'$group': {'_id': '$topic_id', 'n': {'$sum': 1}}}]
+    assert shape(pipeline) == [{'$match': {'user_id': '?'}}, {'$group': {'_id': '$topic_id', 'n': {'$sum': 1}}}]
+
+
+def test_fingerprint_ignores_values():
+    first = fingerprint('find', {'find': 'topics', 'filter': {'subject_id': 'a'}, 'sort': {'created_at': -1}})
+    second = fingerprint('find', {'find': 'topics', 'filter': {'subject_id': 'b'}, 'sort': {'created_at': -1}})
+    other_sort = fingerprint('find', {'find': 'topics', 'filter': {'subject_id': 'a'}, 'sort': {'title': 1}})
+    assert first == second
+    assert first[0] != other_sort[0]
+    assert first[1] == 'topics'
+    assert '"subject_id": "?"' in first[2] and '"a"' not in first[2]
@@ -0,0 +1,67 @@
+import asyncio
+import random
+from collections import Counter
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from question_bank import Pool, QuestionBank, allocate
+
+
+def pool_of(positions) -> Pool:
+    pool = Pool()
+    for position in positions:
+        pool.add(position)
+    return pool
+
+
+def test_draw_is_a_seeded_permutation():
+    pool = pool_of(range(50))
+    drawn = list(pool.draw(random.Random(7)))
+    assert sorted(drawn) == list(range(50))
+    assert drawn == list(pool.draw(random.Random(7)))
+    assert drawn != list(range(50))
+
+
+def test_draw_is_uniform():
+    pool = pool_of(range(4))
+    rng = random.Random(1)
+    firsts = Counter(next(pool.draw(rng)) for _ in range(4000))
+    assert set(firsts) == {0, 1, 2, 3}
+    assert all(900 < n < 1100 for n in firsts.values())
+
+
+def test_remove_keeps_the_index_consistent():
+    pool = pool_of([10, 11, 12, 13])
+    pool.remove(10)
+    pool.remove(99)
+    pool.add(12)
+    assert len(pool) == 3
+    assert sorted(pool.draw(random.Random(0))) == [11, 12, 13]
+    assert all(pool.items[i] == position for position, i in pool.index.items())
+
+
+def test_allocate_uses_largest_remainders():
+    assert allocate(10, {'easy': 0.3, 'medium': 0.5, 'hard': 0.2}) == {'easy': 3, 'medium': 5, 'hard': 2}
+    assert allocate(7, {'easy': 1, 'medium': 1, 'hard': 1}) == {'easy': 3, 'medium': 2, 'hard': 2}
+    assert allocate(5, {'easy': 0, 'hard': 2}) == {'hard': 5}
+    assert sum(allocate(1, {'easy': 0.3, 'medium': 0.5, 'hard': 0.2}).values()) == 1
+    with pytest.raises(ValueError):
+        allocate(5, {'easy': 0})
+
+
+def test_assemble_skips_disallowed_questions():
+    async def run():
+        db = AsyncMongoMockClient()['test']
+        await db.questions.insert_many([
+            {'id': f'{topic}-{i}', 'topic_id': topic, 'subject_id': 's1', 'difficulty': 'easy', 'options': ['A', 'B']}
+            for topic in ('free', 'premium') for i in range(5)
+        ])
+        bank = QuestionBank(db.questions)
+        await bank.load()
+        assert len(bank.assemble('subject', 's1', 10, seed=3)) == 10
+        questions = bank.assemble('subject', 's1', 10, seed=3,
+                                  allowed=lambda question: question['topic_id'] != 'premium')
+        assert sorted(question['id'] for question in questions) == [f'free-{i}' for i in range(5)]
+
+    asyncio.run(run())
@@ -0,0 +1,8 @@
+from response_models import MockTestList, MockTestPaper
+
+
+def test_mock_tests_keep_fractional_marks():
+    tests = MockTestList.model_validate({'tests': [{'id': 'm1', 'total_marks': 37.5}, {'id': 'm2', 'total_marks': 100}]})
+    assert [test.total_marks for test in tests.tests] == [37.5, 100]
+    paper = MockTestPaper.model_validate({'test': {'id': 'm1', 'total_marks': 37.5, 'questions': [{'id': 'q1', 'marks': 1.5}]}})
+    assert paper.test.total_marks == 37.5
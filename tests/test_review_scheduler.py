@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from grading import AnswerKey
+from review_scheduler import DAY, MIN_EASE, ReviewScheduler, due_at, sm2
+
+KEY_QUESTIONS = [{'id': 'a', 'options': ['A', 'B'], 'correct_answer': 'A'}]
+KEY = AnswerKey({'id': 'q1', 'topic_id': 't1', 'questions': KEY_QUESTIONS})
+
+
+def test_sm2_first_reviews_then_growth():
+    ease = np.full(3, 2.5)
+    _, interval, reps, lapsed = sm2(ease, np.array([0.0, 1.0, 6.0]), np.array([0, 1, 2]), np.array([4, 4, 4]))
+    assert interval.tolist() == [1.0, 6.0, 15.0]
+    assert reps.tolist() == [1, 2, 3]
+    assert not lapsed.any()
+
+
+def test_sm2_ease_moves_with_quality():
+    ease, _, _, _ = sm2(np.full(3, 2.5), np.zeros(3), np.zeros(3, dtype=np.int64), np.array([5, 4, 3]))
+    assert ease == pytest.approx([2.6, 2.5, 2.36])
+    # repeated failures stop at the floor
+    ease, _, _, _ = sm2(np.array([1.35]), np.zeros(1), np.zeros(1, dtype=np.int64), np.array([1]))
+    assert ease[0] == MIN_EASE
+
+
+def test_sm2_failure_resets_and_counts_a_lapse_once_learned():
+    _, interval, reps, lapsed = sm2(np.full(2, 2.5), np.array([15.0, 0.0]), np.array([3, 0]), np.array([1, 1]))
+    assert interval.tolist() == [1.0, 1.0]
+    assert reps.tolist() == [0, 0]
+    assert lapsed.tolist() == [True, False]
+
+
+def test_due_at_caps_and_fuzzes_long_intervals_only():
+    reviewed = np.zeros(4)
+    due = due_at(reviewed, np.array([1.0, 2.0, 10.0, 1000.0]), np.array([1.0, 1.0, -1.0, 0.0]), 365.0, 0.1)
+    assert (due / DAY).tolist() == pytest.approx([1.0, 2.0, 9.0, 365.0])
+
+
+class Interleaved:
+    """Collection that runs ``before`` once, just ahead of the next bulk write."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.before = None
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def bulk_write(self, *args, **kwargs):
+        before, self.before = self.before, None
+        if before is not None:
+            await before()
+        return await self._collection.bulk_write(*args, **kwargs)
+
+
+@pytest.mark.parametrize('existing', [False, True])
+def test_concurrent_flushes_do_not_lose_answers(existing):
+    async def run():
+        db = AsyncMongoMockClient()['test']
+        await db.review_items.create_index([('user_id', 1), ('question_id', 1)], unique=True)
+        mine, other = Interleaved(db.review_items), ReviewScheduler(db.review_items, db.job_locks)
+        scheduler = ReviewScheduler(mine, db.job_locks)
+        if existing:
+            other.record('u1', KEY, np.array([1]), np.array([True]))
+            await other.flush()
+
+        # another worker writes the item between this flush's read and write
+        other.record('u1', KEY, np.array([1]), np.array([True]))
+        scheduler.record('u1', KEY, np.array([1]), np.array([False]))
+        mine.before = other.flush
+        await scheduler.flush()
+
+        item = await db.review_items.find_one({'user_id': 'u1', 'question_id': 'a'})
+        assert item['attempts'] == 2 + existing
+        assert item['correct'] == 1 + existing
+        assert scheduler.metrics()['conflicts'] == 1
+        assert scheduler.metrics()['pending'] == 0
+
+    asyncio.run(run())
+
+
+def test_reschedule_skips_items_reviewed_since_they_were_read():
+    async def run():
+        db = AsyncMongoMockClient()['test']
+        scheduler = ReviewScheduler(db.review_items, db.job_locks, max_interval=2.0)
+        await db.review_items.insert_one({'user_id': 'u1', 'question_id': 'a', 'interval': 6.0, 'fuzz': 0.0,
+                                          'reviewed_at': '2024-01-01T00:00:00+00:00',
+                                          'due': '2024-01-07T00:00:00+00:00'})
+        items = await db.review_items.find({}).to_list(None)
+        await db.review_items.update_one({}, {'$set': {'reviewed_at': '2024-01-05T00:00:00+00:00',
+                                                       'due': '2024-01-20T00:00:00+00:00'}})
+        await scheduler._reschedule_batch(items)
+        assert (await db.review_items.find_one({}))['due'] == '2024-01-20T00:00:00+00:00'
+
+        assert (await scheduler.reschedule())['changed'] == 1
+        assert (await db.review_items.find_one({}))['due'] == '2024-01-07T00:00:00+00:00'
+
+    asyncio.run(run())
+
+
+def test_record_takes_a_datetime():
+    scheduler = ReviewScheduler(None, None)
+    at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    scheduler.record('u1', KEY, np.array([1]), np.array([True]), at)
+    scheduler.record('u1', KEY, np.array([0]), np.array([False]))
+    assert scheduler.metrics()['pending'] == 1
+    assert scheduler._pending[0][5] == at.timestamp()
+
+
+def test_reviews_keep_the_item_origin():
+    async def run():
+        db = AsyncMongoMockClient()['test']
+        scheduler = ReviewScheduler(db.review_items, db.job_locks)
+        review = AnswerKey({'id': 'review', 'questions': KEY_QUESTIONS})
+        # the first answer came from a review key, so the item has no origin yet
+        scheduler.record('u1', review, np.array([1]), np.array([True]), origin=False)
+        await scheduler.flush()
+        assert {'quiz_id', 'topic_id'}.isdisjoint(await db.review_items.find_one({}, {'_id': 0}))
+
+        scheduler.record('u1', KEY, np.array([1]), np.array([True]))
+        await scheduler.flush()
+        scheduler.record('u1', review, np.array([1]), np.array([False]), origin=False)
+        scheduler.record('u1', AnswerKey({'id': 'q2', 'topic_id': 't2', 'questions': KEY_QUESTIONS}),
+                         np.array([1]), np.array([True]))
+        await scheduler.flush()
+        item = await db.review_items.find_one({})
+        assert (item.get('quiz_id'), item.get('topic_id'), item['attempts']) == (None, None, 4)
+
+        await db.review_items.delete_many({})
+        scheduler.record('u1', review, np.array([1]), np.array([True]), origin=False)
+        scheduler.record('u1', KEY, np.array([1]), np.array([True]))
+        await scheduler.flush()
+        item = await db.review_items.find_one({})
+        assert (item['quiz_id'], item['topic_id'], item['attempts']) == ('q1', 't1', 2)
+
+    asyncio.run(run())
@@ -0,0 +1,56 @@
+import gzip
+import json
+
+import pytest
+
+from topic_renders import build_render, pick_encoding, render_markdown, slugify
+
+RENDER = {'identity': b'{}', 'gzip': b'gz', 'br': b'br'}
+
+
+@pytest.mark.parametrize('accept, expected', [
+    (None, 'identity'),
+    ('', 'identity'),
+    ('gzip', 'gzip'),
+    ('gzip, deflate, br', 'br'),
+    ('br;q=0, gzip', 'gzip'),
+    ('BR', 'br'),
+    ('*', 'br'),
+    ('*, br;q=0', 'gzip'),
+    ('gzip;q=0, br;q=0', 'identity'),
+    ('gzip;q=bogus', 'identity'),
+    ('deflate', 'identity'),
+])
+def test_pick_encoding(accept, expected):
+    assert pick_encoding(accept, RENDER) == expected
+
+
+def test_pick_encoding_skips_encodings_not_stored():
+    # renders written without brotli installed
+    assert pick_encoding('br, gzip', {'identity': b'{}', 'gzip': b'gz'}) == 'gzip'
+    assert pick_encoding('br', {'identity': b'{}', 'gzip': b'gz'}) == 'identity'
+
+
+def test_slugify_keeps_devanagari_marks():
+    assert slugify('Newton’s Laws of Motion') == 'newtons-laws-of-motion'
+    assert slugify('गति के नियम') == 'गति-के-नियम'
+    assert slugify('???') == 'section'
+
+
+def test_render_markdown_builds_unique_anchors():
+    rendered = render_markdown('# Intro\n\ntext\n\n## Intro\n\nmore words here')
+    assert [(h['level'], h['id']) for h in rendered['toc']] == [(1, 'intro'), (2, 'intro-1')]
+    assert 'id="intro-1"' in rendered['html']
+    assert rendered['word_count'] == 8  # split on whitespace, markers included
+    assert rendered['reading_minutes'] == 1
+
+
+def test_build_render_compresses_deterministically():
+    topic = {'id': 't1', 'content': '# Hello\n\nworld', 'content_hi': ''}
+    first, second = build_render(topic, 'en'), build_render(topic, 'en')
+    assert first['_id'] == 't1:en'
+    assert first['gzip'] == second['gzip']
+    assert gzip.decompress(first['gzip']) == first['identity']
+    body = json.loads(first['identity'])
+    assert body['topic_id'] == 't1' and body['toc'][0]['id'] == 'hello'
+    assert first['etag'].startswith('W/"')
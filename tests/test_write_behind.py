@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+
+from write_behind import DUPLICATE_KEY, WriteBehindQueue
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_many(self, docs, ordered=True):
+        errors = []
+        for i, doc in enumerate(docs):
+            doc.setdefault('_id', ObjectId())  # as pymongo does
+            if doc['_id'] in self.docs:
+                errors.append({'index': i, 'code': DUPLICATE_KEY, 'errmsg': 'duplicate key'})
+            else:
+                self.docs[doc['_id']] = doc
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': len(docs) - len(errors)})
+
+
+class FakeDB(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+
+def spill_line(collection, doc):
+    return json_util.dumps({'collection': collection, 'doc': doc}) + '\n'
+
+
+def test_spill_then_replay_round_trip(tmp_path):
+    async def run():
+        db = FakeDB()
+        queue = WriteBehindQueue(db, spill_path=tmp_path / 'wb.spill.jsonl')
+        await queue._spill([('quiz_results', {'id': 'r1'}), ('bookmarks', {'id': 'b1'})])
+        # the spill is per process, not the shared path itself
+        assert not (tmp_path / 'wb.spill.jsonl').exists()
+        assert len(list(tmp_path.iterdir())) == 1
+
+        await queue.replay_spill()
+        assert [doc['id'] for doc in db['quiz_results'].docs.values()] == ['r1']
+        assert [doc['id'] for doc in db['bookmarks'].docs.values()] == ['b1']
+        assert list(tmp_path.iterdir()) == []
+
+    asyncio.run(run())
+
+
+def test_replays_leftovers_and_legacy_file(tmp_path):
+    async def run():
+        db = FakeDB()
+        (tmp_path / 'wb.spill.jsonl').write_text(spill_line('quiz_results', {'id': 'legacy'}))
+        (tmp_path / 'wb.spill.4242.jsonl').write_text(spill_line('quiz_results', {'id': 'other-worker'}))
+        (tmp_path / 'wb.spill.99-deadbeef.replay').write_text(spill_line('quiz_results', {'id': 'crashed'}))
+
+        queue = WriteBehindQueue(db, spill_path=tmp_path / 'wb.spill.jsonl')
+        await queue.replay_spill()
+        assert sorted(doc['id'] for doc in db['quiz_results'].docs.values()) == ['crashed', 'legacy', 'other-worker']
+        assert queue.metrics()['replayed'] == 3
+        assert list(tmp_path.iterdir()) == []
+
+    asyncio.run(run())
+
+
+def test_replay_cut_short_does_not_duplicate(tmp_path, monkeypatch):
+    async def run():
+        db = FakeDB()
+        queue = WriteBehindQueue(db, spill_path=tmp_path / 'wb.spill.jsonl')
+        await queue._spill([('quiz_results', {'id': 'r1'})])
+
+        # the worker dies right after inserting, leaving its claimed file behind
+        async def die(entries):
+            await WriteBehindQueue._replay(queue, entries)
+            raise SystemExit
+        monkeypatch.setattr(queue, '_replay', die)
+        with pytest.raises(SystemExit):
+            await queue.replay_spill()
+        assert [path.suffix for path in tmp_path.iterdir()] == ['.replay']
+
+        monkeypatch.undo()
+        await queue.replay_spill()
+        assert len(db['quiz_results'].docs) == 1
+        assert list(tmp_path.iterdir()) == []
+
+    asyncio.run(run())
+
+
+def test_replayed_docs_get_new_ids(tmp_path):
+    async def run():
+        db = FakeDB()
+        spilled_id = ObjectId.from_datetime(datetime(2020, 1, 1, tzinfo=timezone.utc))
+        (tmp_path / 'wb.spill.4242.jsonl').write_text(spill_line('quiz_results', {'_id': spilled_id, 'id': 'r1'}))
+        queue = WriteBehindQueue(db, spill_path=tmp_path / 'wb.spill.jsonl')
+        await queue.replay_spill()
+        [doc] = db['quiz_results'].docs.values()
+        # pollers read by _id from a recent watermark
+        assert doc['_id'] != spilled_id
+        assert doc['_id'].generation_time.year > 2020
+
+    asyncio.run(run())
+
+
+def test_torn_lines_are_quarantined(tmp_path):
+    async def run():
+        db = FakeDB()
+        torn = spill_line('quiz_results', {'id': 'r2'})[:25]
+        (tmp_path / 'wb.spill.4242.jsonl').write_text(spill_line('quiz_results', {'id': 'r1'}) + '7\n' + torn)
+        queue = WriteBehindQueue(db, spill_path=tmp_path / 'wb.spill.jsonl')
+        await queue.replay_spill()
+        assert [doc['id'] for doc in db['quiz_results'].docs.values()] == ['r1']
+        assert queue.metrics()['rejected_lines'] == 2
+        assert (tmp_path / 'wb.spill.rejected').read_text() == '7\n' + torn + '\n'
+        # nothing is left to fail the next start
+        await queue.replay_spill()
+        assert [path.name for path in tmp_path.iterdir()] == ['wb.spill.rejected']
+
+    asyncio.run(run())
+
+
+def test_file_claimed_by_another_worker_is_skipped(tmp_path, monkeypatch):
+    async def run():
+        db = FakeDB()
+        queue = WriteBehindQueue(db, spill_path=tmp_path / 'wb.spill.jsonl')
+        gone = tmp_path / 'wb.spill.7.jsonl'
+        monkeypatch.setattr(queue, '_spill_files', lambda: [gone])
+        await queue.replay_spill()
+        assert queue.metrics()['replayed'] == 0
+
+    asyncio.run(run())